@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Post, Group, Comment
+from .models import Post, Group, Comment, Task
+from .search import get_backend as search_backend
+
+SEARCH_RESULTS_LIMIT = 1000
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +12,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Искать по полнотекстовому индексу вместо LIKE по тексту."""
+        if not search_term:
+            return queryset, False
+        ids = search_backend().search_ids(search_term, SEARCH_RESULTS_LIMIT)
+        return queryset.filter(pk__in=ids), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
@@ -19,6 +29,13 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('text', 'post', 'author', 'created')
 
 
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'name', 'status', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'queue', 'name')
+    readonly_fields = ('last_error',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,166 @@
+"""JSON API только для чтения: ленты записей и отдельная запись.
+
+Ленты листаются курсором (?after=) так же, как HTML-страницы, и
+сериализуются потоком: строки читаются через iterator() и сразу
+пишутся в StreamingHttpResponse, поэтому даже большой ?limit= не
+собирает выдачу в памяти. Параметр ?fields= оставляет в ответе только
+нужные поля, а в SQL-запрос попадают только нужные им столбцы.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .feeds import feed_sources
+from .models import Group, Post, User
+from .pagination import POSTS_PER_PAGE, CursorPaginator, encode_cursor
+
+# Поле ответа: столбцы для only(), связь для select_related и значение.
+POST_FIELDS = {
+    'id': ((), None, lambda post: post.pk),
+    'text': (('text',), None, lambda post: post.text),
+    'pub_date': ((), None, lambda post: post.pub_date),
+    'author': (
+        ('author__username',), 'author', lambda post: post.author.username
+    ),
+    'group': (
+        ('group__slug',), 'group',
+        lambda post: post.group.slug if post.group_id else None
+    ),
+    'image': (
+        ('image',), None, lambda post: post.image.url if post.image else None
+    ),
+    'comment_count': (
+        ('comment_count',), None, lambda post: post.comment_count
+    ),
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def selected_fields(request):
+    names = request.GET.get('fields')
+    if not names:
+        return list(POST_FIELDS)
+    fields = [name.strip() for name in names.split(',') if name.strip()]
+    unknown = set(fields) - set(POST_FIELDS)
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(sorted(unknown))}.')
+    return fields
+
+
+def project(queryset, fields):
+    """Оставить в запросе только столбцы выбранных полей."""
+    columns = {'pub_date'}
+    relations = set()
+    for name in fields:
+        field_columns, relation, _ = POST_FIELDS[name]
+        columns.update(field_columns)
+        if relation:
+            relations.add(relation)
+    if relations:
+        queryset = queryset.select_related(*relations)
+    return queryset.only(*columns)
+
+
+def serialize(post, fields):
+    return {name: POST_FIELDS[name][2](post) for name in fields}
+
+
+def page_limit(request):
+    try:
+        limit = int(request.GET.get('limit', POSTS_PER_PAGE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом.')
+    if not 1 <= limit <= settings.API_MAX_LIMIT:
+        raise BadRequest(
+            f'limit должен быть от 1 до {settings.API_MAX_LIMIT}.'
+        )
+    return limit
+
+
+def stream_feed(request, sources):
+    """Потоковый ответ {"results": [...], "next": курсор или null}."""
+    try:
+        fields = selected_fields(request)
+        limit = page_limit(request)
+    except BadRequest as exc:
+        return error(str(exc))
+    paginator = CursorPaginator([
+        project(source, fields) for source in sources
+    ])
+    rows = paginator.iterate(
+        after=request.GET.get('after'), limit=limit + 1,
+        chunk_size=min(limit + 1, settings.API_CHUNK_SIZE)
+    )
+
+    def chunks():
+        yield '{"results": ['
+        last = None
+        for number, post in enumerate(rows):
+            if number == limit:
+                cursor = encode_cursor(last.pub_date, last.pk)
+                yield f'], "next": {json.dumps(cursor)}}}'
+                return
+            if last is not None:
+                yield ', '
+            yield json.dumps(
+                serialize(post, fields), cls=DjangoJSONEncoder,
+                ensure_ascii=False
+            )
+            last = post
+        yield '], "next": null}'
+
+    return StreamingHttpResponse(chunks(), content_type='application/json')
+
+
+@require_GET
+def index(request):
+    return stream_feed(request, [Post.objects.all()])
+
+
+@require_GET
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).values_list('pk', flat=True)
+    if not group:
+        return error('Группа не найдена.', status=404)
+    return stream_feed(request, [Post.objects.filter(group=group[0])])
+
+
+@require_GET
+def profile(request, username):
+    author = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    )
+    if not author:
+        return error('Пользователь не найден.', status=404)
+    return stream_feed(request, [Post.objects.filter(author=author[0])])
+
+
+@require_GET
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return error('Нужно войти на сайт.', status=401)
+    return stream_feed(request, feed_sources(request.user))
+
+
+@require_GET
+def post_detail(request, post_id):
+    try:
+        fields = selected_fields(request)
+    except BadRequest as exc:
+        return error(str(exc))
+    post = project(Post.objects.all(), fields).filter(pk=post_id).first()
+    if post is None:
+        return error('Запись не найдена.', status=404)
+    return JsonResponse(
+        serialize(post, fields), json_dumps_params={'ensure_ascii': False}
+    )
@@ -0,0 +1,395 @@
+"""Замеры времени ответа страниц через тестовый клиент Django.
+
+Запросы проходят весь стек middleware, поэтому число SQL-запросов берется
+из заголовка X-DB-Queries (posts.middleware), который на время прогона
+включается независимо от QUERY_STATS_HEADERS, а ограничение частоты
+записи (posts.throttling) на это время выключается: иначе сценарии записи
+замеряли бы ответы 429. Результаты прогона
+сохраняются в JSON в BENCHMARK_RESULTS_DIR вместе с хешем коммита, чтобы
+их можно было сравнить с прогоном на другой версии кода.
+"""
+import json
+import os
+import random
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection, transaction
+from django.db.models import Count
+from django.template.backends.django import DjangoTemplates
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import write_buffer
+from .cards import card_posts
+from .models import AuthorStats, Comment, Group, Post, User
+
+SCENARIOS = (
+    'index', 'group_posts', 'profile', 'post_view', 'follow_index',
+    'add_comment',
+)
+PERCENTILES = (50, 95, 99)
+PROJECTION_ROWS = 100
+CARDS_PER_PAGE = 10
+WRITE_MARKER = 'benchmark write'
+# Адрес клиента не входит в INTERNAL_IPS, иначе при DEBUG = True в каждый
+# ответ встраивается панель django-debug-toolbar и замер теряет смысл.
+REMOTE_ADDR = '192.0.2.1'
+
+
+def percentile(values, pct):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * pct // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(timings, queries, errors, elapsed):
+    timings = sorted(timings)
+    summary = {
+        'requests': len(timings),
+        'errors': errors,
+        'rps': round(len(timings) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(timings) / len(timings), 2) if timings else None,
+    }
+    for pct in PERCENTILES:
+        value = percentile(timings, pct)
+        summary[f'p{pct}_ms'] = None if value is None else round(value, 2)
+    summary['queries'] = (
+        round(sum(queries) / len(queries), 1) if queries else None
+    )
+    return summary
+
+
+class Targets:
+    """Страницы для запросов: профили самых активных авторов, случайные
+    группы и записи, лента пользователя с наибольшим числом подписок."""
+
+    def __init__(self, rng, sample=200):
+        self.rng = rng
+        self.authors = list(AuthorStats.objects.filter(
+            post_count__gt=0
+        ).order_by('-post_count').values_list(
+            'author__username', flat=True
+        )[:sample])
+        self.groups = list(Group.objects.order_by('?').values_list(
+            'slug', flat=True
+        )[:sample])
+        self.posts = list(Post.objects.order_by('?').values_list(
+            'author__username', 'pk'
+        )[:sample])
+        reader = AuthorStats.objects.select_related('author').order_by(
+            '-following_count'
+        ).first()
+        self.reader = reader.author if reader else None
+
+    def url(self, scenario):
+        if scenario == 'index' or scenario == 'follow_index':
+            return reverse(scenario)
+        if scenario == 'group_posts':
+            return reverse('group', args=[self.rng.choice(self.groups)])
+        if scenario == 'profile':
+            return reverse('profile', args=[self.rng.choice(self.authors)])
+        name = 'post' if scenario == 'post_view' else scenario
+        return reverse(name, args=self.rng.choice(self.posts))
+
+    def missing(self, scenario):
+        """Почему сценарий нельзя выполнить на текущих данных."""
+        if scenario in ('follow_index', 'add_comment') and not self.reader:
+            return 'нет пользователей'
+        if scenario == 'group_posts' and not self.groups:
+            return 'нет групп'
+        if scenario in ('profile', 'post_view', 'add_comment') and not (
+                self.posts):
+            return 'нет записей'
+        return None
+
+
+def request(client, targets, scenario):
+    url = targets.url(scenario)
+    if scenario == 'add_comment':
+        return client.post(url, {'text': 'benchmark'})
+    return client.get(url)
+
+
+def run_scenario(targets, scenario, count, concurrency=1, warmup=0):
+    """Выполнить count запросов сценария в concurrency потоков."""
+    anonymous = scenario in ('index', 'group_posts', 'profile', 'post_view')
+
+    def worker(requests):
+        client = Client(REMOTE_ADDR=REMOTE_ADDR)
+        if not anonymous:
+            client.force_login(targets.reader)
+        timings, queries, errors = [], [], 0
+        for number in range(warmup + requests):
+            started = time.perf_counter()
+            response = request(client, targets, scenario)
+            duration = (time.perf_counter() - started) * 1000
+            if number < warmup:
+                continue
+            timings.append(duration)
+            if 'X-DB-Queries' in response:
+                queries.append(int(response['X-DB-Queries']))
+            if response.status_code >= 400:
+                errors += 1
+        if concurrency > 1:
+            connection.close()
+        return timings, queries, errors
+
+    shares = [
+        count // concurrency + (number < count % concurrency)
+        for number in range(concurrency)
+    ]
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(worker, shares))
+    else:
+        results = [worker(count)]
+    elapsed = time.perf_counter() - started
+    return summarize(
+        [timing for result in results for timing in result[0]],
+        [number for result in results for number in result[1]],
+        sum(result[2] for result in results),
+        elapsed,
+    )
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios=SCENARIOS, count=100, concurrency=1, warmup=5,
+        random_seed=None, log=None):
+    """Прогнать сценарии и вернуть результаты со сведениями о прогоне."""
+    log = log or (lambda scenario, summary: None)
+    targets = Targets(random.Random(random_seed))
+    results = {
+        'commit': current_commit(),
+        'started': timezone.now().isoformat(),
+        'database': settings.DATABASES['default']['ENGINE'],
+        'cache': settings.CACHES['default']['BACKEND'],
+        'debug': settings.DEBUG,
+        'count': count,
+        'concurrency': concurrency,
+        'scenarios': {},
+    }
+    with override_settings(QUERY_STATS_HEADERS=True, THROTTLE_ENABLED=False):
+        for scenario in scenarios:
+            reason = targets.missing(scenario)
+            summary = {'skipped': reason} if reason else run_scenario(
+                targets, scenario, count, concurrency, warmup
+            )
+            results['scenarios'][scenario] = summary
+            log(scenario, summary)
+    return results
+
+
+def save(results, directory=None):
+    directory = directory or settings.BENCHMARK_RESULTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    commit = (results['commit'] or 'unknown')[:8]
+    path = os.path.join(directory, f'{stamp}-{commit}.json')
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+    return path
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)
+
+
+def compare(baseline, results):
+    """Изменение ключевых метрик в процентах относительно baseline."""
+    changes = {}
+    for scenario, summary in results['scenarios'].items():
+        before = baseline['scenarios'].get(scenario, {})
+        changes[scenario] = {
+            metric: round((summary[metric] - before[metric])
+                          / before[metric] * 100, 1)
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries')
+            if summary.get(metric) is not None and before.get(metric)
+        }
+    return changes
+
+
+def fetched_size(queryset):
+    """Сколько байт значений вернула база на запрос queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return sum(
+        len(value if isinstance(value, bytes) else str(value).encode())
+        for row in rows for value in row if value is not None
+    )
+
+
+def peak_memory(queryset):
+    """Пик памяти (байт) при чтении queryset в объекты."""
+    tracemalloc.start()
+    try:
+        list(queryset)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def projection_savings(rows=PROJECTION_ROWS):
+    """Объем данных и память лент с полными строками и с posts.cards.
+
+    Для главной страницы, самой большой группы и самого активного автора
+    читается rows записей: полным запросом с select_related, как раньше
+    делали представления, и выборкой card_posts.
+    """
+    author = AuthorStats.objects.order_by('-post_count').values_list(
+        'pk', flat=True
+    ).first()
+    group = Group.objects.annotate(total=Count('posts')).order_by(
+        '-total'
+    ).values_list('pk', flat=True).first()
+    feeds = {
+        'index': Post.objects.all(),
+        'group_posts': Post.objects.filter(group_id=group),
+        'profile': Post.objects.filter(author_id=author),
+    }
+    results = {}
+    for name, posts in feeds.items():
+        variants = {
+            'full': posts.select_related('author', 'group'),
+            'cards': card_posts(posts),
+        }
+        measured = {}
+        for variant, queryset in variants.items():
+            queryset = queryset.order_by('-pub_date', '-pk')[:rows]
+            measured[variant] = {
+                'bytes': fetched_size(queryset),
+                'memory': peak_memory(queryset),
+            }
+        for metric in ('bytes', 'memory'):
+            full = measured['full'][metric]
+            measured[f'{metric}_saved_pct'] = round(
+                (full - measured['cards'][metric]) / full * 100, 1
+            ) if full else None
+        results[name] = measured
+    return results
+
+
+def template_engine(profile):
+    """Отдельный движок шаблонов с настройками профиля TEMPLATE_PROFILES."""
+    params = dict(settings.TEMPLATE_PROFILES[profile])
+    params.pop('BACKEND')
+    params.setdefault('APP_DIRS', False)
+    return DjangoTemplates({'NAME': f'benchmark-{profile}', **params})
+
+
+def render_times(count=100, cards=CARDS_PER_PAGE):
+    """Время отрисовки главной страницы с cards карточками по профилям
+    шаблонов.
+
+    Каждый профиль получает свой движок, поэтому замер не зависит от
+    YATUBE_TEMPLATES. Страница отрисовывается с карточками из кэша
+    фрагментов (warm), как при обычной работе, и без них (cold), как после
+    изменения записей; запросов к базе при отрисовке нет.
+    """
+    posts = list(card_posts(Post.objects.order_by('-pub_date', '-pk'))[
+        :cards
+    ])
+    fragment_keys = [
+        make_template_fragment_key('post_card', [
+            post.pk, post.version, post.comment_count, False
+        ]) for post in posts
+    ]
+    request = RequestFactory().get('/', REMOTE_ADDR=REMOTE_ADDR)
+    request.user = AnonymousUser()
+    context = {'page': posts}
+    results = {}
+    for profile in settings.TEMPLATE_PROFILES:
+        engine = template_engine(profile)
+        engine.get_template('index.html').render(context, request)
+        timings = {'warm': [], 'cold': []}
+        for _ in range(count):
+            for state, series in timings.items():
+                if state == 'cold':
+                    cache.delete_many(fragment_keys)
+                started = time.perf_counter()
+                engine.get_template('index.html').render(context, request)
+                series.append((time.perf_counter() - started) * 1000)
+        results[profile] = {'cards': len(posts)}
+        for state, series in timings.items():
+            series.sort()
+            results[profile][state] = {
+                'mean_ms': round(sum(series) / len(series), 3),
+                'p50_ms': round(percentile(series, 50), 3),
+                'p95_ms': round(percentile(series, 95), 3),
+            }
+    return results
+
+
+def write_throughput(count=500, batch_size=None):
+    """Комментариев в секунду при записи по одному и через буфер.
+
+    По одному - как add_comment без буфера: поиск записи и отдельная
+    транзакция на комментарий. Через буфер - count действий пачками по
+    batch_size (по умолчанию WRITE_BUFFER_MAX_ITEMS), время включает
+    постановку в очередь и запись. Созданные комментарии затем удаляются.
+    """
+    batch_size = batch_size or settings.WRITE_BUFFER_MAX_ITEMS
+    post = Post.objects.select_related('author').order_by('-pk').first()
+    user = User.objects.order_by('pk').first()
+    if post is None or user is None:
+        return None
+    username = post.author.username
+
+    def direct():
+        for _ in range(count):
+            target = Post.objects.get(pk=post.pk, author__username=username)
+            with transaction.atomic():
+                Comment.objects.create(
+                    post=target, author=user, text=WRITE_MARKER
+                )
+
+    def buffered():
+        for number in range(count):
+            write_buffer.buffer.submit(
+                write_buffer.COMMENT, post.pk, user.pk, WRITE_MARKER
+            )
+            if (number + 1) % batch_size == 0:
+                write_buffer.flush()
+        write_buffer.flush()
+
+    results = {
+        'database': settings.DATABASES['default']['ENGINE'],
+        'count': count,
+        'batch_size': batch_size,
+    }
+    for name, write in (('direct', direct), ('buffered', buffered)):
+        started = time.perf_counter()
+        write()
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            'seconds': round(elapsed, 3),
+            'per_second': round(count / elapsed, 1) if elapsed else None,
+        }
+        Comment.objects.filter(post=post, text=WRITE_MARKER).delete()
+    results['speedup'] = round(
+        results['buffered']['per_second'] / results['direct']['per_second'],
+        1
+    ) if results['direct']['per_second'] else None
+    return results
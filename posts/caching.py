@@ -0,0 +1,148 @@
+"""Кэширование фрагментов с защитой от «эффекта толпы» и счетчиками.
+
+Значение хранится вместе с мягким сроком годности. Пока он не истек,
+значение отдается как есть. После истечения один процесс, захвативший
+блокировку через cache.add, пересчитывает значение, а остальные продолжают
+отдавать устаревшее. При полном промахе процессы, не получившие
+блокировку, ждут результат до CACHE_LOCK_TIMEOUT секунд.
+
+Атомарность блокировки зависит от бэкенда: у memcached и LocMemCache
+add атомарен, у FileBasedCache возможно редкое двойное вычисление.
+
+Список представлений со счетчиками хранится без чтения-изменения-записи:
+представление заносится один раз тем процессом, чей cache.add ключа
+METRICS_VIEW_KEY удался, в ячейку с номером из cache.incr.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+OUTCOMES = (HIT, STALE, MISS)
+
+METRICS_KEY = 'metrics:fragment_cache:{view}:{outcome}'
+METRICS_VIEW_KEY = 'metrics:fragment_cache:view:{view}'
+METRICS_VIEWS_KEY = 'metrics:fragment_cache:views'
+METRICS_VIEW_SLOT_KEY = 'metrics:fragment_cache:views:{number}'
+
+_pending = threading.local()
+
+
+def get_or_compute(key, compute, timeout, view=None):
+    """Вернуть значение из кэша или вычислить его не более одного раза."""
+    now = time.time()
+    cached = cache.get(key)
+    if cached is not None:
+        expires_at, value = cached
+        if expires_at > now:
+            record(view, HIT)
+            return value
+        if not _acquire(key):
+            record(view, STALE)
+            return value
+        return _store(key, compute, timeout, view)
+    if _acquire(key):
+        return _store(key, compute, timeout, view)
+    deadline = now + settings.CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+        cached = cache.get(key)
+        if cached is not None:
+            record(view, HIT)
+            return cached[1]
+    return _store(key, compute, timeout, view, locked=False)
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _acquire(key):
+    return cache.add(_lock_key(key), 1, settings.CACHE_LOCK_TIMEOUT)
+
+
+def _store(key, compute, timeout, view, locked=True):
+    record(view, MISS)
+    try:
+        value = compute()
+        cache.set(
+            key, (time.time() + timeout, value),
+            timeout + settings.CACHE_STALE_GRACE
+        )
+    finally:
+        if locked:
+            cache.delete(_lock_key(key))
+    return value
+
+
+def record(view, outcome):
+    """Учесть обращение к кэшу в счетчиках текущего потока."""
+    if view is None:
+        return
+    if not hasattr(_pending, 'counter'):
+        _pending.counter = Counter()
+    _pending.counter[view, outcome] += 1
+
+
+def _incr(key, amount=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, None)
+        return amount
+
+
+def _register_view(view):
+    if cache.add(METRICS_VIEW_KEY.format(view=view), 1, None):
+        number = _incr(METRICS_VIEWS_KEY)
+        cache.set(METRICS_VIEW_SLOT_KEY.format(number=number), view, None)
+
+
+def flush_metrics(**kwargs):
+    """Сложить накопленные за запрос счетчики в общий кэш."""
+    counter = getattr(_pending, 'counter', None)
+    if not counter:
+        return
+    _pending.counter = Counter()
+    for (view, outcome), amount in counter.items():
+        _incr(METRICS_KEY.format(view=view, outcome=outcome), amount)
+    for view in {view for view, _ in counter}:
+        _register_view(view)
+
+
+def metrics_views():
+    count = cache.get(METRICS_VIEWS_KEY, 0)
+    slots = cache.get_many([
+        METRICS_VIEW_SLOT_KEY.format(number=number)
+        for number in range(1, count + 1)
+    ])
+    return sorted(set(slots.values()))
+
+
+def read_metrics():
+    """Счетчики попаданий по представлениям: {view: {outcome: n}}."""
+    return {
+        view: {
+            outcome: cache.get(
+                METRICS_KEY.format(view=view, outcome=outcome), 0
+            ) for outcome in OUTCOMES
+        } for view in metrics_views()
+    }
+
+
+def reset_metrics():
+    views = metrics_views()
+    cache.delete_many([
+        METRICS_KEY.format(view=view, outcome=outcome)
+        for view in views for outcome in OUTCOMES
+    ] + [METRICS_VIEW_KEY.format(view=view) for view in views] + [
+        METRICS_VIEW_SLOT_KEY.format(number=number)
+        for number in range(1, cache.get(METRICS_VIEWS_KEY, 0) + 1)
+    ])
+    cache.delete(METRICS_VIEWS_KEY)
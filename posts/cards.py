@@ -0,0 +1,25 @@
+"""Выборки записей для карточек в лентах.
+
+Карточке нужны несколько полей записи, имя автора и название группы,
+поэтому ленты не читают остальные столбцы (хеш пароля и другие поля
+пользователя, описание группы). Вместо текста записи из базы читается
+его начало длиной POST_PREVIEW_LENGTH + 1 символ: по лишнему символу
+видно, что текст сокращен. Полный текст показывается только на странице
+записи.
+"""
+from django.conf import settings
+from django.db.models.functions import Substr
+
+CARD_FIELDS = (
+    'pub_date', 'image', 'comment_count', 'version', 'author__username',
+    'group__slug', 'group__title',
+)
+
+
+def card_posts(queryset):
+    """Оставить в выборке записей только то, что выводит карточка."""
+    return queryset.select_related('author', 'group').only(
+        *CARD_FIELDS
+    ).annotate(
+        text_preview=Substr('text', 1, settings.POST_PREVIEW_LENGTH + 1)
+    )
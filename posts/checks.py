@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core import checks
+
+# Бэкенды кэша, у которых incr атомарен (posts.throttling).
+ATOMIC_INCR_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.memcached.MemcachedCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if not settings.THROTTLE_ENABLED or backend in ATOMIC_INCR_BACKENDS:
+        return []
+    return [checks.Error(
+        f'Ограничение частоты записи требует атомарного cache.incr, а у '
+        f'{backend} его нет.',
+        hint='Используйте memcached (YATUBE_CACHE=memcached) или выключите '
+             'ограничение (YATUBE_THROTTLE=0).',
+        id='posts.E001',
+    )]
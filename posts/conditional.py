@@ -0,0 +1,143 @@
+"""Условные GET-запросы для страниц записи, профиля и группы.
+
+Валидатор страницы - короткий кортеж из того, что меняет ее разметку:
+версий и числа комментариев записей на странице, счетчиков автора,
+подписки текущего пользователя. Он читается узкими запросами без
+соединений с большими таблицами, и при совпадении ETag представление не
+выполняется вовсе. В ETag входит id пользователя, поэтому ответ для
+одного пользователя не подойдет другому.
+
+Last-Modified - время, когда страница впервые отдала текущий ETag; оно
+хранится в кэше CONDITIONAL_GET_TIMEOUT секунд. Если запись вытеснена,
+страница считается измененной, то есть устаревшей она не окажется.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .following import is_following
+from .models import Comment, Group, Post, User
+from .pagination import paginate
+
+AUTHOR_FIELDS = (
+    'first_name', 'last_name', 'stats__post_count', 'stats__follower_count',
+    'stats__following_count',
+)
+
+
+def make_etag(request, state):
+    # Версия кэша увеличивается при выкладке новых шаблонов, и вместе с
+    # ней меняются все ETag.
+    version = settings.CACHES['default'].get('VERSION', 1)
+    raw = f'{version}|{request.user.pk}|{state!r}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def modified_at(request, etag):
+    """Время, с которого страница отдает пользователю этот ETag.
+
+    HTTP передает время с точностью до секунды, поэтому новое состояние
+    страницы получает время хотя бы на секунду позже предыдущего.
+    """
+    page = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'page-modified:{request.user.pk}:{page}'
+    seen = cache.get(key)
+    if seen and seen[0] == etag:
+        return seen[1]
+    now = timezone.now().replace(microsecond=0)
+    if seen and seen[1] >= now:
+        now = seen[1] + timedelta(seconds=1)
+    cache.set(key, (etag, now), settings.CONDITIONAL_GET_TIMEOUT)
+    return now
+
+
+def page_state(request, posts):
+    """Что видно из страницы ленты: записи, их версии и переходы."""
+    paginator, page = paginate(
+        request, posts.only('pk', 'pub_date', 'version', 'comment_count')
+    )
+    pages = None if getattr(page, 'is_cursor', False) else paginator.num_pages
+    return (
+        [(post.pk, post.version, post.comment_count) for post in page],
+        page.has_next(), page.has_previous(), pages,
+    )
+
+
+def post_state(request, username, post_id):
+    last_comment = Comment.objects.filter(post=OuterRef('pk')).order_by(
+        '-created'
+    ).values('created')[:1]
+    post = Post.objects.filter(
+        pk=post_id, author__username=username
+    ).annotate(last_comment=Subquery(last_comment)).values_list(
+        'version', 'comment_count', 'last_comment', 'author_id',
+        *(f'author__{field}' for field in AUTHOR_FIELDS)
+    ).first()
+    if post is None:
+        return None
+    return post, is_following(request, post[3])
+
+
+def profile_state(request, username):
+    author = User.objects.filter(username=username).values_list(
+        'pk', *AUTHOR_FIELDS
+    ).first()
+    if author is None:
+        return None
+    return (
+        author, is_following(request, author[0]),
+        page_state(request, Post.objects.filter(author=author[0])),
+    )
+
+
+def group_state(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'pk', 'title', 'description', 'stats__post_count'
+    ).first()
+    if group is None:
+        return None
+    return group, page_state(request, Post.objects.filter(group=group[0]))
+
+
+def conditional_page(state_func):
+    """Отвечать 304 Not Modified, если состояние страницы не изменилось.
+
+    state_func получает аргументы представления и возвращает валидатор
+    или None, если страницы нет (тогда представление вернет 404).
+    """
+    def etag_func(request, *args, **kwargs):
+        if not hasattr(request, 'page_etag'):
+            state = state_func(request, *args, **kwargs)
+            request.page_etag = (
+                None if state is None else make_etag(request, state)
+            )
+        return request.page_etag
+
+    def last_modified_func(request, *args, **kwargs):
+        etag = etag_func(request, *args, **kwargs)
+        return None if etag is None else modified_at(request, etag)
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag_func, last_modified_func=last_modified_func
+        )(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # Браузер хранит страницу, но перед показом сверяет ETag;
+            # страницы пользователя не должны попадать в общие кэши.
+            directives = {'no_cache': True}
+            if request.user.is_authenticated:
+                directives['private'] = True
+            patch_cache_control(response, **directives)
+            return response
+        return wrapper
+    return decorator
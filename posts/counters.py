@@ -0,0 +1,235 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import (
+    AuthorStats, Comment, Follow, Group, GroupAuthorStats, GroupStats, Post,
+    User
+)
+
+AUTHOR_STATS_SOURCES = {
+    'post_count': (Post, 'author'),
+    'follower_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def shift(queryset, field, delta):
+    """Атомарно изменить счетчик на delta, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def shift_comment_count(post_id, delta):
+    return shift(Post.objects.filter(pk=post_id), 'comment_count', delta)
+
+
+def shift_author_stats(author_id, field, delta):
+    return shift(AuthorStats.objects.filter(pk=author_id), field, delta)
+
+
+def latest_post_date(group):
+    """Подзапрос с датой последней записи группы (id или OuterRef)."""
+    return Subquery(Post.objects.filter(group=group).order_by(
+        '-pub_date', '-pk'
+    ).values('pub_date')[:1])
+
+
+def shift_group_stats(group_id, author_id, delta):
+    """Учесть запись автора, появившуюся в группе (delta=1) или
+    ушедшую из нее (delta=-1)."""
+    if group_id is None:
+        return
+    if delta > 0:
+        GroupAuthorStats.objects.bulk_create([
+            GroupAuthorStats(group_id=group_id, author_id=author_id)
+        ], ignore_conflicts=True)
+    shift(GroupAuthorStats.objects.filter(
+        group_id=group_id, author_id=author_id
+    ), 'post_count', delta)
+    stats = GroupStats.objects.filter(pk=group_id)
+    if delta < 0:
+        stats = stats.filter(post_count__gt=0)
+    stats.update(
+        post_count=F('post_count') + delta,
+        last_post_at=latest_post_date(group_id)
+    )
+
+
+def get_group_stats(group):
+    """Вернуть счетчики группы, посчитав их, если строки еще нет."""
+    try:
+        return group.stats
+    except GroupStats.DoesNotExist:
+        stats, _ = GroupStats.objects.update_or_create(group=group, defaults={
+            'post_count': Post.objects.filter(group=group).count(),
+            'last_post_at': Post.objects.filter(group=group).order_by(
+                '-pub_date'
+            ).values_list('pub_date', flat=True).first(),
+        })
+        group.stats = stats
+        return stats
+
+
+def top_authors(group, limit=5):
+    """Самые активные авторы группы: пары (имя, число записей)."""
+    return list(GroupAuthorStats.objects.filter(
+        group=group, post_count__gt=0
+    ).order_by('-post_count', '-author').values_list(
+        'author__username', 'post_count'
+    )[:limit])
+
+
+def count_subquery(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешнюю строку."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    return Coalesce(
+        Subquery(
+            rows.values(field).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def get_author_stats(author):
+    """Вернуть счетчики автора, пересчитав их, если строки еще нет."""
+    try:
+        return author.stats
+    except AuthorStats.DoesNotExist:
+        return recount_author(author)
+
+
+def recount_author(author):
+    stats, _ = AuthorStats.objects.update_or_create(
+        author=author, defaults={
+            field: model.objects.filter(**{fk: author}).count()
+            for field, (model, fk) in AUTHOR_STATS_SOURCES.items()
+        }
+    )
+    author.stats = stats
+    return stats
+
+
+def repair_comment_counts(batch_size=1000, dry_run=False):
+    """Найти записи с неверным comment_count и исправить их пачками.
+
+    Возвращает число исправленных записей.
+    """
+    drifted = Post.objects.annotate(
+        actual=count_subquery(Comment, 'post')
+    ).filter(~Q(comment_count=F('actual'))).only('pk', 'comment_count')
+    return _repair(Post, drifted, {'comment_count': 'actual'},
+                   batch_size, dry_run)
+
+
+def repair_author_stats(batch_size=1000, dry_run=False):
+    """Создать недостающие строки AuthorStats и исправить расхождения.
+
+    Возвращает пару (создано строк, исправлено строк).
+    """
+    missing = User.objects.filter(stats__isnull=True).order_by(
+        'pk'
+    ).values_list('pk', flat=True)
+    if dry_run:
+        created = missing.count()
+    else:
+        created = 0
+        while True:
+            batch = list(missing[:batch_size])
+            if not batch:
+                break
+            AuthorStats.objects.bulk_create(
+                AuthorStats(author_id=author_id) for author_id in batch
+            )
+            created += len(batch)
+    # pk строки AuthorStats совпадает с id автора, поэтому подзапросы
+    # count_subquery можно строить прямо от нее.
+    mismatch = Q()
+    for field in AUTHOR_STATS_SOURCES:
+        mismatch |= ~Q(**{field: F(f'actual_{field}')})
+    drifted = AuthorStats.objects.annotate(**{
+        f'actual_{field}': count_subquery(model, fk)
+        for field, (model, fk) in AUTHOR_STATS_SOURCES.items()
+    }).filter(mismatch)
+    fixed = _repair(
+        AuthorStats, drifted,
+        {field: f'actual_{field}' for field in AUTHOR_STATS_SOURCES},
+        batch_size, dry_run
+    )
+    return created, fixed
+
+
+def repair_group_stats(batch_size=1000, dry_run=False):
+    """Создать недостающие строки GroupStats, исправить расхождения и
+    пересчитать число записей авторов в группах.
+
+    Возвращает пару (создано строк, исправлено строк).
+    """
+    missing = Group.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    created = len(missing) if dry_run else len(GroupStats.objects.bulk_create(
+        GroupStats(group_id=group_id) for group_id in missing
+    ))
+    drifted = GroupStats.objects.annotate(
+        actual_post_count=count_subquery(Post, 'group'),
+        actual_last_post_at=latest_post_date(OuterRef('pk')),
+    ).filter(
+        ~Q(post_count=F('actual_post_count'))
+        | ~Q(last_post_at=F('actual_last_post_at'))
+        | Q(last_post_at__isnull=True, actual_last_post_at__isnull=False)
+        | Q(last_post_at__isnull=False, actual_last_post_at__isnull=True)
+    )
+    fixed = _repair(GroupStats, drifted, {
+        'post_count': 'actual_post_count',
+        'last_post_at': 'actual_last_post_at',
+    }, batch_size, dry_run)
+    if not dry_run:
+        rebuild_group_author_stats(batch_size)
+    return created, fixed
+
+
+def rebuild_group_author_stats(batch_size=1000):
+    """Собрать GroupAuthorStats заново по группам пачками."""
+    group_ids = list(Group.objects.order_by('pk').values_list(
+        'pk', flat=True
+    ))
+    for number in range(0, len(group_ids), batch_size):
+        batch = group_ids[number:number + batch_size]
+        rows = Post.objects.filter(group_id__in=batch).order_by().values(
+            'group_id', 'author_id'
+        ).annotate(total=Count('pk'))
+        with transaction.atomic():
+            GroupAuthorStats.objects.filter(group_id__in=batch).delete()
+            GroupAuthorStats.objects.bulk_create((
+                GroupAuthorStats(
+                    group_id=row['group_id'], author_id=row['author_id'],
+                    post_count=row['total']
+                ) for row in rows.iterator()
+            ), batch_size=batch_size)
+
+
+def _repair(model, drifted, sources, batch_size, dry_run):
+    """Пройти расхождения по возрастанию pk и записать верные значения.
+
+    Чтение и запись идут короткими пачками, поэтому обход не держит
+    открытый курсор по изменяемой таблице.
+    """
+    fixed = 0
+    last_pk = None
+    while True:
+        rows = drifted.order_by('pk')
+        if last_pk is not None:
+            rows = rows.filter(pk__gt=last_pk)
+        batch = list(rows[:batch_size])
+        if not batch:
+            return fixed
+        last_pk = batch[-1].pk
+        fixed += len(batch)
+        if dry_run:
+            continue
+        for row in batch:
+            for field, source in sources.items():
+                setattr(row, field, getattr(row, source))
+        model.objects.bulk_update(batch, list(sources))
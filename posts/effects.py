@@ -0,0 +1,62 @@
+"""Побочные действия записи комментариев и подписок: счетчики, ленты,
+кэш подписок и страниц.
+
+Их вызывают сигналы моделей для одного объекта и posts.write_buffer для
+пачки, записанной bulk_create, при котором сигналы не срабатывают.
+"""
+from collections import Counter
+
+from . import counters, feeds, following, page_cache, tasks
+
+
+def comments_added(post_ids):
+    """Комментарии к записям post_ids (id повторяется по числу
+    комментариев) появились в базе."""
+    added = Counter(post_ids)
+    for post_id, count in added.items():
+        counters.shift_comment_count(post_id, count)
+    page_cache.purge(*(f'post:{post_id}' for post_id in added))
+
+
+def comments_removed(post_ids):
+    removed = Counter(post_ids)
+    for post_id, count in removed.items():
+        counters.shift_comment_count(post_id, -count)
+    page_cache.purge(*(f'post:{post_id}' for post_id in removed))
+
+
+def shift_follow_counts(pairs, sign):
+    followers = Counter(author_id for _, author_id in pairs)
+    followings = Counter(user_id for user_id, _ in pairs)
+    for author_id, count in followers.items():
+        counters.shift_author_stats(
+            author_id, 'follower_count', sign * count
+        )
+    for user_id, count in followings.items():
+        counters.shift_author_stats(
+            user_id, 'following_count', sign * count
+        )
+        following.invalidate(user_id)
+    page_cache.purge(
+        *(f'author:{user_id}' for user_id in followings),
+        *(f'author:{author_id}' for author_id in followers)
+    )
+
+
+def follows_added(follows):
+    """Подписки follows - тройки (id, user_id, author_id) - появились в
+    базе: их ленты дополняются задачами backfill_feed."""
+    shift_follow_counts(
+        [(user_id, author_id) for _, user_id, author_id in follows], 1
+    )
+    for follow_id, _, _ in follows:
+        tasks.backfill_feed.delay(follow_id)
+
+
+def follows_removed(pairs):
+    """Подписки - пары (user_id, author_id) - удалены."""
+    shift_follow_counts(pairs, -1)
+    for user_id, author_id in pairs:
+        feeds.drop(user_id, author_id)
+    for author_id in {author_id for _, author_id in pairs}:
+        tasks.sync_author_feeds.delay(author_id)
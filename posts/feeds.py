@@ -0,0 +1,212 @@
+"""Материализованная лента подписок.
+
+Новая запись раскладывается в FeedItem каждому подписчику автора
+(fan-out on write). Для авторов, у которых подписчиков больше
+FEED_FANOUT_MAX_FOLLOWERS, раскладка не делается: их записи читаются
+напрямую при показе ленты (fan-out on read) и сливаются с материализованной
+частью в CursorPaginator.
+
+Какой способ действует для автора, хранит флаг AuthorStats.materialized;
+его читают и раскладка, и feed_sources, поэтому запись не может выпасть
+из обоих. Когда число подписчиков пересекает порог, sync_author меняет
+флаг и в той же транзакции удаляет записи автора из лент или раскладывает
+последние записи всем подписчикам.
+
+Лента пользователя обрезается до FEED_MAX_ITEMS при подписке, командой
+rebuild_feeds --trim-only и при раскладке, как только в ней набирается
+больше FEED_MAX_ITEMS + FEED_TRIM_SLACK записей, поэтому чтение первой
+страницы затрагивает ограниченное число строк, сколько бы авторов ни было
+в подписках.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import AuthorStats, FeedItem, Follow, Post
+from .pagination import cursor_key
+
+
+def is_prolific(author_id):
+    """Записи автора читаются при показе ленты, а не раскладываются."""
+    return AuthorStats.objects.filter(
+        pk=author_id, materialized=False
+    ).exists()
+
+
+def followers_in_batches(author_id, batch_size):
+    followers = Follow.objects.filter(author_id=author_id).order_by(
+        'user_id'
+    ).values_list('user_id', flat=True)
+    last_id = 0
+    while True:
+        user_ids = list(followers.filter(user_id__gt=last_id)[:batch_size])
+        if not user_ids:
+            return
+        last_id = user_ids[-1]
+        yield user_ids
+
+
+def sync_author(author_id, batch_size=1000):
+    """Переключить способ доставки записей автора, если число его
+    подписчиков пересекло FEED_FANOUT_MAX_FOLLOWERS.
+
+    Флаг меняется условным UPDATE, поэтому переключение выполнит только
+    один из одновременных вызовов.
+    """
+    stats = AuthorStats.objects.filter(pk=author_id).values_list(
+        'follower_count', 'materialized'
+    ).first()
+    if stats is None:
+        return
+    follower_count, materialized = stats
+    prolific = follower_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+    if prolific != materialized:
+        return
+    with transaction.atomic():
+        switched = AuthorStats.objects.filter(
+            pk=author_id, materialized=materialized
+        ).update(materialized=not prolific)
+        if not switched:
+            return
+        if prolific:
+            FeedItem.objects.filter(author_id=author_id).delete()
+            return
+        posts = list(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', 'pub_date')[:settings.FEED_MAX_ITEMS])
+        for user_ids in followers_in_batches(author_id, batch_size):
+            FeedItem.objects.bulk_create([
+                FeedItem(
+                    user_id=user_id, post_id=post_id, author_id=author_id,
+                    pub_date=pub_date
+                ) for user_id in user_ids for post_id, pub_date in posts
+            ], batch_size=batch_size, ignore_conflicts=True)
+            trim_overflowing(user_ids)
+
+
+def sync_all():
+    """Выставить флаги всех авторов по числу подписчиков, не трогая лент
+    (после массовой загрузки, когда ленты собираются заново)."""
+    threshold = settings.FEED_FANOUT_MAX_FOLLOWERS
+    AuthorStats.objects.filter(
+        follower_count__gt=threshold, materialized=True
+    ).update(materialized=False)
+    AuthorStats.objects.filter(
+        follower_count__lte=threshold, materialized=False
+    ).update(materialized=True)
+
+
+def fan_out_post(post, batch_size=1000):
+    """Разложить запись в ленты подписчиков автора пачками.
+
+    Возвращает число созданных элементов ленты.
+    """
+    if is_prolific(post.author_id):
+        return 0
+    created = 0
+    for user_ids in followers_in_batches(post.author_id, batch_size):
+        FeedItem.objects.bulk_create([
+            FeedItem(
+                user_id=user_id, post_id=post.pk,
+                author_id=post.author_id, pub_date=post.pub_date
+            ) for user_id in user_ids
+        ], ignore_conflicts=True)
+        trim_overflowing(user_ids)
+        created += len(user_ids)
+    return created
+
+
+def backfill(user, author):
+    """Добавить в ленту пользователя последние записи нового автора."""
+    if is_prolific(author.pk):
+        return
+    posts = Post.objects.filter(author=author).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.FEED_MAX_ITEMS]
+    FeedItem.objects.bulk_create([
+        FeedItem(
+            user_id=user.pk, post_id=post_id, author_id=author.pk,
+            pub_date=pub_date
+        ) for post_id, pub_date in posts
+    ], ignore_conflicts=True)
+    trim(user.pk)
+
+
+def drop(user, author):
+    """Убрать из ленты пользователя записи автора после отписки."""
+    FeedItem.objects.filter(user=user, author=author).delete()
+
+
+def trim(user_id, limit=None):
+    """Оставить в ленте пользователя не больше limit последних записей."""
+    limit = settings.FEED_MAX_ITEMS if limit is None else limit
+    items = FeedItem.objects.filter(user_id=user_id)
+    boundary = items.order_by('-pub_date', '-post_id').values_list(
+        'pub_date', 'post_id'
+    )[limit:limit + 1]
+    if not boundary:
+        return 0
+    pub_date, post_id = boundary[0]
+    deleted, _ = items.filter(pub_date__lte=pub_date).exclude(
+        pub_date=pub_date, post_id__gt=post_id
+    ).delete()
+    return deleted
+
+
+def trim_overflowing(user_ids):
+    """Обрезать ленты тех из user_ids, где больше FEED_MAX_ITEMS +
+    FEED_TRIM_SLACK записей.
+
+    Запас нужен, чтобы удаление шло раз в FEED_TRIM_SLACK новых записей, а
+    не на каждую.
+    """
+    overflowing = FeedItem.objects.filter(user_id__in=user_ids).order_by(
+    ).values('user_id').annotate(total=Count('pk')).filter(
+        total__gt=settings.FEED_MAX_ITEMS + settings.FEED_TRIM_SLACK
+    ).values_list('user_id', flat=True)
+    return sum(trim(user_id) for user_id in overflowing)
+
+
+def rebuild(user):
+    """Собрать ленту пользователя заново из его подписок."""
+    FeedItem.objects.filter(user=user).delete()
+    authors = Follow.objects.filter(user=user).select_related('author')
+    for follow in authors:
+        backfill(user, follow.author)
+    return FeedItem.objects.filter(user=user).count()
+
+
+def feed_sources(user):
+    """Querysets, из которых CursorPaginator собирает ленту подписок.
+
+    Записи каждого популярного автора - отдельный источник: его страница
+    читается по индексу (author, pub_date, id) уже в нужном порядке, а
+    author_id IN (...) потребовал бы сортировки всех записей авторов.
+    Но каждый источник - еще один запрос на страницу, поэтому если
+    популярных авторов больше FEED_MAX_DIRECT_SOURCES, их записи читаются
+    одним источником.
+
+    Материализованная часть листается по дате и id записи из FeedItem:
+    так условие курсора и сортировка идут по индексу
+    (user, pub_date, post), а не по всем строкам ленты пользователя.
+    """
+    sources = [cursor_key(
+        Post.objects.filter(feed_items__user=user),
+        'feed_items__pub_date', 'feed_items__post_id'
+    )]
+    prolific = list(Follow.objects.filter(
+        user=user, author__stats__materialized=False
+    ).order_by('author_id').values_list('author_id', flat=True))
+    if len(prolific) > settings.FEED_MAX_DIRECT_SOURCES:
+        sources.append(Post.objects.filter(author_id__in=prolific))
+    else:
+        sources.extend(
+            Post.objects.filter(author_id=author_id)
+            for author_id in prolific
+        )
+    return sources
+
+
+def joined_feed(user):
+    """Лента подписок через соединение с Follow, без материализации."""
+    return Post.objects.filter(author__following__user=user)
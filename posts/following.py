@@ -0,0 +1,51 @@
+"""Множество авторов, на которых подписан пользователь.
+
+Множество читается одним запросом, хранится в кэше FOLLOWING_CACHE_TIMEOUT
+секунд и запоминается на объекте запроса, поэтому проверка подписки на
+любого автора страницы обходится без запросов к базе. При подписке и
+отписке (сигналы Follow) ключ пользователя удаляется из кэша.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+FOLLOWING_KEY = 'following:{user_id}'
+
+
+def load_followed_ids(user_id):
+    key = FOLLOWING_KEY.format(user_id=user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        ))
+        cache.set(key, ids, settings.FOLLOWING_CACHE_TIMEOUT)
+    return ids
+
+
+def followed_ids(request):
+    """id авторов, на которых подписан текущий пользователь."""
+    if not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_followed_ids'):
+        request._followed_ids = load_followed_ids(request.user.pk)
+    return request._followed_ids
+
+
+def is_following(request, author):
+    """Подписан ли текущий пользователь на автора (объект или id)."""
+    author_id = getattr(author, 'pk', author)
+    return author_id in followed_ids(request)
+
+
+def invalidate(user_id):
+    """Сбросить кэш подписок пользователя.
+
+    Ключ удаляется сразу и еще раз после коммита: иначе запрос, прочитавший
+    подписки до коммита, мог бы вернуть в кэш старое множество.
+    """
+    key = FOLLOWING_KEY.format(user_id=user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,92 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.feeds import feed_sources, joined_feed
+from posts.models import AuthorStats
+from posts.pagination import POSTS_PER_PAGE, CursorPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время первой страницы ленты подписок: соединение с '
+        'Follow против материализованной ленты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Сколько пользователей с наибольшим числом подписок взять.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз повторить каждый запрос.'
+        )
+        parser.add_argument(
+            '--pages', type=int, default=1,
+            help='Сколько страниц ленты пройти за один замер.'
+        )
+
+    def measure(self, load_pages, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            load_pages()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def joined_pages(self, user, pages):
+        def load():
+            queryset = joined_feed(user).select_related(
+                'author', 'group'
+            ).order_by('-pub_date', '-pk')
+            for number in range(pages):
+                start = number * POSTS_PER_PAGE
+                list(queryset[start:start + POSTS_PER_PAGE])
+        return load
+
+    def materialized_pages(self, user, pages):
+        def load():
+            paginator = CursorPaginator([
+                source.select_related('author', 'group')
+                for source in feed_sources(user)
+            ])
+            page = paginator.get_page()
+            for _ in range(pages - 1):
+                if not page.has_next():
+                    break
+                page = paginator.get_page(after=page.next_cursor)
+        return load
+
+    def report(self, title, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{title:<16} median {statistics.median(timings):8.2f} ms  '
+            f'p95 {p95:8.2f} ms  max {timings[-1]:8.2f} ms'
+        )
+
+    def handle(self, *args, users, repeat, pages, **options):
+        readers = [
+            stats.author for stats in AuthorStats.objects.select_related(
+                'author'
+            ).filter(following_count__gt=0).order_by(
+                '-following_count'
+            )[:users]
+        ]
+        if not readers:
+            self.stdout.write('Нет пользователей с подписками.')
+            return
+        joined, materialized = [], []
+        for user in readers:
+            joined += self.measure(self.joined_pages(user, pages), repeat)
+            materialized += self.measure(
+                self.materialized_pages(user, pages), repeat
+            )
+        self.stdout.write(
+            f'Пользователей: {len(readers)}, страниц: {pages}, '
+            f'повторов: {repeat}.'
+        )
+        self.report('join Follow', joined)
+        self.report('FeedItem', materialized)
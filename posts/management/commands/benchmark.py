@@ -0,0 +1,151 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержки (p50/p95/p99), пропускную способность и число '
+        'SQL-запросов основных страниц и сохраняет результат в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=benchmarks.SCENARIOS,
+            help='Сценарий для замера (можно повторять, по умолчанию все). '
+                 'add_comment создает комментарии в базе.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Сколько запросов выполнить в каждом сценарии.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Число параллельных клиентов.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Сколько первых запросов клиента не учитывать.'
+        )
+        parser.add_argument(
+            '--seed', type=int, dest='random_seed',
+            help='Начальное значение генератора для выбора страниц.'
+        )
+        parser.add_argument(
+            '--output-dir',
+            help='Каталог для результатов (по умолчанию '
+                 'BENCHMARK_RESULTS_DIR).'
+        )
+        parser.add_argument(
+            '--compare', metavar='FILE',
+            help='Сравнить с результатами из файла предыдущего прогона.'
+        )
+        parser.add_argument(
+            '--projections', action='store_true',
+            help='Вместо замеров задержек сравнить объем данных и память '
+                 'лент с полными строками записей и с выборкой карточек.'
+        )
+        parser.add_argument(
+            '--writes', action='store_true',
+            help='Вместо замеров задержек сравнить скорость записи '
+                 'комментариев по одному и через буфер записи; --requests '
+                 'задает число комментариев. Комментарии затем удаляются.'
+        )
+        parser.add_argument(
+            '--templates', action='store_true',
+            help='Вместо замеров задержек измерить время отрисовки главной '
+                 'страницы с каждым профилем шаблонов (TEMPLATE_PROFILES); '
+                 '--requests задает число отрисовок.'
+        )
+
+    def report(self, scenario, summary):
+        if 'skipped' in summary:
+            self.stdout.write(f'{scenario:<13} пропущен: {summary["skipped"]}')
+            return
+        queries = summary['queries']
+        self.stdout.write(
+            f'{scenario:<13} p50 {summary["p50_ms"]:8.2f} ms  '
+            f'p95 {summary["p95_ms"]:8.2f} ms  '
+            f'p99 {summary["p99_ms"]:8.2f} ms  '
+            f'{summary["rps"]:8.1f} зап./с  '
+            f'SQL {"-" if queries is None else queries}  '
+            f'ошибок {summary["errors"]}'
+        )
+
+    def report_projections(self):
+        for name, measured in benchmarks.projection_savings().items():
+            full, cards = measured['full'], measured['cards']
+            self.stdout.write(
+                f'{name:<13} данные {full["bytes"] / 1024:8.1f} -> '
+                f'{cards["bytes"] / 1024:8.1f} КБ '
+                f'({measured["bytes_saved_pct"]} %)  '
+                f'память {full["memory"] / 1024:8.1f} -> '
+                f'{cards["memory"] / 1024:8.1f} КБ '
+                f'({measured["memory_saved_pct"]} %)'
+            )
+
+    def report_templates(self, count):
+        for profile, summary in benchmarks.render_times(count).items():
+            for state in ('warm', 'cold'):
+                timings = summary[state]
+                self.stdout.write(
+                    f'{profile:<7} {state:<5} карточек {summary["cards"]}  '
+                    f'среднее {timings["mean_ms"]:8.3f} ms  '
+                    f'p50 {timings["p50_ms"]:8.3f} ms  '
+                    f'p95 {timings["p95_ms"]:8.3f} ms'
+                )
+
+    def report_writes(self, count):
+        results = benchmarks.write_throughput(count)
+        if results is None:
+            self.stdout.write('Нет записей или пользователей.')
+            return
+        self.stdout.write(
+            f'{results["database"]}, комментариев {results["count"]}, '
+            f'пачка {results["batch_size"]}'
+        )
+        for name in ('direct', 'buffered'):
+            self.stdout.write(
+                f'{name:<9} {results[name]["seconds"]:8.3f} с  '
+                f'{results[name]["per_second"]:10.1f} комментариев/с'
+            )
+        self.stdout.write(f'Ускорение: {results["speedup"]}x')
+
+    def handle(self, *args, scenarios, requests, concurrency, warmup,
+               random_seed, output_dir, compare, projections, templates,
+               writes, **options):
+        if projections:
+            self.report_projections()
+            return
+        if requests < 1 or concurrency < 1:
+            raise CommandError('--requests и --concurrency должны быть > 0.')
+        if templates:
+            self.report_templates(requests)
+            return
+        if writes:
+            self.report_writes(requests)
+            return
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG = True: замеры хуже, чем в рабочей конфигурации.'
+            )
+        baseline = benchmarks.load(compare) if compare else None
+        results = benchmarks.run(
+            scenarios or benchmarks.SCENARIOS, requests, concurrency, warmup,
+            random_seed, log=self.report
+        )
+        path = benchmarks.save(results, output_dir)
+        self.stdout.write(f'Результаты сохранены в {path}.')
+        if baseline is None:
+            return
+        self.stdout.write(
+            f'Изменение относительно {baseline["commit"] or compare}, %:'
+        )
+        for scenario, changes in benchmarks.compare(
+                baseline, results).items():
+            details = ', '.join(
+                f'{metric} {change:+.1f}' for metric, change in changes.items()
+            )
+            self.stdout.write(f'{scenario:<13} {details or "нет данных"}')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from posts import page_cache
+from posts.caching import OUTCOMES, read_metrics, reset_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает попадания в кэш фрагментов и страниц по представлениям '
+        'и число сбросов кэша страниц.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода.'
+        )
+
+    def handle(self, *args, reset, **options):
+        metrics = read_metrics()
+        if not metrics:
+            self.stdout.write('Обращений к кэшу пока не было.')
+        for view, counts in sorted(metrics.items()):
+            total = sum(counts.values())
+            served = counts['hit'] + counts['stale']
+            ratio = served / total * 100 if total else 0
+            details = ', '.join(
+                f'{outcome} {counts[outcome]}' for outcome in OUTCOMES
+            )
+            self.stdout.write(f'{view}: {details}, попаданий {ratio:.1f}%')
+        self.stdout.write(
+            f'Сброшено тегов кэша страниц: {page_cache.purge_count()}'
+        )
+        if reset:
+            reset_metrics()
+            page_cache.reset_purge_count()
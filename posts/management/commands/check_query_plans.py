@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.plans import check
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для горячих запросов лент и комментариев и '
+        'завершается ошибкой, если запрос читает таблицу целиком или '
+        'сортирует строки без индекса.'
+    )
+
+    def handle(self, *args, **options):
+        report = check()
+        failed = []
+        for name, (plan, problems) in report.items():
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+            if problems:
+                failed.append(f'{name}: {"; ".join(problems)}')
+        if failed:
+            raise CommandError(
+                'Запросы без подходящего индекса:\n' + '\n'.join(failed)
+            )
+        self.stdout.write(f'Проверено запросов: {len(report)}.')
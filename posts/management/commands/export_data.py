@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, записи, комментарии и подписки '
+        'в NDJSON (в gzip, если имя файла оканчивается на .gz).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для выгрузки.')
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            choices=transfer.MODELS,
+            help='Выгрузить только эту модель (можно повторять).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк читать и записывать за один раз.'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить прерванную выгрузку по файлу PATH.state.'
+        )
+
+    def handle(self, *args, path, models, batch_size, resume, **options):
+        models = [
+            label for label in transfer.MODELS if label in (models or [label])
+        ]
+        started = time.perf_counter()
+        try:
+            totals = transfer.export(
+                path, models, batch_size, resume, log=self.stdout.write
+            )
+        except transfer.TransferError as error:
+            raise CommandError(error)
+        summary = ', '.join(f'{label} {rows}' for label, rows in
+                            totals.items())
+        self.stdout.write(
+            f'Выгружено: {summary} за {time.perf_counter() - started:.1f} с.'
+        )
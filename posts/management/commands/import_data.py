@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает файл команды export_data пачками через bulk_create и '
+        'пересчитывает счетчики, ленты и поисковый индекс.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или NDJSON.gz.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять за одну транзакцию.'
+        )
+        parser.add_argument(
+            '--signals', action='store_true',
+            help='Сохранять строки по одной через save(), чтобы сработали '
+                 'сигналы (медленнее, без пересчета в конце).'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Продолжить прерванную загрузку по файлу PATH.state.'
+        )
+        parser.add_argument(
+            '--skip-existing', action='store_true',
+            help='Пропускать строки, чьи pk уже есть в базе, и строки, '
+                 'которые на них ссылаются, вместо остановки загрузки.'
+        )
+        parser.add_argument(
+            '--no-index', action='store_false', dest='index',
+            help='Не перестраивать поисковый индекс.'
+        )
+
+    def handle(self, *args, path, batch_size, signals, resume, index,
+               skip_existing, **options):
+        started = time.perf_counter()
+        try:
+            totals, skipped = transfer.load(
+                path, batch_size, signals, resume, index,
+                log=self.stdout.write, skip_existing=skip_existing
+            )
+        except transfer.TransferError as error:
+            raise CommandError(error)
+        summary = ', '.join(f'{label} {rows}' for label, rows in
+                            totals.items())
+        self.stdout.write(
+            f'Загружено: {summary} за {time.perf_counter() - started:.1f} с.'
+        )
+        if skipped:
+            summary = ', '.join(f'{label} {rows}' for label, rows in
+                                skipped.items())
+            self.stdout.write(f'Пропущено: {summary}.')
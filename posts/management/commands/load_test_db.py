@@ -0,0 +1,140 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.test import override_settings
+
+from posts.models import Comment, Post, User
+
+LOAD_TEST_USERNAME = 'load-test-user'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает базу параллельными чтениями ленты и записью комментариев '
+        'и сравнивает пропускную способность в режимах журнала SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration', type=float, default=5.0,
+            help='Длительность каждого прогона в секундах.'
+        )
+        parser.add_argument(
+            '--journal-mode', action='append', dest='journal_modes',
+            choices=['delete', 'wal'],
+            help='Режимы журнала SQLite для сравнения (по умолчанию оба).'
+        )
+
+    def set_journal_mode(self, mode):
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {mode}')
+            return cursor.fetchone()[0]
+
+    def check_connection(self, stats):
+        """Открыть соединение потока и запомнить его режим журнала.
+
+        Прагмы прогона выполняет в новом соединении posts.signals, пока
+        run_load подменяет SQLITE_PRAGMAS.
+        """
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                stats['journal_mode'] = cursor.fetchone()[0]
+        except OperationalError:
+            stats['journal_mode'] = None
+
+    def reader(self, stats, stop):
+        self.check_connection(stats)
+        posts = Post.objects.select_related('author', 'group').order_by(
+            '-pub_date', '-pk'
+        )
+        while not stop.is_set():
+            try:
+                list(posts[:10])
+                stats['reads'] += 1
+            except OperationalError:
+                stats['read_errors'] += 1
+        connection.close()
+
+    def writer(self, post, user, stats, stop):
+        self.check_connection(stats)
+        while not stop.is_set():
+            try:
+                with transaction.atomic():
+                    Comment.objects.create(post=post, author=user, text='load')
+                stats['writes'] += 1
+            except OperationalError:
+                stats['write_errors'] += 1
+        connection.close()
+
+    def run_load(self, mode, post, user, readers, writers, duration):
+        stop = threading.Event()
+        stats = []
+        threads = []
+        for number in range(readers + writers):
+            thread_stats = dict.fromkeys(
+                ('reads', 'writes', 'read_errors', 'write_errors'), 0
+            )
+            stats.append(thread_stats)
+            if number < readers:
+                target, args = self.reader, (thread_stats, stop)
+            else:
+                target, args = self.writer, (post, user, thread_stats, stop)
+            threads.append(threading.Thread(target=target, args=args))
+        # Каждый поток открывает свое соединение, и posts.signals выполняет
+        # в нем SQLITE_PRAGMAS; journal_mode в них заменяется режимом
+        # прогона.
+        pragmas = {**settings.SQLITE_PRAGMAS, 'journal_mode': mode}
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        result = {
+            key: sum(thread_stats[key] for thread_stats in stats)
+            for key in ('reads', 'writes', 'read_errors', 'write_errors')
+        }
+        result['journal_modes'] = sorted({
+            thread_stats.get('journal_mode') or '?' for thread_stats in stats
+        })
+        return result
+
+    def handle(self, *args, readers, writers, duration, journal_modes,
+               **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда сравнивает режимы журнала SQLite.')
+        journal_modes = journal_modes or ['delete', 'wal']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            original_mode = cursor.fetchone()[0]
+        user, _ = User.objects.get_or_create(username=LOAD_TEST_USERNAME)
+        post = Post.objects.create(text='load test', author=user)
+        try:
+            for mode in journal_modes:
+                self.set_journal_mode(mode)
+                result = self.run_load(
+                    mode, post, user, readers, writers, duration
+                )
+                actual = ','.join(result['journal_modes'])
+                if actual != mode:
+                    self.stderr.write(
+                        f'Режим {mode} установлен не во всех соединениях '
+                        f'потоков: {actual}.'
+                    )
+                self.stdout.write(
+                    f'{actual:<7} чтений/с {result["reads"] / duration:9.1f}  '
+                    f'записей/с {result["writes"] / duration:8.1f}  '
+                    f'ошибок блокировки: чтение {result["read_errors"]}, '
+                    f'запись {result["write_errors"]}'
+                )
+        finally:
+            self.set_journal_mode(original_mode)
+            user.delete()
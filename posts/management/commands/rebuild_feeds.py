@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import feeds
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает материализованные ленты подписок или обрезает их '
+        'до FEED_MAX_ITEMS записей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames', default=[],
+            help='Обработать только этого пользователя (можно повторять).'
+        )
+        parser.add_argument(
+            '--trim-only', action='store_true',
+            help='Не пересобирать ленты, только удалить лишние записи.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько пользователей читать за один запрос.'
+        )
+
+    def iter_users(self, usernames, batch_size):
+        if usernames:
+            users = list(User.objects.filter(username__in=usernames))
+            missing = set(usernames) - {user.username for user in users}
+            if missing:
+                raise CommandError(
+                    f'Пользователи не найдены: {", ".join(sorted(missing))}'
+                )
+            yield from users
+            return
+        last_pk = 0
+        while True:
+            users = list(
+                User.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size]
+            )
+            if not users:
+                return
+            last_pk = users[-1].pk
+            yield from users
+
+    def handle(self, *args, usernames, trim_only, batch_size, **options):
+        processed = items = 0
+        for user in self.iter_users(usernames, batch_size):
+            if trim_only:
+                items += feeds.trim(user.pk)
+            else:
+                items += feeds.rebuild(user)
+            processed += 1
+        action = 'Удалено' if trim_only else 'Собрано'
+        self.stdout.write(
+            f'Пользователей: {processed}. {action} элементов лент: {items}.'
+        )
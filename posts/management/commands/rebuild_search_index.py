@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс записей и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк читать из базы за один запрос.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        posts, comments = rebuild(batch_size)
+        self.stdout.write(
+            f'Проиндексировано записей: {posts}, комментариев: {comments}.'
+        )
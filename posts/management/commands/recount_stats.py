@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import (
+    repair_author_stats, repair_comment_counts, repair_group_stats
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики комментариев к записям, статистику авторов '
+        '(записи, подписчики, подписки) и групп и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк читать и обновлять за один запрос.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать расхождения, ничего не записывая.'
+        )
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        posts_fixed = repair_comment_counts(batch_size, dry_run)
+        stats_created, stats_fixed = repair_author_stats(batch_size, dry_run)
+        groups_created, groups_fixed = repair_group_stats(batch_size, dry_run)
+        prefix = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(
+            f'{prefix}: записей {posts_fixed}, '
+            f'строк статистики {stats_fixed}, '
+            f'недостающих строк статистики {stats_created}, '
+            f'строк статистики групп {groups_fixed}, '
+            f'недостающих строк статистики групп {groups_created}.'
+        )
@@ -0,0 +1,78 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.queue import Worker, release_stale
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди posts.queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Сколько задач выполнять одновременно (потоков).'
+        )
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Очередь для обработки (можно повторять, по умолчанию '
+                 'default).'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда готовые к запуску задачи закончатся.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Пауза между опросами пустой очереди в секундах '
+                 '(по умолчанию TASK_POLL_INTERVAL).'
+        )
+
+    def work(self, queues, burst, poll_interval, stop, totals):
+        worker = Worker(queues)
+        while not stop.is_set():
+            if worker.run_one():
+                totals.append(1)
+                continue
+            if burst:
+                return
+            release_stale()
+            stop.wait(poll_interval)
+
+    def work_in_thread(self, *args):
+        try:
+            self.work(*args)
+        finally:
+            connection.close()
+
+    def handle(self, *args, concurrency, queues, burst, poll_interval,
+               **options):
+        queues = queues or ['default']
+        poll_interval = poll_interval or settings.TASK_POLL_INTERVAL
+        release_stale()
+        stop = threading.Event()
+        totals = []
+        arguments = (queues, burst, poll_interval, stop, totals)
+        if concurrency == 1:
+            threads = []
+        else:
+            threads = [
+                threading.Thread(target=self.work_in_thread, args=arguments)
+                for _ in range(concurrency)
+            ]
+        for thread in threads:
+            thread.start()
+        try:
+            if threads:
+                for thread in threads:
+                    thread.join()
+            else:
+                self.work(*arguments)
+        except KeyboardInterrupt:
+            self.stdout.write('Завершаем текущие задачи...')
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(f'Выполнено задач: {len(totals)}.')
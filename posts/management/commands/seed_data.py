@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, записями, '
+        'комментариями и подписками для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=30000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--images', type=float, default=0.1,
+            help='Доля записей с изображением.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=3.0,
+            help='Крутизна степенного распределения популярности (> 1).'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты записей.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять за один запрос.'
+        )
+        parser.add_argument(
+            '--seed', type=int, dest='random_seed',
+            help='Начальное значение генератора для повторяемых данных.'
+        )
+        parser.add_argument(
+            '--no-index', action='store_false', dest='index',
+            help='Не перестраивать поисковый индекс.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = seed(
+            users=options['users'], posts=options['posts'],
+            comments=options['comments'], follows=options['follows'],
+            groups=options['groups'], images=options['images'],
+            skew=options['skew'], days=options['days'],
+            batch_size=options['batch_size'],
+            random_seed=options['random_seed'], index=options['index'],
+            log=self.stdout.write
+        )
+        summary = ', '.join(f'{name} {count}' for name, count in
+                            created.items())
+        self.stdout.write(
+            f'Создано: {summary} за {time.perf_counter() - started:.1f} с.'
+        )
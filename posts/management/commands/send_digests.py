@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = (
+        'Отправляет подписчикам письма о новых записях авторов, '
+        'накопленных за DIGEST_WINDOW секунд.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int,
+            help='Сколько секунд копить уведомления получателя '
+                 '(по умолчанию DIGEST_WINDOW, 0 - отправить все сразу).'
+        )
+        parser.add_argument(
+            '--rate', type=float,
+            help='Сколько писем в секунду отправлять '
+                 '(по умолчанию DIGEST_RATE_LIMIT, 0 - без ограничения).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько получателей читать из базы за один раз.'
+        )
+
+    def handle(self, *args, window, rate, batch_size, **options):
+        stats = send_digests(
+            window=window, batch_size=batch_size, rate=rate,
+            log=self.stdout.write if options['verbosity'] > 1 else None
+        )
+        self.stdout.write(f'Отправлено: {stats}.')
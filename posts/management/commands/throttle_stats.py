@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.throttling import read_metrics, reset_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько запросов на запись пропущено и отклонено '
+        'ограничением частоты по областям THROTTLE_RATES.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода.'
+        )
+
+    def handle(self, *args, reset, **options):
+        if not settings.THROTTLE_ENABLED:
+            self.stdout.write('Ограничение частоты выключено.')
+        for scope, counts in sorted(read_metrics().items()):
+            total = counts['allowed'] + counts['limited']
+            ratio = counts['limited'] / total * 100 if total else 0
+            self.stdout.write(
+                f'{scope}: пропущено {counts["allowed"]}, '
+                f'отклонено {counts["limited"]} ({ratio:.1f}%)'
+            )
+        if reset:
+            reset_metrics()
@@ -0,0 +1,156 @@
+import json
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import warm
+
+
+def init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает недостающие или устаревшие миниатюры карточек для всех '
+        'записей с изображениями, распределяя работу по процессам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию - число ядер).'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать миниатюры, даже если они актуальны.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько записей читать из базы за один запрос.'
+        )
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(
+                settings.MEDIA_ROOT, 'cache', 'warm_thumbnails.state'
+            ),
+            help='Файл с местом остановки для продолжения; удаляется, когда '
+                 'все записи обработаны без ошибок.'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с первой записи, не читая файл состояния.'
+        )
+
+    def read_state(self, path, restart):
+        """id, после которого продолжать, и id записей с ошибками."""
+        if restart or not os.path.exists(path):
+            return 0, []
+        with open(path) as state:
+            data = json.load(state)
+        return data['last_id'], data['failed']
+
+    def write_state(self, path, last_id, failures):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as state:
+            json.dump({
+                'last_id': last_id,
+                'failed': [post_id for post_id, _ in failures],
+            }, state)
+
+    def clear_state(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def iter_post_ids(self, start, batch_size):
+        posts = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by('pk').values_list('pk', flat=True)
+        last_id = start
+        while True:
+            batch = list(posts.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            last_id = batch[-1]
+            yield from batch
+
+    def closing_connections(self, iterable):
+        # Пул читает задания в своем потоке, и id записей выбираются через
+        # отдельное соединение этого потока.
+        try:
+            yield from iterable
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, processes, force, batch_size, state_file,
+               restart, **options):
+        start, failed = self.read_state(state_file, restart)
+        if start:
+            self.stdout.write(f'Продолжаем после записи id={start}.')
+        if failed:
+            self.stdout.write(
+                'Повторяем записи с ошибками: '
+                f'{", ".join(map(str, failed))}.'
+            )
+        task = partial(warm, force=force)
+        post_ids = self.iter_post_ids(start, batch_size)
+        if processes > 1:
+            # Дочерние процессы не должны пользоваться соединениями
+            # родителя, поэтому закрываем их перед созданием пула.
+            connections.close_all()
+            pool = multiprocessing.Pool(processes, initializer=init_worker)
+            results = pool.imap(
+                task, self.closing_connections(post_ids), chunksize=8
+            )
+        else:
+            pool = None
+            results = map(task, post_ids)
+        counts = {'generated': 0, 'skipped': 0}
+        failures = []
+        # Место остановки не сдвигается дальше первой записи с ошибкой,
+        # чтобы следующий запуск повторил ее.
+        last_id = start
+        done = 0
+        started = time.perf_counter()
+        try:
+            for done, (post_id, status) in enumerate(results, 1):
+                if status in counts:
+                    counts[status] += 1
+                    # imap отдает результаты по порядку, поэтому все записи
+                    # до post_id уже обработаны.
+                    if not failures:
+                        last_id = post_id
+                else:
+                    failures.append((post_id, status))
+                if done % batch_size == 0:
+                    self.write_state(state_file, last_id, failures)
+                    self.report(done, counts, failures, started)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if failures:
+            self.write_state(state_file, last_id, failures)
+        else:
+            self.clear_state(state_file)
+        self.report(done, counts, failures, started)
+        for post_id, error in failures:
+            self.stderr.write(f'Запись id={post_id}: {error}')
+
+    def report(self, done, counts, failures, started):
+        elapsed = time.perf_counter() - started
+        rate = counts['generated'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Обработано {done}: создано {counts["generated"]}, '
+            f'пропущено {counts["skipped"]}, ошибок {len(failures)}; '
+            f'{rate:.1f} изобр./с за {elapsed:.1f} с.'
+        )
@@ -0,0 +1,93 @@
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('yatube.queries')
+
+
+class QueryRecorder:
+    """Обертка execute_wrapper: считает запросы, их время и повторы.
+
+    В отличие от connection.queries не требует DEBUG = True.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql, repr(params)] += 1
+
+    @property
+    def duplicates(self):
+        return sum(
+            repeats - 1 for repeats in self.statements.values() if repeats > 1
+        )
+
+
+class QueryCountMiddleware:
+    """Учитывает SQL-запросы каждого запроса к сайту.
+
+    Результат добавляется в заголовки X-DB-Queries, X-DB-Time (мс) и
+    X-DB-Duplicates, если QUERY_STATS_HEADERS включен, и пишется в журнал
+    yatube.queries, если запросов больше QUERY_LOG_THRESHOLD или есть
+    повторы.
+
+    Потоковый ответ выполняет запросы уже после того, как заголовки
+    отправлены, поэтому заголовков у него нет, а в журнал он попадает,
+    когда поток дочитан или закрыт, со всеми запросами, включая потоковые.
+    """
+    END = object()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                request, recorder, response.streaming_content
+            )
+            return response
+        if settings.QUERY_STATS_HEADERS:
+            response['X-DB-Queries'] = recorder.count
+            response['X-DB-Time'] = f'{recorder.duration * 1000:.1f}'
+            response['X-DB-Duplicates'] = recorder.duplicates
+        self.log(request, recorder)
+        return response
+
+    def record_stream(self, request, recorder, content):
+        # Обертка ставится только на время получения очередной части, а не
+        # на весь генератор: между частями соединение может понадобиться
+        # коду сервера.
+        chunks = iter(content)
+        try:
+            while True:
+                with connection.execute_wrapper(recorder):
+                    chunk = next(chunks, self.END)
+                if chunk is self.END:
+                    return
+                yield chunk
+        finally:
+            self.log(request, recorder)
+
+    def log(self, request, recorder):
+        if recorder.count > settings.QUERY_LOG_THRESHOLD or (
+                recorder.duplicates):
+            logger.warning(
+                '%s %s: %d queries, %.1f ms, %d duplicates',
+                request.method, request.path, recorder.count,
+                recorder.duration * 1000, recorder.duplicates
+            )
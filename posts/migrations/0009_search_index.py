@@ -0,0 +1,49 @@
+from django.db import migrations
+
+from posts.stemmer import stem_text
+
+TOKENIZER = "tokenize = 'unicode61 remove_diacritics 2'"
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE posts_post_fts USING fts5(body, {TOKENIZER})'
+    )
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE posts_comment_fts '
+        f'USING fts5(body, post_id UNINDEXED, {TOKENIZER})'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_post_fts(rowid, body) VALUES (%s, %s)',
+            [(pk, stem_text(text)) for pk, text in
+             Post.objects.values_list('pk', 'text').iterator()]
+        )
+        cursor.executemany(
+            'INSERT INTO posts_comment_fts(rowid, body, post_id) '
+            'VALUES (%s, %s, %s)',
+            [(pk, stem_text(text), post_id) for pk, text, post_id in
+             Comment.objects.values_list('pk', 'text', 'post_id').iterator()]
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_comment_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
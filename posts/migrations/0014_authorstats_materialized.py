@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_prolific_authors(apps, schema_editor):
+    # Как feeds.sync_author: записи популярных авторов читаются при показе
+    # ленты, поэтому их строки FeedItem удаляются.
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    prolific = AuthorStats.objects.filter(
+        follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    )
+    FeedItem.objects.filter(
+        author_id__in=prolific.values('author_id')
+    ).delete()
+    prolific.update(materialized=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_group_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='materialized',
+            field=models.BooleanField(default=True, verbose_name='Записи в лентах подписчиков'),
+        ),
+        migrations.RunPython(mark_prolific_authors, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -33,15 +34,92 @@ class Post(models.Model):
     image = models.ImageField(
         upload_to='posts/', blank=True, null=True, verbose_name='Изображение'
     )
+    comment_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Комментариев'
+    )
+    version = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Версия'
+    )
+
+    COUNTER_FIELDS = ('comment_count', 'version')
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'], name='post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_pub_date_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:20] + '...'
 
+    @property
+    def _preview_source(self):
+        # В лентах (posts.cards) вместо text читается только его начало.
+        preview = getattr(self, 'text_preview', None)
+        return self.text if preview is None else preview
+
+    @property
+    def is_truncated(self):
+        return len(self._preview_source) > settings.POST_PREVIEW_LENGTH
+
+    @property
+    def preview(self):
+        """Текст для карточки в ленте, сокращенный по границе слова."""
+        text = self._preview_source
+        if not self.is_truncated:
+            return text
+        cut = text[:settings.POST_PREVIEW_LENGTH]
+        words = cut.rsplit(None, 1)
+        return (words[0] if len(words) > 1 else cut).rstrip() + '…'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_group()
+        return instance
+
+    def remember_group(self):
+        # Группа, записанная в базе: по ней posts.signals узнает о переносе
+        # записи в другую группу без лишнего запроса.
+        if 'group_id' in self.__dict__:
+            self._saved_group_id = self.group_id
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+            self.remember_group()
+            return
+        # Счетчики меняются только атомарными UPDATE из posts.counters,
+        # поэтому при редактировании записи их нельзя перезаписывать
+        # значениями из устаревшего экземпляра. Версия входит в ключ кэша
+        # карточки записи и тоже увеличивается в самом UPDATE.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            skipped = set(self.COUNTER_FIELDS) | self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+                and field.name not in skipped
+            ]
+        kwargs['update_fields'] = {*update_fields, 'version'}
+        self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+        if {'group', 'group_id'} & kwargs['update_fields']:
+            self.remember_group()
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -59,6 +137,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -76,3 +160,179 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    author = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='stats', verbose_name='Автор'
+    )
+    post_count = models.PositiveIntegerField(
+        default=0, verbose_name='Публикаций'
+    )
+    follower_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок'
+    )
+    # Записи автора раскладываются по лентам подписчиков (posts.feeds);
+    # сбрасывается, когда подписчиков становится больше
+    # FEED_FANOUT_MAX_FOLLOWERS.
+    materialized = models.BooleanField(
+        default=True, verbose_name='Записи в лентах подписчиков'
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return f'Статистика {self.author}'
+
+
+class GroupStats(models.Model):
+    """Счетчики группы, обновляемые при изменении записей."""
+    group = models.OneToOneField(
+        Group, on_delete=models.CASCADE, primary_key=True,
+        related_name='stats', verbose_name='Группа'
+    )
+    post_count = models.PositiveIntegerField(
+        default=0, verbose_name='Публикаций'
+    )
+    last_post_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Последняя публикация'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['last_post_at', 'group'],
+                name='group_stats_activity_idx'
+            ),
+        ]
+        verbose_name = 'Статистика группы'
+        verbose_name_plural = 'Статистика групп'
+
+    def __str__(self):
+        return f'Статистика {self.group}'
+
+
+class GroupAuthorStats(models.Model):
+    """Число записей автора в группе, для самых активных авторов."""
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, related_name='author_stats'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['group', 'author']
+        indexes = [
+            models.Index(
+                fields=['group', 'post_count', 'author'],
+                name='group_author_count_idx'
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """Запись в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed_items'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='feed_items'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди posts.queue."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=200, verbose_name='Задача')
+    args = models.TextField(default='[]', verbose_name='Аргументы (JSON)')
+    queue = models.CharField(
+        max_length=50, default='default', verbose_name='Очередь'
+    )
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING,
+        verbose_name='Состояние'
+    )
+    attempts = models.PositiveIntegerField(
+        default=0, verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveIntegerField(
+        default=3, verbose_name='Наибольшее число попыток'
+    )
+    run_at = models.DateTimeField(verbose_name='Выполнить не раньше')
+    locked_by = models.CharField(
+        max_length=100, blank=True, verbose_name='Воркер'
+    )
+    locked_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Взята в работу'
+    )
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name='Создана'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'queue', 'run_at'],
+                name='task_status_run_at_idx'
+            ),
+        ]
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+
+class Notification(models.Model):
+    """Запись автора, о которой подписчику еще не отправлено письмо."""
+    recipient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='notifications'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='notifications'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['recipient', 'post']
+        indexes = [
+            models.Index(
+                fields=['recipient', 'created'],
+                name='notification_recipient_idx'
+            ),
+        ]
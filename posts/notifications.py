@@ -0,0 +1,176 @@
+"""Письма подписчикам о новых записях авторов.
+
+Публикация ставит в очередь задачу notify_followers, которая обходит
+подписчиков автора пачками по user_id и создает им по строке
+Notification. Письма отправляет команда send_digests: получатель попадает
+в рассылку, когда его самому старому уведомлению исполнилось
+DIGEST_WINDOW секунд, и получает одно письмо обо всех записях, накопленных
+за это время.
+
+Получатели читаются пачками по batch_size, а все письма рассылки
+отправляются через одно соединение с почтовым сервером не быстрее
+DIGEST_RATE_LIMIT писем в секунду. Уведомления получателя удаляются сразу
+после отправки его письма; если отправка прервалась, при следующем запуске
+уйдут только непосланные письма.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Follow, Notification, Post, User
+
+
+def notify_followers(post, batch_size=1000):
+    """Создать уведомления о записи подписчикам автора с адресом почты.
+
+    Возвращает число созданных уведомлений.
+    """
+    followers = Follow.objects.filter(author_id=post.author_id).exclude(
+        user__email=''
+    ).filter(user__is_active=True).order_by('user_id').values_list(
+        'user_id', flat=True
+    )
+    created = 0
+    last_id = 0
+    while True:
+        user_ids = list(followers.filter(user_id__gt=last_id)[:batch_size])
+        if not user_ids:
+            return created
+        last_id = user_ids[-1]
+        Notification.objects.bulk_create([
+            Notification(recipient_id=user_id, post_id=post.pk)
+            for user_id in user_ids
+        ], ignore_conflicts=True)
+        created += len(user_ids)
+
+
+class RateLimiter:
+    """Не дает отправлять больше rate писем в секунду (0 - без предела)."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = None
+
+    def wait(self, count=1):
+        if not self.rate:
+            return
+        now = self.clock()
+        if self.next_at is not None and self.next_at > now:
+            self.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + count / self.rate
+
+
+class DigestStats:
+    """Число писем и записей в рассылке и скорость отправки."""
+
+    def __init__(self):
+        self.recipients = 0
+        self.posts = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.recipients / self.elapsed if self.elapsed else 0
+
+    def __str__(self):
+        return (
+            f'писем {self.recipients}, записей в них {self.posts}, '
+            f'{self.elapsed:.1f} с, {self.rate:.1f} писем/с'
+        )
+
+
+def due_recipients(window, batch_size):
+    """id получателей, чье первое уведомление старше window, пачками."""
+    deadline = timezone.now() - timedelta(seconds=window)
+    due = Notification.objects.values('recipient_id').annotate(
+        first=Min('created')
+    ).filter(first__lte=deadline).order_by('recipient_id').values_list(
+        'recipient_id', flat=True
+    )
+    last_id = 0
+    while True:
+        recipient_ids = list(due.filter(recipient_id__gt=last_id)[:batch_size])
+        if not recipient_ids:
+            return
+        last_id = recipient_ids[-1]
+        yield recipient_ids
+
+
+def build_digests(recipient_ids, domain):
+    """Письма получателям: тройки (id уведомлений, число записей, письмо).
+
+    Письмо - None, если отправлять нечего (записи или получатель удалены).
+    """
+    notifications = {}
+    for notification in Notification.objects.filter(
+            recipient_id__in=recipient_ids).order_by('recipient_id', 'pk'):
+        notifications.setdefault(notification.recipient_id, []).append(
+            notification
+        )
+    post_ids = {
+        notification.post_id
+        for items in notifications.values() for notification in items
+    }
+    posts = Post.objects.filter(pk__in=post_ids).select_related(
+        'author'
+    ).only('text', 'pub_date', 'author__username').in_bulk()
+    recipients = User.objects.filter(pk__in=notifications).only(
+        'username', 'email'
+    ).in_bulk()
+    digests = []
+    for recipient_id, items in notifications.items():
+        ids = [notification.pk for notification in items]
+        digest_posts = sorted(
+            (posts[item.post_id] for item in items if item.post_id in posts),
+            key=lambda post: post.pub_date, reverse=True
+        )
+        if not digest_posts or recipient_id not in recipients:
+            digests.append((ids, 0, None))
+            continue
+        shown = digest_posts[:settings.DIGEST_MAX_POSTS]
+        body = render_to_string('emails/digest.txt', {
+            'user': recipients[recipient_id], 'posts': shown,
+            'more': len(digest_posts) - len(shown), 'domain': domain,
+        })
+        digests.append((ids, len(digest_posts), EmailMessage(
+            subject='Новые записи в ваших подписках', body=body,
+            to=[recipients[recipient_id].email]
+        )))
+    return digests
+
+
+def send_digests(window=None, batch_size=100, rate=None, log=None):
+    """Разослать письма всем получателям, у которых истекло окно.
+
+    Возвращает DigestStats.
+    """
+    window = settings.DIGEST_WINDOW if window is None else window
+    rate = settings.DIGEST_RATE_LIMIT if rate is None else rate
+    log = log or (lambda message: None)
+    limiter = RateLimiter(rate)
+    stats = DigestStats()
+    domain = Site.objects.get_current().domain
+    with get_connection() as connection:
+        for recipient_ids in due_recipients(window, batch_size):
+            for ids, posts, message in build_digests(recipient_ids, domain):
+                if message is not None:
+                    limiter.wait()
+                    connection.send_messages([message])
+                    stats.recipients += 1
+                    stats.posts += posts
+                Notification.objects.filter(pk__in=ids).delete()
+            log(f'Отправлено: {stats}.')
+    return stats
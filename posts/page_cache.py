@@ -0,0 +1,134 @@
+"""Кэш целых страниц для анонимных читателей.
+
+PageCacheMiddleware стоит перед SessionMiddleware: запрос без cookie
+сессии и сообщений к странице из PAGE_CACHE_VIEWS получает готовый ответ
+из кэша, не читая сессию и не обращаясь к базе.
+
+Представление помечает страницу тегами того, что на ней показано
+(tag_page): 'index', 'group:<id>', 'author:<id>', 'post:<id>'. У каждого
+тега в кэше есть версия; вместе со страницей сохраняются версии ее тегов,
+и страница считается устаревшей, если версия хоть одного тега с тех пор
+сменилась. purge() меняет версии тегов, поэтому сбрасываются ровно те
+страницы, где показано изменившееся, и списки ключей хранить не нужно.
+
+Изменение, случившееся между чтением данных и сохранением страницы,
+может не попасть в кэш; такая страница живет не дольше PAGE_CACHE_TIMEOUT.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import caching
+
+PAGE_KEY = 'page:{digest}'
+TAG_KEY = 'page-tag:{tag}'
+PURGES_KEY = 'metrics:page_cache:purges'
+
+
+def page_key(request):
+    raw = request.build_absolute_uri()
+    return PAGE_KEY.format(digest=hashlib.md5(raw.encode()).hexdigest())
+
+
+def tag_key(tag):
+    return TAG_KEY.format(tag=tag)
+
+
+def tag_page(request, *tags, posts=()):
+    """Отметить, от чего зависит страница; posts - записи на ней."""
+    if hasattr(request, 'page_cache_tags'):
+        request.page_cache_tags.update(tags)
+        request.page_cache_tags.update(f'post:{post.pk}' for post in posts)
+
+
+def purge(*tags):
+    """Сбросить страницы с любым из тегов."""
+    tags = set(tags)
+    if not tags:
+        return
+    cache.set_many(
+        {tag_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None
+    )
+    cache.add(PURGES_KEY, 0, None)
+    try:
+        cache.incr(PURGES_KEY, len(tags))
+    except ValueError:
+        cache.set(PURGES_KEY, len(tags), None)
+
+
+def purge_count():
+    return cache.get(PURGES_KEY, 0)
+
+
+def reset_purge_count():
+    cache.delete(PURGES_KEY)
+
+
+def tag_versions(tags):
+    """Текущие версии тегов; отсутствующие заводятся заново."""
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, uuid.uuid4().hex, None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def view_name(self, request):
+        """Имя страницы, если ответ на запрос можно брать из кэша."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        cookies = request.COOKIES
+        if (settings.SESSION_COOKIE_NAME in cookies
+                or 'messages' in cookies):
+            return None
+        # В ответы для INTERNAL_IPS при DEBUG встраивается панель отладки.
+        if (settings.DEBUG and request.META.get('REMOTE_ADDR')
+                in settings.INTERNAL_IPS):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.url_name not in settings.PAGE_CACHE_VIEWS:
+            return None
+        return match.url_name
+
+    def __call__(self, request):
+        name = self.view_name(request)
+        if name is None:
+            return self.get_response(request)
+        view = f'page:{name}'
+        key = page_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            tags, response = entry
+            if tag_versions(tags) == tags:
+                caching.record(view, caching.HIT)
+                return get_conditional_response(
+                    request, etag=response.get('ETag'),
+                    last_modified=parse_http_date_safe(
+                        response.get('Last-Modified')
+                    ), response=response
+                )
+        caching.record(view, caching.MISS)
+        request.page_cache_tags = set()
+        response = self.get_response(request)
+        if (response.status_code == 200 and not response.streaming
+                and not response.cookies and request.page_cache_tags):
+            cache.set(
+                key, (tag_versions(request.page_cache_tags), response),
+                settings.PAGE_CACHE_TIMEOUT
+            )
+        return response
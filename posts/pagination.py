@@ -0,0 +1,248 @@
+import base64
+import binascii
+import functools
+import heapq
+import operator
+
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+CURSOR_FIELD = 'cursor_field'
+CURSOR_PK = 'cursor_pk'
+
+
+def encode_cursor(moment, pk):
+    """Упаковать позицию строки (дата, id) в непрозрачный токен."""
+    raw = f'{moment.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковать токен курсора. Для испорченного токена вернуть None."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        stamp, pk = raw.rsplit('|', 1)
+        moment = parse_datetime(stamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if moment is None:
+        return None
+    return moment, pk
+
+
+def cursor_key(queryset, field, pk):
+    """Листать источник по другим выражениям ключа.
+
+    Значения field и pk должны совпадать с датой и id строки, а выражения
+    могут ссылаться на соединенную таблицу, чей индекс отдает строки в
+    нужном порядке: тогда и условие курсора, и сортировка идут по нему.
+    """
+    return queryset.annotate(**{CURSOR_FIELD: F(field), CURSOR_PK: F(pk)})
+
+
+class CursorPage:
+    """Страница курсорной пагинации.
+
+    Повторяет ту часть интерфейса django.core.paginator.Page, которую
+    используют шаблоны, но не знает ни номера страницы, ни их общего числа.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 after=None, before=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.after = after
+        self.before = before
+
+    def __repr__(self):
+        return f'<CursorPage after={self.after} before={self.before}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor(getattr(last, self.paginator.field), last.pk)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        first = self.object_list[0]
+        return encode_cursor(getattr(first, self.paginator.field), first.pk)
+
+
+class CursorPaginator:
+    """Пагинация по ключу (field, id) от новых строк к старым.
+
+    По умолчанию ключ - дата публикации записи; комментарии листаются
+    по дате создания (field='created').
+
+    Для страницы выбирается per_page + 1 строка: лишняя строка лишь
+    сообщает, есть ли записи дальше. COUNT(*) выполняется только при
+    обращении к count, шаблоны его не используют.
+
+    Вместо одного queryset можно передать список: каждый источник читается
+    с тем же курсором, а страница собирается слиянием без повторов.
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, per_page=POSTS_PER_PAGE, field='pub_date'):
+        if isinstance(queryset, (list, tuple)):
+            self.sources = list(queryset)
+        else:
+            self.sources = [queryset]
+        self.queryset = self.sources[0]
+        self.per_page = per_page
+        self.field = field
+
+    @cached_property
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def _key(self, source):
+        """Имена полей ключа (дата, id) в запросе источника."""
+        if CURSOR_FIELD in source.query.annotations:
+            return CURSOR_FIELD, CURSOR_PK
+        return self.field, 'pk'
+
+    def _queries(self, key, descending, limit):
+        """Запросы источников со строками после позиции key (при
+        descending - более старыми, иначе более новыми)."""
+        queries = []
+        for source in self.sources:
+            field, pk_field = self._key(source)
+            if key:
+                moment, pk = key
+                lookup = 'lt' if descending else 'gt'
+                source = source.filter(
+                    Q(**{f'{field}__{lookup}': moment})
+                    | Q(**{field: moment, f'{pk_field}__{lookup}': pk})
+                )
+            ordering = (
+                (f'-{field}', f'-{pk_field}') if descending
+                else (field, pk_field)
+            )
+            queries.append(source.order_by(*ordering)[:limit])
+        return queries
+
+    def queries(self, after=None):
+        """Запросы, которыми читается страница после курсора after."""
+        return self._queries(
+            decode_cursor(after), descending=True, limit=self.per_page + 1
+        )
+
+    def _rows(self, key, descending, limit, chunk_size=None):
+        """Строки источников по порядку ключа без повторов.
+
+        С chunk_size источники читаются через iterator() и сливаются
+        лениво, поэтому строки не накапливаются в памяти.
+        """
+        field = self.field
+        parts = self._queries(key, descending, limit)
+        if chunk_size:
+            parts = [part.iterator(chunk_size) for part in parts]
+        if len(parts) == 1:
+            yield from parts[0]
+            return
+        seen = set()
+        merged = heapq.merge(
+            *parts, key=lambda row: (getattr(row, field), row.pk),
+            reverse=descending
+        )
+        for row in merged:
+            if row.pk in seen:
+                continue
+            seen.add(row.pk)
+            yield row
+            if len(seen) == limit:
+                return
+
+    def _fetch(self, key, descending, limit):
+        return list(self._rows(key, descending, limit))
+
+    def iterate(self, after=None, limit=None, chunk_size=500):
+        """Строки после курсора after по одной, от новых к старым."""
+        return self._rows(
+            decode_cursor(after), descending=True, limit=limit,
+            chunk_size=chunk_size
+        )
+
+    def get_page(self, after=None, before=None):
+        """Вернуть страницу после курсора after или перед курсором before.
+
+        Без курсоров (или с испорченным курсором) возвращается первая
+        страница, как это делает Paginator.get_page.
+        """
+        after_key = decode_cursor(after)
+        before_key = None if after_key else decode_cursor(before)
+        if before_key:
+            rows = self._fetch(
+                before_key, descending=False, limit=self.per_page + 1
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(
+                rows, self, has_next=True, has_previous=has_previous,
+                before=before
+            )
+        rows = self._fetch(
+            after_key, descending=True, limit=self.per_page + 1
+        )
+        return CursorPage(
+            rows[:self.per_page], self, has_next=len(rows) > self.per_page,
+            has_previous=after_key is not None,
+            after=after if after_key else None
+        )
+
+
+def paginate(request, queryset, per_page=POSTS_PER_PAGE):
+    """Разбить ленту записей на страницы.
+
+    По умолчанию используется курсорная пагинация (?after=/?before=).
+    Старые ссылки вида ?page=N по-прежнему обслуживает Paginator; если
+    лента собрана из нескольких источников, они объединяются через OR с
+    DISTINCT: источники могут пересекаться, а соединение с таблицей ленты
+    размножает строки.
+    """
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        if isinstance(queryset, (list, tuple)):
+            queryset = functools.reduce(operator.or_, queryset).distinct()
+        paginator = Paginator(queryset.order_by('-pub_date', '-pk'), per_page)
+        return paginator, paginator.get_page(page_number)
+    paginator = CursorPaginator(queryset, per_page)
+    page = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    return paginator, page
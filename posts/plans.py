@@ -0,0 +1,125 @@
+"""Проверка планов горячих запросов через EXPLAIN.
+
+hot_queries() собирает запросы так же, как их строят представления и
+фоновые задачи: первая страница и страница после курсора каждой ленты,
+страница комментариев, обход подписчиков автора, каталог групп и самые
+активные авторы группы. Запрос считается регрессией, если СУБД читает
+таблицу целиком или сортирует строки во временной структуре, а не идет
+по индексу в нужном порядке.
+
+Шаблоны плана есть для SQLite и PostgreSQL. Планировщик PostgreSQL
+выбирает последовательное чтение маленьких таблиц, поэтому там проверку
+имеет смысл запускать на базе с данными (например, после seed_data).
+"""
+import re
+
+from django.db import connection
+from django.utils import timezone
+
+from .feeds import feed_sources
+from .models import (
+    Comment, Follow, Group, GroupAuthorStats, GroupStats, Post, User
+)
+from .pagination import COMMENTS_PER_PAGE, CursorPaginator, encode_cursor
+
+# Признаки чтения всей таблицы и сортировки без индекса.
+BAD_PLANS = {
+    'sqlite': (
+        re.compile(r'\bSCAN (TABLE )?\w+$'),
+        re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+    ),
+    'postgresql': (
+        re.compile(r'Seq Scan on posts_'),
+        re.compile(r'(?<!Incremental )\bSort\b'),
+    ),
+}
+
+
+def sample_ids():
+    """id существующих строк для подстановки в запросы."""
+    def first(model):
+        return model.objects.values_list('pk', flat=True).first() or 0
+    return {
+        'user': first(User), 'group': first(Group), 'post': first(Post),
+    }
+
+
+def feed_queries(name, sources, per_page=None, field='pub_date'):
+    """Первая страница ленты и страница после курсора."""
+    arguments = {'field': field}
+    if per_page:
+        arguments['per_page'] = per_page
+    paginator = CursorPaginator(sources, **arguments)
+    cursor = encode_cursor(timezone.now(), 0)
+    queries = {}
+    for page, after in (('first', None), ('after', cursor)):
+        for number, query in enumerate(paginator.queries(after)):
+            suffix = f'.{number}' if number else ''
+            queries[f'{name}.{page}{suffix}'] = query
+    return queries
+
+
+def hot_queries():
+    ids = sample_ids()
+    posts = Post.objects.select_related('author', 'group')
+    user = User(pk=ids['user'])
+    queries = {}
+    queries.update(feed_queries('index', posts))
+    queries.update(feed_queries(
+        'group', posts.filter(group_id=ids['group'])
+    ))
+    queries.update(feed_queries(
+        'profile', posts.filter(author_id=ids['user'])
+    ))
+    # Вторым источником ленты подписок берется популярный автор, даже
+    # если у пользователя из выборки таких подписок нет.
+    queries.update(feed_queries('follow', [
+        source.select_related('group', 'author')
+        for source in feed_sources(user)[:1]
+    ] + [posts.filter(author_id=ids['user'])]))
+    comments = Comment.objects.filter(post_id=ids['post']).select_related(
+        'author'
+    ).only('text', 'created', 'author__username')
+    queries.update(feed_queries(
+        'comments', comments, per_page=COMMENTS_PER_PAGE, field='created'
+    ))
+    followers = Follow.objects.filter(author_id=ids['user']).order_by(
+        'user_id'
+    )
+    queries['followers'] = followers.filter(user_id__gt=0).values_list(
+        'user_id', flat=True
+    )[:1000]
+    queries['groups'] = GroupStats.objects.filter(
+        last_post_at__isnull=False
+    ).order_by('-last_post_at', '-group')
+    queries['group.top_authors'] = GroupAuthorStats.objects.filter(
+        group_id=ids['group']
+    ).order_by('-post_count', '-author')[:5]
+    queries['is_following'] = Follow.objects.filter(
+        user_id=ids['user'], author_id=ids['user']
+    )
+    return queries
+
+
+def explain(queryset):
+    """Строки плана запроса."""
+    return queryset.explain().splitlines()
+
+
+def problems(plan, vendor=None):
+    """Строки плана, в которых видно чтение таблицы или сортировка."""
+    patterns = BAD_PLANS.get(vendor or connection.vendor, ())
+    return [
+        line for line in plan
+        if any(pattern and pattern.search(line) for pattern in patterns)
+    ]
+
+
+def check(queries=None):
+    """Планы запросов и найденные в них проблемы по именам запросов."""
+    queries = hot_queries() if queries is None else queries
+    report = {}
+    for name, queryset in queries.items():
+        plan = explain(queryset)
+        report[name] = (plan, problems(plan))
+    return report
@@ -0,0 +1,203 @@
+"""Очередь фоновых задач в таблице posts.Task.
+
+Функция объявляется задачей декоратором @task и ставится в очередь
+вызовом .delay(*args); аргументы должны сериализоваться в JSON, поэтому
+передаются id, а не объекты. Строка задачи вставляется в той же
+транзакции, что и основная запись, и воркер увидит ее только после
+коммита. При TASKS_EAGER задача выполняется сразу, в вызывающем коде.
+
+Воркер (команда run_worker) забирает задачу одним условным UPDATE,
+поэтому одну задачу не возьмут два воркера ни в SQLite, ни в PostgreSQL.
+Успешная задача удаляется. Упавшая возвращается в очередь с задержкой
+TASK_RETRY_DELAY * 2 ** (попытка - 1) секунд, а после max_attempts
+попыток остается в состоянии failed с текстом ошибки.
+
+Пока задача выполняется, поток воркера раз в TASK_HEARTBEAT_INTERVAL
+секунд продлевает ее блокировку (locked_at). Задачи воркера, который не
+продлевал блокировку дольше TASK_LOCK_TIMEOUT секунд, возвращаются в
+очередь, и их может взять другой воркер, пока первый еще работает. Поэтому
+задачи должны быть идемпотентными.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts, concurrency, queue):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.queue = queue
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def delay(self, *args):
+        """Поставить вызов в очередь (или выполнить сразу при TASKS_EAGER)."""
+        if settings.TASKS_EAGER:
+            self.func(*args)
+            return None
+        return Task.objects.create(
+            name=self.name, args=json.dumps(args), queue=self.queue,
+            max_attempts=self.max_attempts, run_at=timezone.now()
+        )
+
+
+def task(name=None, max_attempts=3, concurrency=None, queue='default'):
+    """Объявить функцию фоновой задачей.
+
+    concurrency ограничивает, сколько таких задач выполняется одновременно
+    во всех воркерах; ограничение проверяется перед захватом задачи и
+    может быть превышено на время гонки между воркерами.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        TASKS[task_name] = TaskFunction(
+            func, task_name, max_attempts, concurrency, queue
+        )
+        return TASKS[task_name]
+    return decorator
+
+
+def release_stale():
+    """Вернуть в очередь задачи воркеров, переставших отвечать."""
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_at__lt=deadline
+    ).update(status=Task.PENDING, locked_by='', locked_at=None)
+
+
+class Worker:
+    """Забирает задачи из очередей queues и выполняет их по одной."""
+    CANDIDATES = 10
+
+    def __init__(self, queues=('default',), name=None):
+        self.queues = list(queues)
+        self.name = name or (
+            f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        )
+
+    def busy_names(self):
+        """Задачи, для которых исчерпан лимит concurrency."""
+        limits = {
+            name: function.concurrency for name, function in TASKS.items()
+            if function.concurrency
+        }
+        if not limits:
+            return []
+        running = Task.objects.filter(
+            status=Task.RUNNING, name__in=limits
+        ).values('name').annotate(total=Count('pk')).values_list(
+            'name', 'total'
+        )
+        return [name for name, total in running if total >= limits[name]]
+
+    def claim(self):
+        now = timezone.now()
+        candidates = Task.objects.filter(
+            status=Task.PENDING, queue__in=self.queues, run_at__lte=now
+        ).exclude(name__in=self.busy_names()).order_by(
+            'run_at', 'pk'
+        ).values_list('pk', flat=True)[:self.CANDIDATES]
+        for pk in candidates:
+            claimed = Task.objects.filter(pk=pk, status=Task.PENDING).update(
+                status=Task.RUNNING, locked_by=self.name, locked_at=now,
+                attempts=F('attempts') + 1
+            )
+            if claimed:
+                return Task.objects.get(pk=pk)
+        return None
+
+    def run_one(self):
+        """Выполнить одну задачу. Возвращает False, если очередь пуста."""
+        claimed = self.claim()
+        if claimed is None:
+            return False
+        function = TASKS.get(claimed.name)
+        try:
+            if function is None:
+                raise LookupError(f'Задача {claimed.name} не объявлена.')
+            with self.heartbeat(claimed):
+                function(*json.loads(claimed.args))
+        except Exception:
+            self.fail(claimed, traceback.format_exc())
+        else:
+            claimed.delete()
+        return True
+
+    def extend_lock(self, claimed):
+        """Отметить, что воркер еще выполняет задачу."""
+        return Task.objects.filter(
+            pk=claimed.pk, status=Task.RUNNING, locked_by=self.name
+        ).update(locked_at=timezone.now())
+
+    @contextmanager
+    def heartbeat(self, claimed):
+        """Продлевать блокировку задачи, пока выполняется блок with."""
+        stop = threading.Event()
+
+        def beat():
+            try:
+                while not stop.wait(settings.TASK_HEARTBEAT_INTERVAL):
+                    self.extend_lock(claimed)
+            except Exception:
+                logger.exception(
+                    'Не удалось продлить блокировку задачи %s.', claimed.pk
+                )
+            finally:
+                connection.close()
+
+        thread = threading.Thread(
+            target=beat, name=f'heartbeat-{claimed.pk}', daemon=True
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def fail(self, claimed, error):
+        if claimed.attempts < claimed.max_attempts:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (claimed.attempts - 1)
+            changes = {
+                'status': Task.PENDING,
+                'run_at': timezone.now() + timedelta(seconds=delay),
+            }
+        else:
+            changes = {'status': Task.FAILED}
+        Task.objects.filter(pk=claimed.pk).update(
+            locked_by='', locked_at=None, last_error=error, **changes
+        )
+        logger.warning(
+            'Задача %s (id=%s, попытка %s) завершилась ошибкой:\n%s',
+            claimed.name, claimed.pk, claimed.attempts, error
+        )
+
+    def run_pending(self):
+        """Выполнять задачи, пока готовые к запуску не закончатся."""
+        done = 0
+        while self.run_one():
+            done += 1
+        return done
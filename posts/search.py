@@ -0,0 +1,205 @@
+"""Полнотекстовый поиск по записям и комментариям.
+
+Бэкенд выбирается настройкой SEARCH_BACKEND. SQLiteFTSBackend хранит
+основы слов (posts.stemmer) в виртуальных таблицах FTS5 и ранжирует
+записи по bm25; совпадение в тексте записи весит больше, чем совпадение
+в комментарии. DatabaseSearchBackend не требует индекса и подходит для
+других СУБД, но просматривает таблицы целиком.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from .models import Comment, Post
+from .stemmer import WORD_RE, stem, stem_text
+
+POST_TABLE = 'posts_post_fts'
+COMMENT_TABLE = 'posts_comment_fts'
+POST_WEIGHT = 2.0
+
+
+class SearchResults:
+    """Ленивая выдача поиска для Paginator: записи в порядке ранга.
+
+    Каждый срез выполняет один запрос к индексу и один запрос к Post.
+    """
+
+    def __init__(self, backend, query, queryset):
+        self.backend = backend
+        self.query = query
+        self.queryset = queryset
+
+    def count(self):
+        return self._count
+
+    @cached_property
+    def _count(self):
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop if index.stop is not None else self.count())
+        ids = self.backend.search_ids(self.query, limit - offset, offset)
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+class BaseSearchBackend:
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search_ids(self, query, limit, offset=0):
+        raise NotImplementedError
+
+    def count(self, query):
+        raise NotImplementedError
+
+    def search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Post.objects.select_related('author', 'group')
+        return SearchResults(self, query, queryset)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Поиск через LIKE без отдельного индекса."""
+
+    def _matches(self, query):
+        condition = Q()
+        for word in WORD_RE.findall(query):
+            condition &= (
+                Q(text__icontains=word) | Q(comments__text__icontains=word)
+            )
+        return Post.objects.filter(condition).distinct().order_by(
+            '-pub_date', '-pk'
+        )
+
+    def search_ids(self, query, limit, offset=0):
+        if not WORD_RE.search(query):
+            return []
+        return list(self._matches(query).values_list(
+            'pk', flat=True
+        )[offset:offset + limit])
+
+    def count(self, query):
+        if not WORD_RE.search(query):
+            return 0
+        return self._matches(query).count()
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Индекс FTS5 из миграции 0009_search_index."""
+
+    RANKED = (
+        f'SELECT rowid AS post_id, bm25({POST_TABLE}) * {POST_WEIGHT} '
+        f'AS score FROM {POST_TABLE} WHERE {POST_TABLE} MATCH %s '
+        f'UNION ALL '
+        f'SELECT post_id, bm25({COMMENT_TABLE}) AS score '
+        f'FROM {COMMENT_TABLE} WHERE {COMMENT_TABLE} MATCH %s'
+    )
+
+    def match_expression(self, query):
+        """Запрос FTS5: все основы слов запроса, каждая как префикс.
+
+        Основы состоят только из букв и цифр, поэтому кавычки
+        не дают пользователю использовать синтаксис FTS5.
+        """
+        return ' '.join(f'"{stem(word)}"*' for word in WORD_RE.findall(query))
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def index_post(self, post):
+        self._execute(
+            f'INSERT OR REPLACE INTO {POST_TABLE}(rowid, body) '
+            f'VALUES (%s, %s)', [post.pk, stem_text(post.text)]
+        )
+
+    def remove_post(self, post_id):
+        self._execute(f'DELETE FROM {POST_TABLE} WHERE rowid = %s', [post_id])
+
+    def index_comment(self, comment):
+        self._execute(
+            f'INSERT OR REPLACE INTO {COMMENT_TABLE}(rowid, body, post_id) '
+            f'VALUES (%s, %s, %s)',
+            [comment.pk, stem_text(comment.text), comment.post_id]
+        )
+
+    def remove_comment(self, comment_id):
+        self._execute(
+            f'DELETE FROM {COMMENT_TABLE} WHERE rowid = %s', [comment_id]
+        )
+
+    def clear(self):
+        self._execute(f'DELETE FROM {POST_TABLE}', [])
+        self._execute(f'DELETE FROM {COMMENT_TABLE}', [])
+
+    def search_ids(self, query, limit, offset=0):
+        match = self.match_expression(query)
+        if not match:
+            return []
+        rows = self._execute(
+            f'SELECT post_id FROM ({self.RANKED}) GROUP BY post_id '
+            f'ORDER BY MIN(score), post_id DESC LIMIT %s OFFSET %s',
+            [match, match, limit, offset]
+        )
+        return [post_id for post_id, in rows]
+
+    def count(self, query):
+        match = self.match_expression(query)
+        if not match:
+            return 0
+        rows = self._execute(
+            f'SELECT COUNT(DISTINCT post_id) FROM ({self.RANKED})',
+            [match, match]
+        )
+        return rows[0][0]
+
+
+def get_backend():
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+def rebuild(batch_size=1000):
+    """Заново проиндексировать все записи и комментарии пачками.
+
+    Возвращает пару (записей, комментариев).
+    """
+    backend = get_backend()
+    backend.clear()
+    totals = []
+    for model, index in ((Post, backend.index_post),
+                         (Comment, backend.index_comment)):
+        rows = model.objects.order_by('pk')
+        total = 0
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            for row in batch:
+                index(row)
+            last_pk = batch[-1].pk
+            total += len(batch)
+        totals.append(total)
+    return tuple(totals)
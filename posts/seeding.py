@@ -0,0 +1,215 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Строки вставляются через bulk_create пачками, поэтому сигналы не
+срабатывают: после вставки счетчики, ленты и поисковый индекс
+пересчитываются теми же функциями, что и команды recount_stats,
+rebuild_feeds и rebuild_search_index.
+
+Популярность распределена по степенному закону: номер автора или записи
+выбирается как int(n * random() ** skew), и при skew > 1 немногие первые
+авторы получают большую часть подписчиков, записей и комментариев.
+"""
+import io
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from . import counters, feeds, search
+from .models import Comment, Follow, Group, Post, User
+
+USERNAME_PREFIX = 'seed'
+IMAGE_COUNT = 8
+WORDS = (
+    'день', 'город', 'погода', 'утро', 'кошка', 'собака', 'книга', 'музыка',
+    'поездка', 'работа', 'новость', 'друзья', 'вечер', 'море', 'горы',
+    'дорога', 'кофе', 'фильм', 'проект', 'идея', 'весна', 'осень', 'зима',
+    'лето', 'сегодня', 'вчера', 'очень', 'хороший', 'новый', 'старый',
+    'большой', 'читать', 'смотреть', 'писать', 'гулять', 'думать', 'ждать',
+)
+
+
+def skewed_index(rng, size, skew):
+    """Номер от 0 до size - 1, малые номера выпадают чаще."""
+    return min(size - 1, int(size * rng.random() ** skew))
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def random_date(rng, now, days):
+    return now - timedelta(seconds=rng.uniform(0, days * 86400))
+
+
+@contextmanager
+def manual_dates(*fields):
+    """Временно отключить auto_now_add, чтобы задать даты самим."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def insert(model, rows, batch_size):
+    """Вставить строки из итератора пачками, вернуть их число."""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def new_ids(model, last_pk):
+    return list(model.objects.filter(pk__gt=last_pk).order_by(
+        'pk'
+    ).values_list('pk', flat=True))
+
+
+def last_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def make_images(rng, count):
+    """Сохранить count однотонных JPEG и вернуть их имена в хранилище."""
+    names = []
+    for number in range(count):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (800, 600), color).save(buffer, format='jpeg')
+        names.append(default_storage.save(
+            f'posts/seed-{number}.jpg', ContentFile(buffer.getvalue())
+        ))
+    return names
+
+
+def seed(users=1000, posts=10000, comments=30000, follows=20, groups=20,
+         images=0.1, skew=3.0, days=365, batch_size=1000, random_seed=None,
+         index=True, log=None):
+    """Создать пользователей, группы, записи, комментарии и подписки.
+
+    follows - среднее число подписок пользователя, images - доля записей
+    с изображением. Возвращает словарь с числом созданных строк.
+    """
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    now = timezone.now()
+    run = now.strftime('%Y%m%d%H%M%S')
+    created = {}
+
+    start = last_pk(User)
+    created['users'] = insert(User, (
+        User(username=f'{USERNAME_PREFIX}-{run}-{number}', password='!')
+        for number in range(users)
+    ), batch_size)
+    user_ids = new_ids(User, start)
+    log(f'Пользователей: {created["users"]}.')
+
+    start = last_pk(Group)
+    created['groups'] = insert(Group, (
+        Group(
+            title=f'Группа {run}-{number}', slug=f'seed-{run}-{number}',
+            description=random_text(rng, 12)
+        ) for number in range(groups)
+    ), batch_size)
+    group_ids = new_ids(Group, start)
+
+    image_names = make_images(rng, IMAGE_COUNT) if images else []
+
+    def post_rows():
+        for _ in range(posts):
+            has_image = image_names and rng.random() < images
+            has_group = group_ids and rng.random() < 0.7
+            yield Post(
+                text=random_text(rng, rng.randint(5, 60)),
+                author_id=user_ids[skewed_index(rng, len(user_ids), skew)],
+                group_id=(
+                    group_ids[skewed_index(rng, len(group_ids), skew)]
+                    if has_group else None
+                ),
+                image=rng.choice(image_names) if has_image else None,
+                pub_date=random_date(rng, now, days),
+            )
+
+    start = last_pk(Post)
+    with manual_dates(Post._meta.get_field('pub_date')):
+        created['posts'] = insert(Post, post_rows(), batch_size)
+    post_ids = new_ids(Post, start)
+    log(f'Записей: {created["posts"]}.')
+
+    def comment_rows():
+        if not post_ids:
+            return
+        for _ in range(comments):
+            yield Comment(
+                post_id=post_ids[skewed_index(rng, len(post_ids), skew)],
+                author_id=rng.choice(user_ids),
+                text=random_text(rng, rng.randint(3, 25)),
+                created=random_date(rng, now, days),
+            )
+
+    with manual_dates(Comment._meta.get_field('created')):
+        created['comments'] = insert(Comment, comment_rows(), batch_size)
+    log(f'Комментариев: {created["comments"]}.')
+
+    def follow_rows():
+        for user_id in user_ids:
+            wanted = min(
+                len(user_ids) - 1, int(rng.expovariate(1 / follows))
+            ) if follows else 0
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) == wanted:
+                    break
+                author_id = user_ids[skewed_index(rng, len(user_ids), skew)]
+                if author_id != user_id:
+                    authors.add(author_id)
+            for author_id in authors:
+                yield Follow(user_id=user_id, author_id=author_id)
+
+    created['follows'] = insert(Follow, follow_rows(), batch_size)
+    log(f'Подписок: {created["follows"]}.')
+
+    refresh_derived(user_ids, batch_size, index, log)
+    return created
+
+
+def refresh_derived(user_ids=None, batch_size=1000, index=True, log=None):
+    """Пересчитать то, что сигналы не обновили при bulk_create.
+
+    Это счетчики, ленты подписок пользователей user_ids (по умолчанию
+    всех, у кого есть подписки) и, если index, поисковый индекс.
+    """
+    log = log or (lambda message: None)
+    counters.repair_author_stats(batch_size)
+    counters.repair_comment_counts(batch_size)
+    counters.repair_group_stats(batch_size)
+    feeds.sync_all()
+    log('Счетчики пересчитаны.')
+    if user_ids is None:
+        user_ids = list(Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct())
+    for number in range(0, len(user_ids), batch_size):
+        for user in User.objects.filter(
+                pk__in=user_ids[number:number + batch_size]):
+            feeds.rebuild(user)
+    log('Ленты подписок собраны.')
+    if index:
+        search.rebuild(batch_size)
+        log('Поисковый индекс перестроен.')
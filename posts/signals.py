@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import caching, counters, effects, page_cache, search, tasks
+from .models import AuthorStats, Comment, Follow, Group, GroupStats, Post
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(author=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.shift_author_stats(instance.author_id, 'post_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.shift_author_stats(instance.author_id, 'post_count', -1)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_group(sender, instance, raw=False, update_fields=None,
+                            **kwargs):
+    instance.__dict__.pop('_previous_group_id', None)
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {'group', 'group_id'} & set(
+            update_fields):
+        return
+    if '_saved_group_id' in instance.__dict__:
+        instance._previous_group_id = instance._saved_group_id
+        return
+    instance._previous_group_id = Post.objects.filter(
+        pk=instance.pk
+    ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def count_group_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.shift_group_stats(instance.group_id, instance.author_id, 1)
+        return
+    previous = getattr(instance, '_previous_group_id', instance.group_id)
+    if previous != instance.group_id:
+        counters.shift_group_stats(previous, instance.author_id, -1)
+        counters.shift_group_stats(instance.group_id, instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_group_post(sender, instance, **kwargs):
+    counters.shift_group_stats(instance.group_id, instance.author_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def save_comment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        effects.comments_added([instance.post_id])
+    else:
+        page_cache.purge(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def delete_comment(sender, instance, **kwargs):
+    effects.comments_removed([instance.post_id])
+
+
+@receiver(post_save, sender=Follow)
+def save_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        effects.follows_added(
+            [(instance.pk, instance.user_id, instance.author_id)]
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def delete_follow(sender, instance, **kwargs):
+    effects.follows_removed([(instance.user_id, instance.author_id)])
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        tasks.fan_out_post.delay(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def notify_followers(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        tasks.notify_followers.delay(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def refresh_group_cards(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Post.objects.filter(group=instance).update(version=F('version') + 1)
+
+
+@receiver(pre_delete, sender=Group)
+def refresh_cards_of_deleted_group(sender, instance, **kwargs):
+    Post.objects.filter(group=instance).update(version=F('version') + 1)
+
+
+request_finished.connect(caching.flush_metrics)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tasks.index_post.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tasks.index_comment.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.get_backend().remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    tags = [f'post:{instance.pk}', f'author:{instance.author_id}']
+    groups = {
+        instance.group_id, getattr(instance, '_previous_group_id', None)
+    } - {None}
+    tags.extend(f'group:{group_id}' for group_id in groups)
+    if created or kwargs['signal'] is post_delete:
+        tags.append('index')
+    if groups and (created or kwargs['signal'] is post_delete
+                   or len(groups) > 1):
+        tags.append('groups')
+    page_cache.purge(*tags)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def purge_group_pages(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post_ids = Post.objects.filter(group=instance).values_list(
+        'pk', flat=True
+    )
+    page_cache.purge(
+        'groups', f'group:{instance.pk}', *(f'post:{pk}' for pk in post_ids)
+    )
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,111 @@
+"""Стеммер русского языка по алгоритму Snowball.
+
+https://snowballstem.org/algorithms/russian/stemmer.html
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = (
+    (),
+    (
+        'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+        'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+        'ая', 'яя', 'ою', 'ею',
+    ),
+)
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+VERB = (
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+        'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+        'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = ((), (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+    'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+    'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+DERIVATIONAL = ((), ('ост', 'ость'))
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _region(word, start=0):
+    """Начало области после первой согласной, идущей за гласной."""
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def _strip(word, start, groups):
+    """Отрезать самое длинное окончание из groups, лежащее после start.
+
+    Окончания первой группы снимаются, только если перед ними стоит
+    «а» или «я». Возвращает слово и признак того, что окончание найдено.
+    """
+    endings = sorted(
+        ((ending, number) for number, group in enumerate(groups)
+         for ending in group),
+        key=lambda item: len(item[0]), reverse=True
+    )
+    for ending, number in endings:
+        cut = len(word) - len(ending)
+        if cut < start or not word.endswith(ending):
+            continue
+        if number == 0 and (cut - 1 < start or word[cut - 1] not in 'ая'):
+            return word, False
+        return word[:cut], True
+    return word, False
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv = next(
+        (index + 1 for index, char in enumerate(word) if char in VOWELS),
+        len(word)
+    )
+    r2 = _region(word, _region(word) - 1)
+
+    word, found = _strip(word, rv, PERFECTIVE_GERUND)
+    if not found:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        word, found = _strip(word, rv, ADJECTIVE)
+        if found:
+            word, _ = _strip(word, rv, PARTICIPLE)
+        else:
+            word, found = _strip(word, rv, VERB)
+            if not found:
+                word, _ = _strip(word, rv, NOUN)
+
+    word, _ = _strip(word, rv, ((), ('и',)))
+    word, _ = _strip(word, r2, DERIVATIONAL)
+
+    if word.endswith('нн') and len(word) - 1 > rv:
+        return word[:-1]
+    word, found = _strip(word, rv, SUPERLATIVE)
+    if found:
+        return word[:-1] if word.endswith('нн') else word
+    if word.endswith('ь') and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
+
+
+def stem_text(text):
+    """Привести все слова текста к основам, сохранив их порядок."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text))
@@ -0,0 +1,68 @@
+"""Побочные действия записи на сайт, выполняемые в воркерах очереди.
+
+Задачи получают id и читают строки заново: если запись или подписку
+успели удалить, задача ничего не делает.
+"""
+from django.utils.dateparse import parse_datetime
+
+from . import feeds, notifications, search
+from .models import Comment, Follow, Post
+from .queue import task
+
+
+@task()
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).only(
+        'pk', 'author_id', 'pub_date'
+    ).first()
+    if post is not None:
+        feeds.fan_out_post(post)
+
+
+@task()
+def backfill_feed(follow_id):
+    follow = Follow.objects.filter(pk=follow_id).select_related(
+        'user', 'author'
+    ).first()
+    if follow is not None:
+        feeds.sync_author(follow.author_id)
+        feeds.backfill(follow.user, follow.author)
+
+
+@task()
+def sync_author_feeds(author_id):
+    feeds.sync_author(author_id)
+
+
+@task()
+def index_post(post_id):
+    post = Post.objects.filter(pk=post_id).only('pk', 'text').first()
+    if post is not None:
+        search.get_backend().index_post(post)
+
+
+@task()
+def index_comment(comment_id):
+    comment = Comment.objects.filter(pk=comment_id).only(
+        'pk', 'post_id', 'text'
+    ).first()
+    if comment is not None:
+        search.get_backend().index_comment(comment)
+
+
+@task()
+def index_new_comments(post_ids, since):
+    """Проиндексировать комментарии к записям post_ids, созданные не
+    раньше since (ISO 8601), - после пачки из буфера записи."""
+    backend = search.get_backend()
+    for comment in Comment.objects.filter(
+            post_id__in=post_ids, created__gte=parse_datetime(since)
+    ).only('pk', 'post_id', 'text').iterator():
+        backend.index_comment(comment)
+
+
+@task()
+def notify_followers(post_id):
+    post = Post.objects.filter(pk=post_id).only('pk', 'author_id').first()
+    if post is not None:
+        notifications.notify_followers(post)
@@ -0,0 +1,15 @@
+from django import template
+
+from posts.following import is_following as user_is_following
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author):
+    """Подписан ли текущий пользователь на автора, без запросов к базе
+    после первой проверки в запросе.
+
+        {% is_following post.author as following %}
+    """
+    return user_is_following(context['request'], author)
@@ -0,0 +1,48 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from posts.caching import get_or_compute
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = int(self.expire_time.resolve(context))
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [variable.resolve(context) for variable in self.vary_on]
+        )
+        match = getattr(context.get('request'), 'resolver_match', None)
+        return get_or_compute(
+            key, lambda: self.nodelist.render(context), timeout,
+            view=match.url_name if match else None
+        )
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """Аналог {% cache %} с защитой от одновременного пересчета и учетом
+    попаданий по представлениям.
+
+        {% fragment_cache 86400 post_card post.id post.version %}
+            ...
+        {% endfragment_cache %}
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{tokens[0]}' tag requires at least 2 arguments."
+        )
+    return FragmentCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]]
+    )
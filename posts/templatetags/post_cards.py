@@ -0,0 +1,46 @@
+from functools import partial
+
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+
+def cached_reverse(urls, name, *args):
+    """reverse() с запоминанием адресов на время отрисовки страницы."""
+    key = (name, *args)
+    if key not in urls:
+        urls[key] = reverse(name, args=args)
+    return urls[key]
+
+
+@register.inclusion_tag('includes/post_item.html', takes_context=True)
+def post_card(context, post, full=False):
+    """Карточка записи.
+
+        {% post_card post %}
+        {% post_card post full=True %}
+
+    Шаблон карточки получает небольшой контекст вместо контекста всей
+    страницы. Адреса ссылок передаются функциями: шаблон вызывает их,
+    только когда карточки нет в кэше фрагментов, а адреса автора и группы
+    вычисляются не больше одного раза на страницу.
+    """
+    urls = context.render_context.setdefault('post_card_urls', {})
+    username = post.author.username
+    user = context.get('user')
+    is_author = user is not None and user.pk == post.author_id
+    return {
+        'post': post,
+        'full': full,
+        'is_author': is_author,
+        'request': context.get('request'),
+        'author_url': partial(cached_reverse, urls, 'profile', username),
+        'post_url': partial(reverse, 'post', args=[username, post.pk]),
+        'group_url': partial(
+            cached_reverse, urls, 'group', post.group.slug
+        ) if post.group_id else None,
+        'edit_url': partial(
+            reverse, 'post_edit', args=[username, post.pk]
+        ),
+    }
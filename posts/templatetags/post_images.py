@@ -0,0 +1,11 @@
+from django import template
+
+from posts.thumbnails import card_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_image(image):
+    """Готовая миниатюра для карточки или None, если ее еще нет."""
+    return card_thumbnail(image)
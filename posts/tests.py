@@ -1,17 +1,42 @@
+import glob
 import io
+import json
+import os
 import tempfile
+import time
+from datetime import timedelta
+from importlib import import_module
 
 import mock
 
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
 from django.core.files import File
+from django.core.management import CommandError, call_command
 from django.core.files.base import ContentFile
-from django.test import Client, TestCase, override_settings
+from django.db import DatabaseError, connection
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from PIL import Image
 
-from posts.models import Comment, Follow, Group, Post, User
+from posts import (
+    benchmarks, caching, checks, counters, notifications, plans, queue, search,
+    throttling, transfer, write_buffer
+)
+from posts.models import (
+    AuthorStats, Comment, FeedItem, Follow, Group, GroupStats, Notification,
+    Post, Task, User
+)
+from posts.queue import task
 
 
+@override_settings(TASKS_EAGER=True)
 class BaseTest(TestCase):
     DUMMY_CACHE = {
         'default': {
@@ -338,16 +363,1920 @@ class PostCommentTest(CacheNotRequiredTest):
 class CacheRequiredPostTest(BaseTest):
     """Предоставляет запуск тестов с кэшированием."""
 
-    def test_verify_cache_index_page(self):
-        """Проверка работы кэша главной страницы - запись не должна
-        появляться на странице index после кэширования."""
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_post_card_is_served_from_cache(self):
+        """Карточка записи берется из кэша, пока версия записи не
+        изменилась, и обновляется после редактирования."""
         page = 'index'
         self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
         self.auth_client.get(reverse(page))
-        self.create_post(self.TEST_TEXT_3, self.group, self.auth_user)
+        Post.objects.filter(pk=self.post_id).update(text=self.TEST_TEXT_3)
         response = self.auth_client.get(reverse(page))
         self.assertNotContains(
             response, self.TEST_TEXT_3, status_code=200,
             msg_prefix=f'Найден текст записи на странице {page}',
             html=False,
         )
+        self.auth_client.post(reverse('post_edit', kwargs={
+            'username': self.auth_user.username, 'post_id': self.post_id
+        }), data={'text': self.TEST_TEXT_2, 'group': self.group.pk})
+        response = self.auth_client.get(reverse(page))
+        self.assertContains(response, self.TEST_TEXT_2, status_code=200)
+
+    def test_post_card_refreshes_after_comment_and_group_change(self):
+        """Новый комментарий и изменение группы обновляют карточку."""
+        self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
+        self.auth_client.get(reverse('index'))
+        self.auth_client.post(reverse('add_comment', kwargs={
+            'username': self.auth_user.username, 'post_id': self.post_id
+        }), data={'text': self.TEST_TEXT_2})
+        self.group.title = 'RenamedGroup'
+        self.group.save()
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, '1 комментариев')
+        self.assertContains(response, '#RenamedGroup')
+
+    def test_edit_link_is_not_shared_between_users(self):
+        """Ссылка на редактирование не попадает в общий фрагмент кэша."""
+        self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, 'Редактировать')
+        response = self.no_auth_client.get(reverse('index'))
+        self.assertNotContains(response, 'Редактировать')
+
+
+class PostCursorPaginationTest(CacheNotRequiredTest):
+    def create_posts(self, count):
+        for number in range(count):
+            Post.objects.create(
+                text=f'{self.TEST_TEXT_1} #{number}', group=self.group,
+                author=self.auth_user
+            )
+
+    def test_cursor_walks_all_posts_without_duplicates(self):
+        """Переход по ссылкам ?after= обходит все записи ровно один раз,
+        а ?before= возвращает на предыдущую страницу."""
+        self.create_posts(25)
+        seen = []
+        pages = []
+        params = {}
+        while True:
+            response = self.no_auth_client.get(reverse('index'), params)
+            page = response.context['page']
+            pages.append([post.pk for post in page])
+            seen.extend(pages[-1])
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        self.assertEqual(
+            seen, list(
+                Post.objects.order_by('-pub_date', '-pk')
+                .values_list('pk', flat=True)
+            )
+        )
+        response = self.no_auth_client.get(
+            reverse('index'), {'before': page.previous_cursor}
+        )
+        self.assertEqual([post.pk for post in response.context['page']],
+                         pages[1])
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный токен курсора отдает первую страницу."""
+        self.create_posts(12)
+        response = self.no_auth_client.get(
+            reverse('index'), {'after': 'not-a-cursor'}
+        )
+        page = response.context['page']
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_cursor_page_does_not_count_rows(self):
+        """Курсорная страница не выполняет COUNT(*) по таблице записей."""
+        self.create_posts(12)
+        with CaptureQueriesContext(connection) as queries:
+            self.no_auth_client.get(reverse('index'))
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_page_number_links_still_work(self):
+        """Старые ссылки ?page=N продолжают работать."""
+        self.create_posts(12)
+        response = self.no_auth_client.get(reverse('index'), {'page': 2})
+        self.assertEqual(len(response.context['page']), 2)
+
+
+class PostCountersTest(CacheNotRequiredTest):
+    def test_counters_follow_writes_through_views(self):
+        """Счетчики комментариев, записей и подписок обновляются при
+        записи через представления и при удалении."""
+        self.auth_client.post(reverse('new_post'), data={
+            'text': self.TEST_TEXT_1, 'group': self.group.pk
+        })
+        post = Post.objects.get()
+        self.auth_client.post(reverse('add_comment', kwargs={
+            'username': self.auth_user.username, 'post_id': post.pk
+        }), data={'text': self.TEST_TEXT_2})
+        self.auth_client.get(reverse(
+            'profile_follow', kwargs={'username': self.no_auth_user.username}
+        ))
+        post.refresh_from_db()
+        self.auth_user.stats.refresh_from_db()
+        self.no_auth_user.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.auth_user.stats.post_count, 1)
+        self.assertEqual(self.auth_user.stats.following_count, 1)
+        self.assertEqual(self.no_auth_user.stats.follower_count, 1)
+
+        Comment.objects.all().delete()
+        self.auth_client.get(reverse(
+            'profile_unfollow',
+            kwargs={'username': self.no_auth_user.username}
+        ))
+        post.refresh_from_db()
+        self.auth_user.stats.refresh_from_db()
+        self.no_auth_user.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.auth_user.stats.following_count, 0)
+        self.assertEqual(self.no_auth_user.stats.follower_count, 0)
+
+    def test_editing_post_keeps_comment_count(self):
+        """Редактирование записи не затирает счетчик комментариев."""
+        self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
+        stale = Post.objects.get(pk=self.post_id)
+        Comment.objects.create(
+            post=stale, author=self.no_auth_user, text=self.TEST_TEXT_2
+        )
+        stale.text = self.TEST_TEXT_3
+        stale.save()
+        self.assertEqual(Post.objects.get(pk=self.post_id).comment_count, 1)
+
+    def test_recount_stats_repairs_drift(self):
+        """Команда recount_stats исправляет расхождения счетчиков."""
+        self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
+        Comment.objects.create(
+            post_id=self.post_id, author=self.no_auth_user,
+            text=self.TEST_TEXT_2
+        )
+        Post.objects.update(comment_count=7)
+        AuthorStats.objects.filter(author=self.no_auth_user).delete()
+        AuthorStats.objects.filter(author=self.auth_user).update(post_count=0)
+        call_command('recount_stats', stdout=io.StringIO())
+        self.assertEqual(Post.objects.get().comment_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.auth_user).post_count, 1
+        )
+        self.assertTrue(
+            AuthorStats.objects.filter(author=self.no_auth_user).exists()
+        )
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1, FEED_MAX_ITEMS=3)
+class PostFeedTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create(username='Luke')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed_texts(self):
+        response = self.reader_client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_follow_backfills_and_unfollow_drops_feed(self):
+        """Подписка добавляет последние записи автора в ленту (не больше
+        FEED_MAX_ITEMS), отписка их убирает."""
+        for number in range(5):
+            Post.objects.create(text=f'old {number}', author=self.auth_user)
+        self.reader_client.get(reverse(
+            'profile_follow', kwargs={'username': self.auth_user.username}
+        ))
+        self.assertEqual(FeedItem.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(self.feed_texts(), ['old 4', 'old 3', 'old 2'])
+        self.reader_client.get(reverse(
+            'profile_unfollow', kwargs={'username': self.auth_user.username}
+        ))
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новая запись раскладывается в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        self.auth_client.post(reverse('new_post'), data={
+            'text': self.TEST_TEXT_1, 'group': self.group.pk
+        })
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.reader, post__text=self.TEST_TEXT_1
+        ).exists())
+        self.assertEqual(self.feed_texts(), [self.TEST_TEXT_1])
+
+    def test_prolific_author_is_read_on_demand(self):
+        """Записи авторов с большим числом подписчиков не раскладываются,
+        но попадают в ленту при чтении вместе с материализованными."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Follow.objects.create(user=self.no_auth_user, author=self.auth_user)
+        Follow.objects.create(user=self.reader, author=self.no_auth_user)
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.no_auth_user)
+        Post.objects.create(text=self.TEST_TEXT_2, author=self.auth_user)
+        self.assertFalse(FeedItem.objects.filter(
+            post__author=self.auth_user
+        ).exists())
+        self.assertEqual(
+            self.feed_texts(), [self.TEST_TEXT_2, self.TEST_TEXT_1]
+        )
+
+    def test_author_below_threshold_is_materialized(self):
+        """Когда популярный автор теряет подписчиков, записи, опубликованные
+        без раскладки, появляются в лентах оставшихся и новых подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Follow.objects.create(user=self.no_auth_user, author=self.auth_user)
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.auth_user)
+        self.assertFalse(FeedItem.objects.exists())
+        Follow.objects.filter(user=self.no_auth_user).delete()
+        self.assertTrue(
+            AuthorStats.objects.get(author=self.auth_user).materialized
+        )
+        self.assertEqual(self.feed_texts(), [self.TEST_TEXT_1])
+        Follow.objects.filter(user=self.reader).delete()
+        Follow.objects.create(user=self.no_auth_user, author=self.auth_user)
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.no_auth_user, post__text=self.TEST_TEXT_1
+        ).exists())
+
+    def test_author_above_threshold_leaves_feeds(self):
+        """Записи автора, ставшего популярным, убираются из лент, а
+        читаются при показе."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.auth_user)
+        Follow.objects.create(user=self.no_auth_user, author=self.auth_user)
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(self.feed_texts(), [self.TEST_TEXT_1])
+
+    def test_migration_removes_feed_items_of_prolific_authors(self):
+        """Миграция, помечающая популярных авторов, убирает их записи из
+        лент, чтобы они не читались из двух источников."""
+        migration = import_module(
+            'posts.migrations.0014_authorstats_materialized'
+        )
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.auth_user)
+        Follow.objects.create(user=self.reader, author=self.no_auth_user)
+        Post.objects.create(text=self.TEST_TEXT_2, author=self.no_auth_user)
+        AuthorStats.objects.filter(author=self.auth_user).update(
+            follower_count=2, materialized=True
+        )
+        migration.mark_prolific_authors(apps, None)
+        self.assertEqual(list(FeedItem.objects.values_list(
+            'author_id', flat=True
+        )), [self.no_auth_user.pk])
+        self.assertEqual(
+            self.feed_texts(), [self.TEST_TEXT_2, self.TEST_TEXT_1]
+        )
+
+    @override_settings(FEED_MAX_ITEMS=50)
+    def test_cursor_walks_materialized_and_direct_sources(self):
+        """Курсор листает материализованную часть ленты по FeedItem вместе
+        с записями популярного автора, без пропусков и повторов."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Follow.objects.create(user=self.reader, author=self.no_auth_user)
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        for number in range(12):
+            author = (self.auth_user, self.no_auth_user)[number % 2]
+            Post.objects.create(text=f'post {number}', author=author)
+        pages = []
+        params = {}
+        while True:
+            response = self.reader_client.get(reverse('follow_index'), params)
+            page = response.context['page']
+            pages.append([post.text for post in page])
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(sum(pages, []), [
+            f'post {number}' for number in reversed(range(12))
+        ])
+        response = self.reader_client.get(
+            reverse('follow_index'), {'before': page.previous_cursor}
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page']], pages[0]
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=5)
+    def test_page_number_link_does_not_repeat_posts(self):
+        """Старая ссылка ?page=N на ленту не повторяет записи, попавшие в
+        несколько источников."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        Follow.objects.create(user=self.no_auth_user, author=self.auth_user)
+        for number in range(3):
+            Post.objects.create(text=f'post {number}', author=self.auth_user)
+        AuthorStats.objects.filter(author=self.auth_user).update(
+            materialized=False
+        )
+        response = self.reader_client.get(
+            reverse('follow_index'), {'page': 1}
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['page']],
+            list(Post.objects.order_by('-pub_date').values_list(
+                'pk', flat=True
+            ))
+        )
+
+    @override_settings(FEED_TRIM_SLACK=1)
+    def test_fan_out_trims_overflowing_feeds(self):
+        """Раскладка обрезает ленты, выросшие больше FEED_MAX_ITEMS +
+        FEED_TRIM_SLACK."""
+        Follow.objects.create(user=self.reader, author=self.auth_user)
+        for number in range(4):
+            Post.objects.create(text=f'new {number}', author=self.auth_user)
+        self.assertEqual(FeedItem.objects.filter(user=self.reader).count(), 4)
+        Post.objects.create(text='new 4', author=self.auth_user)
+        self.assertEqual(FeedItem.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(self.feed_texts(), ['new 4', 'new 3', 'new 2'])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0, FEED_MAX_DIRECT_SOURCES=2)
+    def test_many_prolific_authors_have_query_budget(self):
+        """Число запросов ленты не растет с числом популярных авторов в
+        подписках."""
+        def follow_authors(count):
+            for number in range(count):
+                author = User.objects.create(
+                    username=f'author{len(created) + number}'
+                )
+                Follow.objects.create(user=self.reader, author=author)
+                Post.objects.create(text=f'post {author.pk}', author=author)
+                created.append(author)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.reader_client.get(reverse('follow_index'))
+            self.assertEqual(len(response.context['page']), len(created))
+            return len(queries)
+
+        created = []
+        follow_authors(3)
+        budget = count_queries()
+        follow_authors(5)
+        self.assertEqual(count_queries(), budget)
+
+    def test_rebuild_feeds_command(self):
+        """Команда rebuild_feeds восстанавливает потерянную ленту."""
+        Follow.objects.create(user=self.reader, author=self.no_auth_user)
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.no_auth_user)
+        FeedItem.objects.all().delete()
+        call_command(
+            'rebuild_feeds', '--user', self.reader.username,
+            stdout=io.StringIO()
+        )
+        self.assertEqual(self.feed_texts(), [self.TEST_TEXT_1])
+
+
+class FragmentCacheTest(BaseTest):
+    KEY = 'fragment:test'
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_stale_value_is_served_while_other_worker_recomputes(self):
+        """Если значение устарело, а пересчет уже идет в другом процессе,
+        отдается устаревшее значение."""
+        cache.set(self.KEY, (0, 'stale'))
+        cache.add(f'{self.KEY}:lock', 1)
+        compute = mock.Mock(return_value='fresh')
+        self.assertEqual(
+            caching.get_or_compute(self.KEY, compute, 60), 'stale'
+        )
+        compute.assert_not_called()
+
+    def test_miss_waits_for_single_recomputation(self):
+        """При промахе процесс без блокировки ждет результат другого
+        процесса, а не считает значение сам."""
+        cache.add(f'{self.KEY}:lock', 1)
+        compute = mock.Mock(return_value='own')
+
+        def other_worker_finishes(seconds):
+            cache.set(self.KEY, (time.time() + 60, 'shared'))
+
+        with mock.patch('posts.caching.time.sleep', other_worker_finishes):
+            value = caching.get_or_compute(self.KEY, compute, 60)
+        self.assertEqual(value, 'shared')
+        compute.assert_not_called()
+
+    def test_views_are_registered_once_and_reset(self):
+        """Представления со счетчиками заносятся в список по одному разу и
+        заново после сброса."""
+        for view in ('index', 'group', 'index'):
+            caching.record(view, caching.HIT)
+            caching.flush_metrics()
+        self.assertEqual(caching.metrics_views(), ['group', 'index'])
+        self.assertEqual(caching.read_metrics()['index']['hit'], 2)
+        caching.reset_metrics()
+        caching.record('group', caching.MISS)
+        caching.flush_metrics()
+        self.assertEqual(caching.read_metrics(), {
+            'group': {'hit': 0, 'stale': 0, 'miss': 1}
+        })
+
+    @override_settings(PAGE_CACHE_VIEWS=())
+    def test_shared_file_cache_counts_hits_per_view(self):
+        """С файловым кэшем фрагменты общие, а попадания учитываются по
+        представлениям."""
+        self.create_post(self.TEST_TEXT_1, self.group, self.auth_user)
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }}):
+                self.no_auth_client.get(reverse('index'))
+                Client().get(reverse('index'))
+                self.no_auth_client.get(
+                    reverse('group', kwargs={'slug': self.group.slug})
+                )
+                metrics = caching.read_metrics()
+        self.assertEqual(metrics['index'], {'hit': 1, 'stale': 0, 'miss': 1})
+        self.assertEqual(metrics['group']['hit'], 1)
+
+
+class PostThumbnailTest(CacheNotRequiredTest):
+    PLACEHOLDER = 'alt="Изображение готовится"'
+
+    def upload_image(self, media_root):
+        byte_image = io.BytesIO()
+        Image.new('RGB', size=(1000, 1000)).save(byte_image, format='jpeg')
+        image = ContentFile(byte_image.getvalue(), name='test.jpeg')
+        with override_settings(MEDIA_ROOT=media_root):
+            self.auth_client.post(reverse('new_post'), data={
+                'text': self.TEST_TEXT_1, 'group': self.group.pk,
+                'image': image
+            })
+        return Post.objects.get()
+
+    @override_settings(THUMBNAIL_ASYNC=True, TASKS_EAGER=False)
+    def test_page_never_generates_thumbnail(self):
+        """Пока миниатюры нет, страница показывает заглушку и не создает
+        миниатюру в запросе."""
+        with tempfile.TemporaryDirectory() as media_root:
+            self.upload_image(media_root)
+            with mock.patch(
+                'sorl.thumbnail.default.backend.get_thumbnail',
+                side_effect=AssertionError('thumbnail in request')
+            ), override_settings(MEDIA_ROOT=media_root):
+                response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, self.PLACEHOLDER)
+        self.assertTrue(
+            Task.objects.filter(name='posts.thumbnails.generate').exists()
+        )
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_generated_thumbnail_replaces_placeholder(self):
+        """Готовая миниатюра показывается вместо заглушки, а версия
+        записи увеличивается, чтобы обновить кэш карточки."""
+        with tempfile.TemporaryDirectory() as media_root:
+            post = self.upload_image(media_root)
+            with override_settings(MEDIA_ROOT=media_root):
+                response = self.auth_client.get(reverse('index'))
+        self.assertEqual(post.version, 1)
+        self.assertNotContains(response, self.PLACEHOLDER)
+        self.assertContains(response, 'src="/media/cache/')
+
+    @override_settings(THUMBNAIL_ASYNC=True, TASKS_EAGER=False)
+    def test_warm_thumbnails_command_is_resumable(self):
+        """Команда warm_thumbnails создает недостающие миниатюры, после
+        ошибки продолжает с записи, на которой она случилась, а после
+        успешного прогона начинает следующий сначала."""
+        with tempfile.TemporaryDirectory() as media_root:
+            post = self.upload_image(media_root)
+            state_file = f'{media_root}/warm.state'
+
+            def warm_thumbnails():
+                out = io.StringIO()
+                call_command(
+                    'warm_thumbnails', processes=1, state_file=state_file,
+                    stdout=out, stderr=io.StringIO()
+                )
+                return out.getvalue()
+
+            with override_settings(MEDIA_ROOT=media_root):
+                with mock.patch(
+                        'posts.management.commands.warm_thumbnails.warm',
+                        lambda post_id, force: (post_id, 'OSError: boom')):
+                    self.assertIn('ошибок 1', warm_thumbnails())
+                with open(state_file) as state:
+                    self.assertEqual(
+                        json.load(state), {'last_id': 0, 'failed': [post.pk]}
+                    )
+                out = warm_thumbnails()
+                self.assertIn(f'Повторяем записи с ошибками: {post.pk}.', out)
+                self.assertIn('создано 1', out)
+                self.assertFalse(os.path.exists(state_file))
+                self.assertIn('создано 0, пропущено 1', warm_thumbnails())
+                response = self.auth_client.get(reverse('index'))
+        self.assertNotContains(response, self.PLACEHOLDER)
+
+
+class PostSearchTest(CacheNotRequiredTest):
+    def search(self, query, **params):
+        response = self.no_auth_client.get(
+            reverse('search'), {'q': query, **params}
+        )
+        return [post.text for post in response.context['page']]
+
+    def test_search_uses_russian_stems(self):
+        """Поиск находит запись по другой форме слова."""
+        Post.objects.create(text='Мои кошки спят', author=self.auth_user)
+        Post.objects.create(text='Собака лает', author=self.auth_user)
+        self.assertEqual(self.search('кошка'), ['Мои кошки спят'])
+        self.assertEqual(self.search('кошки собака'), [])
+
+    def test_search_ranks_posts_over_comments_and_follows_updates(self):
+        """Совпадение в тексте записи ранжируется выше совпадения в
+        комментарии; правка и удаление сразу отражаются в индексе."""
+        commented = Post.objects.create(text='Обычный день',
+                                        author=self.auth_user)
+        Comment.objects.create(post=commented, author=self.no_auth_user,
+                               text='Отличная погода')
+        Post.objects.create(text='Погода радует', author=self.auth_user)
+        self.assertEqual(self.search('погоды'),
+                         ['Погода радует', 'Обычный день'])
+        commented.text = 'Погожий день'
+        commented.save()
+        Comment.objects.all().delete()
+        self.assertEqual(self.search('погода'), ['Погода радует'])
+        Post.objects.filter(text='Погода радует').delete()
+        self.assertEqual(self.search('погода'), [])
+
+    def test_search_results_are_paginated(self):
+        """Выдача поиска разбита на страницы и сохраняет запрос в ссылках."""
+        for number in range(12):
+            Post.objects.create(text=f'Новость {number}',
+                                author=self.auth_user)
+        response = self.no_auth_client.get(reverse('search'), {'q': 'новости'})
+        self.assertEqual(response.context['paginator'].count, 12)
+        self.assertContains(response, 'href="?page=2&q=%D0%BD')
+        self.assertEqual(len(self.search('новости', page=2)), 2)
+
+    def test_rebuild_search_index_command(self):
+        """Команда rebuild_search_index восстанавливает индекс."""
+        Post.objects.create(text='Потерянная запись', author=self.auth_user)
+        search.get_backend().clear()
+        self.assertEqual(self.search('запись'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('запись'), ['Потерянная запись'])
+
+
+class DatabaseProfileTest(TestCase):
+    def busy_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            return cursor.fetchone()[0]
+
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        """Прагмы SQLITE_PRAGMAS выполняются для нового соединения."""
+        original = self.busy_timeout()
+        try:
+            with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234}):
+                connection_created.send(
+                    sender=connection.__class__, connection=connection
+                )
+            self.assertEqual(self.busy_timeout(), 1234)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA busy_timeout = {original}')
+
+
+@override_settings(QUERY_STATS_HEADERS=True)
+class QueryBudgetTest(CacheNotRequiredTest):
+    """Число SQL-запросов страниц не зависит от числа записей на них."""
+    # Страницы группы, профиля и записи сначала читают валидаторы
+    # условного GET (posts.conditional).
+    BUDGETS = {
+        'index': (1, 3),
+        'group': (5, 7),
+        'profile': (4, 7),
+        'post': (3, 6),
+        'follow_index': (None, 4),
+    }
+
+    def create_posts(self, count):
+        for number in range(count):
+            post = Post.objects.create(
+                text=f'{self.TEST_TEXT_1} {number}', group=self.group,
+                author=self.no_auth_user
+            )
+            Comment.objects.create(
+                post=post, author=self.auth_user, text=self.TEST_TEXT_2
+            )
+            Comment.objects.create(
+                post=post, author=self.no_auth_user, text=self.TEST_TEXT_3
+            )
+        return post
+
+    def assert_budgets(self, post):
+        kwargs = {
+            'index': {},
+            'group': {'slug': self.group.slug},
+            'profile': {'username': self.no_auth_user.username},
+            'post': {
+                'username': self.no_auth_user.username, 'post_id': post.pk
+            },
+            'follow_index': {},
+        }
+        for name, budgets in self.BUDGETS.items():
+            for client, budget in zip(
+                    (self.no_auth_client, self.auth_client), budgets):
+                if budget is None:
+                    continue
+                with self.subTest(view=name, budget=budget):
+                    response = client.get(reverse(name, kwargs=kwargs[name]))
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(int(response['X-DB-Queries']), budget)
+                    self.assertEqual(int(response['X-DB-Duplicates']), 0)
+
+    def test_query_budgets_do_not_depend_on_page_size(self):
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        self.assert_budgets(self.create_posts(2))
+        self.assert_budgets(self.create_posts(25))
+
+
+class SeedBenchmarkTest(CacheNotRequiredTest):
+    def test_seed_data_keeps_counters_and_feeds_consistent(self):
+        """Команда seed_data создает строки пачками и пересчитывает
+        счетчики и ленты, которые при bulk_create не обновляются."""
+        out = io.StringIO()
+        call_command(
+            'seed_data', users=30, posts=200, comments=300, follows=5,
+            groups=3, images=0, batch_size=50, random_seed=1, stdout=out
+        )
+        self.assertIn('posts 200', out.getvalue())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(counters.repair_comment_counts(dry_run=True), 0)
+        self.assertEqual(counters.repair_author_stats(dry_run=True), (0, 0))
+        self.assertEqual(
+            len({post.pub_date for post in Post.objects.all()}), 200
+        )
+        follow = Follow.objects.filter(author__stats__post_count__gt=0)[0]
+        self.assertTrue(FeedItem.objects.filter(
+            user=follow.user, author=follow.author
+        ).exists())
+
+    def test_percentiles_use_nearest_rank(self):
+        timings = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(timings, 50), 50)
+        self.assertEqual(benchmarks.percentile(timings, 99), 99)
+        self.assertEqual(benchmarks.percentile([7], 95), 7)
+        summary = benchmarks.summarize(timings, [2, 4], 1, 2.0)
+        self.assertEqual(summary['rps'], 50)
+        self.assertEqual(summary['queries'], 3)
+
+    def test_benchmark_command_saves_and_compares_results(self):
+        """Команда benchmark сохраняет результаты в JSON и сравнивает их
+        с прошлым прогоном."""
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.no_auth_user
+        )
+        with tempfile.TemporaryDirectory() as output_dir:
+            call_command(
+                'benchmark', requests=3, warmup=0, output_dir=output_dir,
+                stdout=io.StringIO(), stderr=io.StringIO()
+            )
+            path = glob.glob(f'{output_dir}/*.json')[0]
+            results = benchmarks.load(path)
+            out = io.StringIO()
+            call_command(
+                'benchmark', requests=3, warmup=0, output_dir=output_dir,
+                scenario=['index'], compare=path, stdout=out,
+                stderr=io.StringIO()
+            )
+        self.assertEqual(set(results['scenarios']), set(benchmarks.SCENARIOS))
+        for summary in results['scenarios'].values():
+            self.assertEqual(summary['requests'], 3)
+            self.assertEqual(summary['errors'], 0)
+            self.assertIsNotNone(summary['queries'])
+        self.assertIn('p50_ms', out.getvalue())
+        self.assertEqual(Comment.objects.count(), 3)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_write_scenario_is_not_throttled(self):
+        """Сценарий add_comment замеряет запись, а не ответы 429."""
+        Post.objects.create(text=self.TEST_TEXT_1, author=self.no_auth_user)
+        results = benchmarks.run(
+            scenarios=['add_comment'], count=30, warmup=0
+        )
+        summary = results['scenarios']['add_comment']
+        self.assertEqual(summary['errors'], 0)
+        self.assertEqual(Comment.objects.count(), 30)
+
+
+# Страницы анонимам отдает кэш страниц; здесь проверяются валидаторы самих
+# представлений.
+@override_settings(PAGE_CACHE_VIEWS=())
+class ConditionalGetTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.post = Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.auth_user
+        )
+        self.urls = {
+            'post': reverse('post', args=[self.auth_user.username,
+                                          self.post.pk]),
+            'profile': reverse('profile', args=[self.auth_user.username]),
+            'group': reverse('group', args=[self.group.slug]),
+        }
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_return_not_modified(self):
+        """Повторный запрос с тем же ETag получает пустой ответ 304,
+        а новый комментарий меняет ETag страниц."""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.auth_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                again = self.revalidate(self.auth_client, url, response)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again.content, b'')
+                Comment.objects.create(
+                    post=self.post, author=self.no_auth_user,
+                    text=self.TEST_TEXT_2
+                )
+                changed = self.revalidate(self.auth_client, url, response)
+                self.assertEqual(changed.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """ETag одного пользователя не подходит другому."""
+        url = self.urls['post']
+        response = self.auth_client.get(url)
+        other = self.revalidate(self.no_auth_client, url, response)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], response['ETag'])
+        self.assertNotIn('private', other['Cache-Control'])
+
+    def test_if_modified_since_follows_edits(self):
+        """If-Modified-Since дает 304, пока страница не изменилась, и 200
+        после правки записи, группы или подписки."""
+        changes = {
+            'post': lambda: self.auth_client.post(
+                reverse('post_edit', args=[self.auth_user.username,
+                                           self.post.pk]),
+                {'text': self.TEST_TEXT_3, 'group': self.group.pk}
+            ),
+            'profile': lambda: Follow.objects.create(
+                user=self.no_auth_user, author=self.auth_user
+            ),
+            'group': lambda: Group.objects.filter(pk=self.group.pk).update(
+                description=self.TEST_TEXT_3
+            ),
+        }
+        for name, change in changes.items():
+            url = self.urls[name]
+            with self.subTest(page=name):
+                response = self.no_auth_client.get(url)
+                since = response['Last-Modified']
+                self.assertEqual(self.no_auth_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=since
+                ).status_code, 304)
+                change()
+                self.assertEqual(self.no_auth_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=since
+                ).status_code, 200)
+
+    def test_missing_pages_are_not_conditional(self):
+        response = self.auth_client.get(
+            reverse('group', args=['missing']), HTTP_IF_NONE_MATCH='*'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class CommentPaginationTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            text=self.TEST_TEXT_1, author=self.auth_user
+        )
+        for number in range(25):
+            Comment.objects.create(
+                post=self.post, author=self.no_auth_user,
+                text=f'Комментарий {number}'
+            )
+        self.args = [self.auth_user.username, self.post.pk]
+
+    def test_post_page_renders_first_comments_only(self):
+        """Страница записи показывает COMMENTS_PER_PAGE новых комментариев
+        и ссылку на следующие."""
+        response = self.no_auth_client.get(reverse('post', args=self.args))
+        page = response.context['comments']
+        self.assertEqual(len(page), 20)
+        self.assertEqual(page[0].text, 'Комментарий 24')
+        self.assertContains(response, 'comments-more')
+        rest = self.no_auth_client.get(
+            reverse('post', args=self.args),
+            {'comments_after': page.next_cursor}
+        )
+        self.assertEqual(len(rest.context['comments']), 5)
+
+    def test_load_more_endpoint(self):
+        """Эндпоинт comments отдает следующую страницу фрагментом HTML или
+        в JSON, загружая авторов в том же запросе."""
+        first = self.no_auth_client.get(reverse('comments', args=self.args))
+        cursor = first.context['comments'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            fragment = self.no_auth_client.get(
+                reverse('comments', args=self.args), {'after': cursor}
+            )
+        self.assertEqual(len(queries), 2)
+        self.assertContains(fragment, 'Комментарий 4')
+        self.assertNotContains(fragment, 'Комментарий 5<')
+        self.assertNotContains(fragment, 'comments-more')
+        data = self.no_auth_client.get(
+            reverse('comments', args=self.args),
+            {'after': cursor, 'format': 'json'}
+        ).json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertEqual(data['comments'][0]['author'],
+                         self.no_auth_user.username)
+        self.assertIsNone(data['next'])
+
+    def test_load_more_for_missing_post(self):
+        response = self.no_auth_client.get(
+            reverse('comments', args=[self.no_auth_user.username,
+                                      self.post.pk])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ReservedUsernameTest(CacheNotRequiredTest):
+    def signup(self, username):
+        return self.client.post(reverse('signup'), {
+            'username': username, 'email': f'{username}@example.com',
+            'password1': 'Sup3r-secret-pw', 'password2': 'Sup3r-secret-pw',
+        })
+
+    def test_route_names_are_rejected(self):
+        for username in ('search', 'api', 'group', 'new', 'follow'):
+            with self.subTest(username=username):
+                response = self.signup(username)
+                self.assertEqual(response.status_code, 200)
+                self.assertFormError(
+                    response, 'form', 'username',
+                    'Это имя зарезервировано, выберите другое.'
+                )
+                self.assertFalse(
+                    User.objects.filter(username=username).exists()
+                )
+
+    def test_regular_name_reaches_profile_routes(self):
+        response = self.signup('searcher')
+        self.assertRedirects(response, reverse('login'))
+        user = User.objects.get(username='searcher')
+        post = Post.objects.create(text=self.TEST_TEXT_1, author=user)
+        for name, args in (
+                ('profile', (user.username,)),
+                ('post', (user.username, post.id)),
+        ):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=args))
+                self.assertEqual(response.status_code, 200)
+
+
+class ApiTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        for number in range(15):
+            Post.objects.create(
+                text=f'{self.TEST_TEXT_1} {number}', group=self.group,
+                author=self.no_auth_user
+            )
+
+    def get_json(self, client, name, args=(), **params):
+        response = client.get(reverse(name, args=args), params)
+        if response.streaming:
+            return response.status_code, json.loads(
+                b''.join(response.streaming_content)
+            )
+        return response.status_code, response.json()
+
+    @override_settings(QUERY_LOG_THRESHOLD=0, QUERY_STATS_HEADERS=True)
+    def test_streamed_queries_are_logged_when_stream_closes(self):
+        """Запросы потокового ответа учитываются, когда поток дочитан."""
+        response = self.no_auth_client.get(reverse('api_index'))
+        self.assertNotIn('X-DB-Queries', response)
+        with self.assertLogs('yatube.queries') as logs:
+            b''.join(response.streaming_content)
+        self.assertRegex(logs.output[0], r'GET /api/.*: [1-9]\d* queries')
+
+    def test_query_stats_headers_are_off_by_default(self):
+        response = self.no_auth_client.get(reverse('index'))
+        self.assertNotIn('X-DB-Queries', response)
+
+    def test_feeds_are_streamed_with_cursor(self):
+        """Ленты API отдаются потоком и листаются курсором next."""
+        response = self.no_auth_client.get(reverse('api_index'))
+        self.assertTrue(response.streaming)
+        for name, args in (('api_index', ()),
+                           ('api_group', (self.group.slug,)),
+                           ('api_profile', (self.no_auth_user.username,))):
+            with self.subTest(feed=name):
+                _, first = self.get_json(self.no_auth_client, name, args)
+                self.assertEqual(len(first['results']), 10)
+                self.assertEqual(first['results'][0]['text'],
+                                 f'{self.TEST_TEXT_1} 14')
+                _, rest = self.get_json(
+                    self.no_auth_client, name, args, after=first['next']
+                )
+                self.assertEqual(len(rest['results']), 5)
+                self.assertIsNone(rest['next'])
+
+    def test_field_selection_limits_columns(self):
+        """?fields= оставляет в ответе и в SQL только нужные поля."""
+        with CaptureQueriesContext(connection) as queries:
+            _, data = self.get_json(
+                self.no_auth_client, 'api_index', fields='id,author',
+                limit=3
+            )
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author'],
+                         self.no_auth_user.username)
+        self.assertNotIn('"text"', queries[-1]['sql'])
+        status, data = self.get_json(
+            self.no_auth_client, 'api_index', fields='id,password'
+        )
+        self.assertEqual(status, 400)
+        status, _ = self.get_json(self.no_auth_client, 'api_index', limit=0)
+        self.assertEqual(status, 400)
+
+    def test_follow_feed_and_post_detail(self):
+        status, _ = self.get_json(self.no_auth_client, 'api_follow_index')
+        self.assertEqual(status, 401)
+        _, data = self.get_json(self.auth_client, 'api_follow_index')
+        self.assertEqual(data, {'results': [], 'next': None})
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        _, data = self.get_json(self.auth_client, 'api_follow_index')
+        self.assertEqual(len(data['results']), 10)
+        post = Post.objects.first()
+        _, data = self.get_json(
+            self.no_auth_client, 'api_post', (post.pk,), fields='group'
+        )
+        self.assertEqual(data, {'group': self.group.slug})
+        status, _ = self.get_json(self.no_auth_client, 'api_post', (0,))
+        self.assertEqual(status, 404)
+
+
+class TransferTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        for number in range(3):
+            post = Post.objects.create(
+                text=f'Запись номер {number}', group=self.group,
+                author=self.no_auth_user
+            )
+            Comment.objects.create(
+                post=post, author=self.auth_user, text=self.TEST_TEXT_2
+            )
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        return {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author__username', 'group__slug',
+                'comment_count'
+            )),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post_id', 'created'
+            )),
+            'stats': list(AuthorStats.objects.order_by('pk').values_list(
+                'pk', 'post_count', 'follower_count', 'following_count'
+            )),
+            'feed': FeedItem.objects.filter(user=self.auth_user).count(),
+        }
+
+    def round_trip(self, path, **options):
+        call_command('export_data', path, stdout=io.StringIO())
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command('import_data', path, stdout=io.StringIO(), **options)
+
+    def test_round_trip_with_bulk_create(self):
+        """Выгрузка в gzip и загрузка через bulk_create восстанавливают
+        строки, даты, счетчики, ленты и поисковый индекс."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.round_trip(f'{directory}/dump.ndjson.gz', batch_size=2)
+        self.assertEqual(self.take_snapshot(), self.snapshot)
+        response = self.no_auth_client.get(reverse('search'), {'q': 'номера'})
+        self.assertEqual(response.context['paginator'].count, 3)
+
+    def test_round_trip_with_signals(self):
+        """В режиме --signals производные данные обновляют сигналы."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.round_trip(f'{directory}/dump.ndjson', signals=True)
+        self.assertEqual(self.take_snapshot(), self.snapshot)
+
+    def test_interrupted_import_resumes(self):
+        """Прерванная загрузка продолжается с последней сохраненной пачки
+        без повторов."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/dump.ndjson'
+            call_command('export_data', path, stdout=io.StringIO())
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            save = transfer.Loader.save
+            calls = []
+
+            def failing_save(loader, label, batch):
+                calls.append(label)
+                if len(calls) == 3:
+                    raise RuntimeError('interrupted')
+                return save(loader, label, batch)
+
+            with mock.patch.object(transfer.Loader, 'save', failing_save):
+                with self.assertRaises(RuntimeError):
+                    call_command('import_data', path, batch_size=2,
+                                 stdout=io.StringIO())
+            self.assertEqual(transfer.read_state(path), {'line': 3})
+            call_command('import_data', path, batch_size=2, resume=True,
+                         stdout=io.StringIO())
+            self.assertIsNone(transfer.read_state(path))
+        self.assertEqual(self.take_snapshot(), self.snapshot)
+
+    def test_import_into_existing_rows_fails(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/dump.ndjson'
+            call_command('export_data', path, stdout=io.StringIO())
+            Comment.objects.all().delete()
+            with self.assertRaisesMessage(
+                    CommandError, 'в базе уже есть строки с pk'):
+                call_command('import_data', path, stdout=io.StringIO())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_skip_existing_skips_dependent_rows(self):
+        """С --skip-existing строка с занятым pk пропускается вместе со
+        строками, которые на нее ссылаются."""
+        author_pk = self.no_auth_user.pk
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/dump.ndjson'
+            call_command('export_data', path, stdout=io.StringIO())
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            User.objects.create(pk=author_pk, username='Intruder')
+            out = io.StringIO()
+            call_command(
+                'import_data', path, skip_existing=True, stdout=out
+            )
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)),
+            {'Intruder', self.auth_user.username}
+        )
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertIn(
+            'Пропущено: auth.User 1, posts.Post 3, posts.Comment 3, '
+            'posts.Follow 1.', out.getvalue()
+        )
+
+    def test_export_resume_checks_requested_models(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/dump.ndjson'
+            open(path, 'w').close()
+            transfer.write_state(
+                path, {'model': 'posts.Follow', 'pk': 1, 'offset': 0}
+            )
+            with self.assertRaisesMessage(CommandError, 'posts.Follow'):
+                call_command(
+                    'export_data', path, models=['posts.Post'], resume=True,
+                    stdout=io.StringIO()
+                )
+
+
+@task(name='tests.flaky', max_attempts=2)
+def flaky_task(message):
+    raise ValueError(message)
+
+
+@task(name='tests.limited', concurrency=1)
+def limited_task():
+    pass
+
+
+@task(name='tests.slow')
+def slow_task(seconds):
+    time.sleep(seconds)
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTest(CacheNotRequiredTest):
+    def run_worker(self):
+        out = io.StringIO()
+        call_command('run_worker', burst=True, stdout=out)
+        return out.getvalue()
+
+    def test_side_effects_run_in_worker(self):
+        """Публикация только ставит в очередь раскладку в ленты и
+        индексацию; их выполняет воркер."""
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        self.run_worker()
+        post = Post.objects.create(
+            text='Фоновая задача', author=self.no_auth_user
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.no_auth_user).post_count, 1
+        )
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        self.assertEqual(search.get_backend().count('фоновая'), 0)
+        self.assertIn('Выполнено задач: 3.', self.run_worker())
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.auth_user, post=post
+        ).exists())
+        self.assertEqual(search.get_backend().count('фоновая'), 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        """Упавшая задача повторяется позже, а после max_attempts попыток
+        остается с ошибкой."""
+        queued = flaky_task.delay('boom')
+        worker = queue.Worker()
+        self.assertTrue(worker.run_one())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.PENDING)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('ValueError: boom', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertFalse(worker.run_one())
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertTrue(worker.run_one())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Task.FAILED)
+        self.assertEqual(queued.attempts, 2)
+
+    def test_concurrency_limit_and_stale_locks(self):
+        """Задача с исчерпанным лимитом concurrency ждет, а задачи
+        зависшего воркера возвращаются в очередь."""
+        running = limited_task.delay()
+        Task.objects.filter(pk=running.pk).update(
+            status=Task.RUNNING,
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+        limited_task.delay()
+        worker = queue.Worker()
+        self.assertFalse(worker.run_one())
+        self.assertEqual(queue.release_stale(), 1)
+        self.assertEqual(worker.run_pending(), 2)
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(TASK_HEARTBEAT_INTERVAL=0.01)
+    def test_running_task_extends_its_lock(self):
+        """Пока задача выполняется, воркер продлевает ее блокировку, и
+        release_stale ее не возвращает."""
+        slow_task.delay(0.1)
+        worker = queue.Worker()
+        with mock.patch.object(worker, 'extend_lock') as extend_lock:
+            self.assertTrue(worker.run_one())
+        self.assertTrue(extend_lock.called)
+        running = limited_task.delay()
+        Task.objects.filter(pk=running.pk).update(
+            status=Task.RUNNING, locked_by=worker.name,
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+        running.refresh_from_db()
+        self.assertEqual(worker.extend_lock(running), 1)
+        self.assertEqual(queue.release_stale(), 0)
+
+
+class DigestTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create(username='Leia', password='Organa')
+        for user in (self.auth_user, self.reader):
+            Follow.objects.create(user=user, author=self.no_auth_user)
+
+    def publish(self, *texts):
+        for text in texts:
+            Post.objects.create(text=text, author=self.no_auth_user)
+
+    def test_posts_are_batched_into_one_letter(self):
+        """Подписчик с адресом почты получает одно письмо обо всех записях
+        за окно, и только когда окно истекло."""
+        self.publish(self.TEST_TEXT_1, self.TEST_TEXT_2)
+        self.assertEqual(
+            Notification.objects.filter(recipient=self.auth_user).count(), 2
+        )
+        self.assertFalse(
+            Notification.objects.filter(recipient=self.reader).exists()
+        )
+        self.assertEqual(notifications.send_digests(window=3600).recipients, 0)
+        self.assertEqual(mail.outbox, [])
+        stats = notifications.send_digests(window=0)
+        self.assertEqual((stats.recipients, stats.posts), (1, 2))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.auth_user.email])
+        self.assertIn(self.TEST_TEXT_1, mail.outbox[0].body)
+        self.assertIn(self.TEST_TEXT_2, mail.outbox[0].body)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_sent_letters_are_not_repeated_after_failure(self):
+        """Если отправка оборвалась на середине, уведомления уже
+        отправленных писем удалены, и повторно уходят только остальные."""
+        self.reader.email = 'leia@organa.com'
+        self.reader.save()
+        self.publish(self.TEST_TEXT_1)
+        send_messages = mail.backends.locmem.EmailBackend.send_messages
+        sent = []
+
+        def fail_second(backend, messages):
+            if sent:
+                raise OSError('SMTP connection lost')
+            sent.extend(messages)
+            return send_messages(backend, messages)
+
+        with mock.patch.object(
+                mail.backends.locmem.EmailBackend, 'send_messages',
+                fail_second):
+            with self.assertRaises(OSError):
+                notifications.send_digests(window=0, rate=0)
+        self.assertEqual(Notification.objects.count(), 1)
+        notifications.send_digests(window=0, rate=0)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted([self.auth_user.email, self.reader.email])
+        )
+        self.assertFalse(Notification.objects.exists())
+
+    def test_letters_share_one_connection(self):
+        """Все письма рассылки уходят через одно соединение: файловый
+        бэкенд пишет их в один файл."""
+        self.reader.email = 'leia@organa.com'
+        self.reader.save()
+        self.publish(self.TEST_TEXT_3)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.filebased.'
+                              'EmailBackend',
+                EMAIL_FILE_PATH=directory
+            ):
+                out = io.StringIO()
+                call_command('send_digests', window=0, rate=0, stdout=out)
+            files = glob.glob(f'{directory}/*')
+            self.assertEqual(len(files), 1)
+            with open(files[0]) as sent:
+                content = sent.read()
+        self.assertIn('Отправлено: писем 2, записей в них 2', out.getvalue())
+        self.assertIn(self.auth_user.email, content)
+        self.assertIn(self.reader.email, content)
+
+    def test_rate_limiter_spaces_letters(self):
+        now = [0.0]
+        pauses = []
+
+        def sleep(seconds):
+            pauses.append(seconds)
+            now[0] += seconds
+
+        limiter = notifications.RateLimiter(
+            4, clock=lambda: now[0], sleep=sleep
+        )
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(pauses, [0.25, 0.25])
+
+
+class QueryPlanTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        post = Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.no_auth_user
+        )
+        Comment.objects.create(
+            post=post, author=self.auth_user, text=self.TEST_TEXT_2
+        )
+
+    def test_hot_queries_use_indexes(self):
+        """Ленты, комментарии и подписчики читаются по индексам без
+        сортировки."""
+        report = plans.check()
+        self.assertIn('group.after', report)
+        self.assertEqual(
+            {name: found for name, (_, found) in report.items() if found}, {}
+        )
+        out = io.StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertIn(f'Проверено запросов: {len(report)}.', out.getvalue())
+
+    def test_regression_is_reported(self):
+        """Запрос без подходящего индекса останавливает команду."""
+        regressed = {'by_text': Comment.objects.order_by('text')}
+        with mock.patch('posts.plans.hot_queries', return_value=regressed):
+            with self.assertRaisesMessage(CommandError, 'by_text'):
+                call_command('check_query_plans', stdout=io.StringIO())
+        plan = ['2 0 0 SCAN posts_post', '5 0 0 USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(plans.problems(plan, 'sqlite'), plan)
+
+
+class FollowStateTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.profile_url = reverse(
+            'profile', args=[self.no_auth_user.username]
+        )
+
+    def follow_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in queries
+            if 'posts_follow' in query['sql']
+        ]
+
+    def test_warm_cache_checks_follow_without_queries(self):
+        """Подписки читаются одним запросом на первой странице, дальше
+        проверки идут по кэшу."""
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        post = Post.objects.create(
+            text=self.TEST_TEXT_1, author=self.no_auth_user
+        )
+        post_url = reverse('post', args=[self.no_auth_user.username, post.pk])
+        self.assertEqual(len(self.follow_queries(self.profile_url)), 1)
+        self.assertEqual(self.follow_queries(post_url), [])
+        self.assertEqual(self.follow_queries(self.profile_url), [])
+
+    def test_follow_and_unfollow_invalidate_cache(self):
+        self.assertContains(
+            self.auth_client.get(self.profile_url), 'Подписаться'
+        )
+        self.auth_client.get(
+            reverse('profile_follow', args=[self.no_auth_user.username])
+        )
+        self.assertContains(
+            self.auth_client.get(self.profile_url), 'Отписаться'
+        )
+        self.auth_client.get(
+            reverse('profile_unfollow', args=[self.no_auth_user.username])
+        )
+        self.assertContains(
+            self.auth_client.get(self.profile_url), 'Подписаться'
+        )
+
+    def test_template_tag_loads_follow_set_once(self):
+        """Тег проверяет подписку на любое число авторов одним запросом."""
+        authors = [
+            User.objects.create(username=f'author-{number}')
+            for number in range(3)
+        ]
+        Follow.objects.create(user=self.auth_user, author=authors[1])
+        request = RequestFactory().get('/')
+        request.user = self.auth_user
+        template = Template(
+            '{% load follow_state %}{% for author in authors %}'
+            '{% is_following author as following %}{{ following|yesno:"1,0" }}'
+            '{% endfor %}'
+        )
+        with self.assertNumQueries(1):
+            rendered = template.render(
+                Context({'request': request, 'authors': authors})
+            )
+        self.assertEqual(rendered, '010')
+
+
+@override_settings(POST_PREVIEW_LENGTH=40)
+class CardProjectionTest(CacheNotRequiredTest):
+    LONG_TEXT = 'Начало длинной записи ' + 'слово ' * 30 + 'конец записи'
+
+    def setUp(self):
+        super().setUp()
+        self.post = Post.objects.create(
+            text=self.LONG_TEXT, group=self.group, author=self.no_auth_user
+        )
+
+    def test_lists_show_preview_and_post_page_full_text(self):
+        """В ленте текст сокращен по границе слова, на странице записи
+        показан полностью."""
+        post_url = reverse(
+            'post', args=[self.no_auth_user.username, self.post.pk]
+        )
+        for url in (reverse('index'), reverse('group', args=['any'])):
+            with self.subTest(url=url):
+                response = self.no_auth_client.get(url)
+                self.assertContains(response, 'Начало длинной записи слово')
+                self.assertNotContains(response, 'конец записи')
+                self.assertContains(response, f'href="{post_url}">Читать')
+        self.assertContains(self.no_auth_client.get(post_url), 'конец записи')
+
+    def test_list_queries_skip_unused_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.no_auth_client.get(reverse('index'))
+        feed = [
+            query['sql'] for query in queries
+            if 'FROM "posts_post"' in query['sql']
+        ]
+        self.assertEqual(len(feed), 1)
+        preview = 'SUBSTR("posts_post"."text", 1, 41)'
+        self.assertIn(preview, feed[0])
+        columns = feed[0].replace(preview, '')
+        for column in ('"password"', '"description"', '"posts_post"."text"'):
+            self.assertNotIn(column, columns)
+
+    def test_projection_savings_are_measured(self):
+        results = benchmarks.projection_savings(rows=10)
+        self.assertEqual(
+            set(results), {'index', 'group_posts', 'profile'}
+        )
+        for measured in results.values():
+            self.assertLess(
+                measured['cards']['bytes'], measured['full']['bytes']
+            )
+            self.assertGreater(measured['bytes_saved_pct'], 0)
+
+
+class PostCardTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.posts = [
+            Post.objects.create(
+                text=f'{self.TEST_TEXT_1} {number}', group=self.group,
+                author=self.auth_user
+            ) for number in range(3)
+        ]
+
+    @override_settings(PAGE_CACHE_VIEWS=())
+    def test_card_links_and_edit_button(self):
+        """Автор видит кнопку правки своих записей, другие - нет; адрес
+        профиля вычисляется один раз на страницу."""
+        url = reverse('group', args=[self.group.slug])
+        edit_url = reverse(
+            'post_edit', args=[self.auth_user.username, self.posts[0].pk]
+        )
+        with mock.patch(
+                'posts.templatetags.post_cards.reverse',
+                wraps=reverse) as patched:
+            response = self.auth_client.get(url)
+        self.assertContains(response, f'href="{edit_url}"')
+        names = [call[0][0] for call in patched.call_args_list]
+        self.assertEqual(names.count('profile'), 1)
+        self.assertEqual(names.count('group'), 1)
+        self.assertNotContains(self.no_auth_client.get(url), edit_url)
+
+    def test_cached_profile_compiles_templates_once(self):
+        cached = benchmarks.template_engine('cached').engine
+        debug = benchmarks.template_engine('debug').engine
+        self.assertIs(
+            cached.get_template('index.html'),
+            cached.get_template('index.html')
+        )
+        self.assertIsNot(
+            debug.get_template('index.html'),
+            debug.get_template('index.html')
+        )
+
+    def test_template_benchmark(self):
+        results = benchmarks.render_times(count=2)
+        self.assertEqual(set(results), {'debug', 'cached'})
+        for summary in results.values():
+            self.assertEqual(summary['cards'], 3)
+            self.assertGreater(summary['cold']['mean_ms'], 0)
+        out = io.StringIO()
+        call_command('benchmark', templates=True, requests=2, stdout=out)
+        self.assertIn('cached  warm', out.getvalue())
+
+class PageCacheTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.post = Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.auth_user
+        )
+        self.other = Post.objects.create(
+            text=self.TEST_TEXT_2, author=self.no_auth_user
+        )
+        self.urls = {
+            'index': reverse('index'),
+            'group': reverse('group', args=[self.group.slug]),
+            'profile': reverse('profile', args=[self.auth_user.username]),
+            'post': reverse(
+                'post', args=[self.auth_user.username, self.post.pk]
+            ),
+            'other_profile': reverse(
+                'profile', args=[self.no_auth_user.username]
+            ),
+        }
+
+    def cached_pages(self):
+        """Страницы, которые аноним получает без запросов к базе."""
+        cached = set()
+        for name, url in self.urls.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            if not queries:
+                cached.add(name)
+        return cached
+
+    def test_anonymous_hits_skip_database(self):
+        """Повторный анонимный запрос отдается из кэша без запросов к
+        базе; попадания и промахи учитываются."""
+        first = self.no_auth_client.get(self.urls['index'])
+        with self.assertNumQueries(0):
+            second = self.no_auth_client.get(self.urls['index'])
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(
+            caching.read_metrics()['page:index'],
+            {'hit': 1, 'stale': 0, 'miss': 1}
+        )
+        self.assertEqual(self.no_auth_client.get(
+            self.urls['group'], HTTP_IF_NONE_MATCH=self.no_auth_client.get(
+                self.urls['group']
+            )['ETag']
+        ).status_code, 304)
+
+    def test_changes_purge_only_dependent_pages(self):
+        """Комментарий, правка и подписка сбрасывают только страницы, на
+        которых видны изменившиеся данные."""
+        all_pages = set(self.urls)
+        self.cached_pages()
+        self.assertEqual(self.cached_pages(), all_pages)
+        Comment.objects.create(
+            post=self.post, author=self.no_auth_user, text=self.TEST_TEXT_3
+        )
+        self.assertEqual(self.cached_pages(), {'other_profile'})
+        self.auth_client.post(
+            reverse('post_edit', args=[self.auth_user.username,
+                                       self.post.pk]),
+            {'text': self.TEST_TEXT_3}
+        )
+        self.assertEqual(self.cached_pages(), {'other_profile'})
+        Follow.objects.create(user=self.auth_user, author=self.no_auth_user)
+        self.assertEqual(self.cached_pages(), {'index', 'group'})
+        out = io.StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('page:index:', out.getvalue())
+        self.assertIn('Сброшено тегов кэша страниц:', out.getvalue())
+
+    def test_logged_in_users_bypass_cache(self):
+        self.no_auth_client.get(self.urls['index'])
+        Post.objects.filter(pk=self.post.pk).update(
+            text=self.TEST_TEXT_3, version=F('version') + 1
+        )
+        self.assertNotContains(
+            self.no_auth_client.get(self.urls['index']), self.TEST_TEXT_3
+        )
+        self.assertContains(
+            self.auth_client.get(self.urls['index']), self.TEST_TEXT_3
+        )
+
+
+class GroupStatsTest(CacheNotRequiredTest):
+    def setUp(self):
+        super().setUp()
+        self.other_group = Group.objects.create(
+            title='OtherGroup', slug='other', description='Side themes'
+        )
+        self.empty_group = Group.objects.create(
+            title='EmptyGroup', slug='empty', description='Nothing yet'
+        )
+
+    def stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_counters_follow_posts(self):
+        """Число записей, последняя активность и авторы группы меняются
+        при публикации, переносе в другую группу и удалении."""
+        first = Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.auth_user
+        )
+        second = Post.objects.create(
+            text=self.TEST_TEXT_2, group=self.group, author=self.no_auth_user
+        )
+        Post.objects.create(
+            text=self.TEST_TEXT_3, group=self.group, author=self.no_auth_user
+        )
+        self.assertEqual(self.stats(self.group).post_count, 3)
+        self.assertEqual(counters.top_authors(self.group), [
+            (self.no_auth_user.username, 2), (self.auth_user.username, 1)
+        ])
+        self.auth_client.post(
+            reverse('post_edit', args=[self.auth_user.username, first.pk]),
+            {'text': self.TEST_TEXT_1, 'group': self.other_group.pk}
+        )
+        first.refresh_from_db()
+        self.assertEqual(self.stats(self.group).post_count, 2)
+        self.assertEqual(self.stats(self.other_group).post_count, 1)
+        self.assertEqual(
+            self.stats(self.other_group).last_post_at, first.pub_date
+        )
+        self.assertEqual(counters.top_authors(self.group), [
+            (self.no_auth_user.username, 2)
+        ])
+        first.delete()
+        second.delete()
+        self.assertEqual(self.stats(self.group).post_count, 1)
+        self.assertIsNone(self.stats(self.other_group).last_post_at)
+        self.assertEqual(counters.top_authors(self.other_group), [])
+
+    def test_saving_post_does_not_reread_group(self):
+        """Сохранение записи не перечитывает из базы ее группу, а перенос
+        в другую группу учитывается и при повторном сохранении."""
+        Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.auth_user
+        )
+        post = Post.objects.get()
+        with CaptureQueriesContext(connection) as queries:
+            post.group = self.other_group
+            post.save()
+            post.text = self.TEST_TEXT_2
+            post.save(update_fields=['text'])
+            post.group = self.group
+            post.save()
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT "posts_post"."group_id"')
+            for query in queries.captured_queries
+        ))
+        self.assertEqual(self.stats(self.group).post_count, 1)
+        self.assertEqual(self.stats(self.other_group).post_count, 0)
+
+    def test_group_page_and_directory(self):
+        """Страница группы показывает счетчики, каталог сортирует группы
+        по последней активности за постоянное число запросов."""
+        Post.objects.create(
+            text=self.TEST_TEXT_1, group=self.group, author=self.auth_user
+        )
+        Post.objects.create(
+            text=self.TEST_TEXT_2, group=self.other_group,
+            author=self.no_auth_user
+        )
+        response = self.no_auth_client.get(
+            reverse('group', args=[self.group.slug])
+        )
+        self.assertContains(response, 'Записей: 1')
+        self.assertContains(response, f'@{self.auth_user.username}')
+        with self.assertNumQueries(2):
+            response = self.no_auth_client.get(reverse('groups'))
+        self.assertEqual(
+            [stats.group for stats in response.context['active']],
+            [self.other_group, self.group]
+        )
+        self.assertEqual(list(response.context['idle']), [self.empty_group])
+
+    def test_repair_fixes_drift(self):
+        """recount_stats восстанавливает счетчики групп после массовой
+        вставки, обошедшей сигналы."""
+        Post.objects.bulk_create(
+            Post(text=self.TEST_TEXT_1, group=self.group,
+                 author=self.auth_user)
+            for _ in range(3)
+        )
+        GroupStats.objects.filter(group=self.empty_group).delete()
+        self.assertEqual(self.stats(self.group).post_count, 0)
+        call_command('recount_stats', stdout=io.StringIO())
+        self.assertEqual(self.stats(self.group).post_count, 3)
+        self.assertIsNotNone(self.stats(self.group).last_post_at)
+        self.assertEqual(self.stats(self.empty_group).post_count, 0)
+        self.assertEqual(counters.top_authors(self.group), [
+            (self.auth_user.username, 3)
+        ])
+
+
+class ThrottleTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.post = Post.objects.create(
+            text=self.TEST_TEXT_1, author=self.no_auth_user
+        )
+        self.comment_url = reverse(
+            'add_comment', args=[self.no_auth_user.username, self.post.pk]
+        )
+
+    @override_settings(THROTTLE_RATES={
+        'comment': {'user': (3, 60), 'ip': (100, 60)},
+    })
+    def test_comment_burst_gets_429(self):
+        """Всплеск комментариев сверх емкости ведра отклоняется с
+        Retry-After, отклонения видны в счетчиках."""
+        statuses = [
+            self.auth_client.post(
+                self.comment_url, {'text': self.TEST_TEXT_2}
+            ).status_code for _ in range(5)
+        ]
+        self.assertEqual(statuses, [302, 302, 302, 429, 429])
+        self.assertEqual(Comment.objects.count(), 3)
+        response = self.auth_client.post(
+            self.comment_url, {'text': self.TEST_TEXT_2}
+        )
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(
+            throttling.read_metrics()['comment'],
+            {'allowed': 3, 'limited': 3}
+        )
+        out = io.StringIO()
+        call_command('throttle_stats', reset=True, stdout=out)
+        self.assertIn('comment: пропущено 3, отклонено 3', out.getvalue())
+        self.assertEqual(
+            throttling.read_metrics()['comment'],
+            {'allowed': 0, 'limited': 0}
+        )
+
+    def test_bucket_refills_over_time(self):
+        key = 'throttle:test'
+        for _ in range(2):
+            self.assertEqual(throttling.take(key, 2, 10, now=0), 0)
+        self.assertEqual(throttling.take(key, 2, 10, now=0), 5.0)
+        self.assertEqual(throttling.take(key, 2, 10, now=1000), 4.0)
+        self.assertEqual(throttling.take(key, 2, 10, now=5000), 0)
+        self.assertEqual(throttling.take(key, 2, 10, now=5000), 5.0)
+        for _ in range(2):
+            self.assertEqual(throttling.take(key, 2, 10, now=60000), 0)
+        self.assertGreater(throttling.take(key, 2, 10, now=60000), 0)
+
+    @override_settings(THROTTLE_RATES={
+        'follow': {'user': (100, 60), 'ip': (2, 60)},
+        'post': {'user': (1, 60)},
+    })
+    def test_ip_budget_is_shared(self):
+        """Бюджет адреса общий для пользователей, подписка ограничена для
+        любого метода, а форма новой записи по GET - нет."""
+        other_client = Client()
+        other_client.force_login(self.no_auth_user)
+        follow = reverse('profile_follow', args=[self.no_auth_user.username])
+        unfollow = reverse(
+            'profile_unfollow', args=[self.no_auth_user.username]
+        )
+        self.assertEqual(self.auth_client.get(follow).status_code, 302)
+        self.assertEqual(self.auth_client.get(unfollow).status_code, 302)
+        self.assertEqual(other_client.get(
+            reverse('profile_follow', args=[self.auth_user.username])
+        ).status_code, 429)
+        self.assertFalse(Follow.objects.exists())
+        for _ in range(3):
+            self.assertEqual(
+                self.auth_client.get(reverse('new_post')).status_code, 200
+            )
+        self.auth_client.post(reverse('new_post'), {'text': self.TEST_TEXT_2})
+        response = self.auth_client.post(
+            reverse('new_post'), {'text': self.TEST_TEXT_3}
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertContains(
+            response, 'Слишком много запросов', status_code=429
+        )
+
+    @override_settings(THROTTLE_RATES={
+        'comment': {'user': (2, 60), 'ip': (1, 60)},
+    })
+    def test_rejected_by_ip_keeps_user_budget(self):
+        """Запрос, отклоненный по адресу, не расходует токен пользователя."""
+        statuses = [
+            self.auth_client.post(
+                self.comment_url, {'text': self.TEST_TEXT_2}
+            ).status_code for _ in range(2)
+        ]
+        self.assertEqual(statuses, [302, 429])
+        other_address = Client(REMOTE_ADDR='10.0.0.2')
+        other_address.force_login(self.auth_user)
+        self.assertEqual(other_address.post(
+            self.comment_url, {'text': self.TEST_TEXT_2}
+        ).status_code, 302)
+
+    def test_throttling_requires_atomic_cache(self):
+        file_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp',
+        }}
+        with override_settings(CACHES=file_cache):
+            errors = checks.check_throttle_cache(None)
+            self.assertEqual([error.id for error in errors], ['posts.E001'])
+            with override_settings(THROTTLE_ENABLED=False):
+                self.assertEqual(checks.check_throttle_cache(None), [])
+        self.assertEqual(checks.check_throttle_cache(None), [])
+
+
+@override_settings(WRITE_BUFFER_ENABLED=True, WRITE_BUFFER_INTERVAL=None)
+class WriteBufferTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        write_buffer.buffer.take()
+        self.post = Post.objects.create(
+            text=self.TEST_TEXT_1, author=self.no_auth_user
+        )
+        self.comment_url = reverse(
+            'add_comment', args=[self.no_auth_user.username, self.post.pk]
+        )
+
+    def tearDown(self):
+        write_buffer.buffer.take()
+        super().tearDown()
+
+    def test_comments_are_written_in_order_on_flush(self):
+        """Комментарии попадают в базу пачкой при записи буфера в порядке
+        отправки, со счетчиком и поисковым индексом."""
+        texts = [f'{self.TEST_TEXT_2} {number}' for number in range(3)]
+        for text in texts:
+            self.assertEqual(self.auth_client.post(
+                self.comment_url, {'text': text}
+            ).status_code, 302)
+        write_buffer.add_comment(0, self.auth_user.pk, self.TEST_TEXT_3)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(write_buffer.flush(), 4)
+        self.assertEqual(list(Comment.objects.order_by(
+            'created', 'pk'
+        ).values_list('text', flat=True)), texts)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 3)
+        self.assertEqual(
+            search.get_backend().search_ids('consequat', 10), [self.post.pk]
+        )
+
+    def test_follow_actions_are_coalesced(self):
+        """Подписка и отписка одной пары схлопываются в последнее
+        действие, счетчики и кэш подписок обновляются."""
+        other = User.objects.create(username='Yoda', password='Master')
+        Follow.objects.create(user=self.auth_user, author=other)
+        for name, username in (
+                ('profile_follow', self.no_auth_user.username),
+                ('profile_unfollow', self.no_auth_user.username),
+                ('profile_unfollow', other.username),
+                ('profile_follow', self.no_auth_user.username)):
+            self.auth_client.get(reverse(name, args=[username]))
+        self.assertEqual(Follow.objects.filter(author=other).count(), 1)
+        write_buffer.flush()
+        self.assertEqual(
+            list(Follow.objects.values_list('user', 'author')),
+            [(self.auth_user.pk, self.no_auth_user.pk)]
+        )
+        self.assertEqual(AuthorStats.objects.get(
+            author=self.auth_user
+        ).following_count, 1)
+        self.assertEqual(AuthorStats.objects.get(
+            author=self.no_auth_user
+        ).follower_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(author=other).follower_count, 0
+        )
+        response = self.auth_client.get(
+            reverse('profile', args=[self.no_auth_user.username])
+        )
+        self.assertContains(response, 'Отписаться')
+
+    def test_concurrent_follow_is_counted_once(self):
+        """Подписка, записанная другим процессом после проверки пачки, не
+        сдвигает счетчики второй раз."""
+        other = User.objects.create(username='Yoda', password='Master')
+        existing_pairs = write_buffer.existing_pairs
+
+        def follow_concurrently(pairs):
+            existing = existing_pairs(pairs)
+            if not Follow.objects.filter(user=self.auth_user).exists():
+                Follow.objects.create(
+                    user=self.auth_user, author=self.no_auth_user
+                )
+            return existing
+
+        write_buffer.follow(self.auth_user.pk, self.no_auth_user.pk)
+        write_buffer.follow(self.auth_user.pk, other.pk)
+        with mock.patch(
+                'posts.write_buffer.existing_pairs', follow_concurrently):
+            write_buffer.flush()
+        self.assertEqual(Follow.objects.filter(user=self.auth_user).count(), 2)
+        self.assertEqual(AuthorStats.objects.get(
+            author=self.auth_user
+        ).following_count, 2)
+        self.assertEqual(AuthorStats.objects.get(
+            author=self.no_auth_user
+        ).follower_count, 1)
+
+    @override_settings(WRITE_BUFFER_MAX_ITEMS=2)
+    def test_full_buffer_flushes_and_falls_back_to_single_writes(self):
+        with mock.patch(
+                'posts.write_buffer.write', side_effect=DatabaseError):
+            write_buffer.add_comment(
+                self.post.pk, self.auth_user.pk, self.TEST_TEXT_2
+            )
+            write_buffer.follow(self.auth_user.pk, self.no_auth_user.pk)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertTrue(Follow.objects.filter(user=self.auth_user).exists())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_write_benchmark(self):
+        results = benchmarks.write_throughput(count=4, batch_size=2)
+        self.assertEqual(results['count'], 4)
+        self.assertGreater(results['buffered']['per_second'], 0)
+        self.assertFalse(Comment.objects.exists())
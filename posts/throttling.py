@@ -0,0 +1,168 @@
+"""Ограничение частоты записи: публикаций, комментариев и подписок.
+
+Для каждой области (THROTTLE_RATES) заводятся два ведра токенов: для
+пользователя и для IP-адреса. Ведро вмещает count запросов и наполняется
+со скоростью count за seconds секунд. Оно хранится в кэше одним числом -
+временем в миллисекундах, когда ведро снова станет полным (алгоритм
+GCRA, эквивалентный ведру токенов). Запрос атомарно прибавляет к нему
+интервал между токенами через cache.incr и проходит, если результат
+опережает текущее время не больше, чем на емкость ведра; иначе прибавка
+откатывается, а клиент получает 429 с заголовком Retry-After.
+
+Ведро, которое уже наполнилось, перезаписывается текущим временем без
+блокировки, поэтому одновременные первые запросы после простоя могут
+пропустить на несколько запросов больше емкости.
+
+Атомарность incr обеспечивает только кэш: memcached общий для всех
+процессов, locmem атомарен, но у каждого процесса свой. Файловый кэш и
+кэш в базе делают incr чтением и записью без блокировки и теряют токены
+при одновременных запросах, поэтому с ними ограничение не включается
+(проверка posts.E001).
+"""
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+BUCKET_KEY = 'throttle:{scope}:{kind}:{ident}'
+METRICS_KEY = 'metrics:throttle:{scope}:{outcome}'
+ALLOWED = 'allowed'
+LIMITED = 'limited'
+OUTCOMES = (ALLOWED, LIMITED)
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def interval(count, seconds):
+    """Интервал между токенами в миллисекундах."""
+    return math.ceil(seconds * 1000 / count)
+
+
+def take(key, count, seconds, now=None):
+    """Взять токен из ведра key.
+
+    Возвращает 0, если токен был, иначе через сколько секунд он появится.
+    """
+    now = now_ms() if now is None else now
+    step = interval(count, seconds)
+    capacity = step * count
+    timeout = math.ceil(capacity / 1000) + 1
+    cache.add(key, now, timeout)
+    try:
+        full_at = cache.incr(key, step)
+    except ValueError:
+        cache.set(key, now + step, timeout)
+        return 0
+    if full_at - step < now:
+        # Ведро успело наполниться: отсчет начинается заново.
+        cache.set(key, now + step, timeout)
+        return 0
+    if full_at - now <= capacity:
+        cache.touch(key, timeout)
+        return 0
+    try:
+        cache.decr(key, step)
+    except ValueError:
+        pass
+    return (full_at - now - capacity) / 1000
+
+
+def give_back(key, count, seconds):
+    """Вернуть в ведро key токен, взятый take()."""
+    try:
+        cache.decr(key, interval(count, seconds))
+    except ValueError:
+        pass
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(request, scope):
+    """Через сколько секунд можно повторить запрос (0 - можно сейчас)."""
+    rates = settings.THROTTLE_RATES.get(scope, {})
+    # Сначала ведро пользователя: если он исчерпал свое, общее ведро
+    # адреса остается соседям по NAT.
+    idents = {}
+    if request.user.is_authenticated:
+        idents['user'] = request.user.pk
+    idents['ip'] = client_ip(request)
+    wait = 0
+    taken = []
+    for kind, ident in idents.items():
+        if kind not in rates:
+            continue
+        bucket = (
+            BUCKET_KEY.format(scope=scope, kind=kind, ident=ident),
+            *rates[kind]
+        )
+        wait = take(*bucket)
+        if wait:
+            # Отклоненный запрос не расходует бюджет пользователя.
+            for bucket in taken:
+                give_back(*bucket)
+            break
+        taken.append(bucket)
+    record(scope, LIMITED if wait else ALLOWED)
+    return wait
+
+
+def record(scope, outcome):
+    key = METRICS_KEY.format(scope=scope, outcome=outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def read_metrics():
+    """Счетчики по областям: {scope: {outcome: n}}."""
+    return {
+        scope: {
+            outcome: cache.get(
+                METRICS_KEY.format(scope=scope, outcome=outcome), 0
+            ) for outcome in OUTCOMES
+        } for scope in settings.THROTTLE_RATES
+    }
+
+
+def reset_metrics():
+    cache.delete_many([
+        METRICS_KEY.format(scope=scope, outcome=outcome)
+        for scope in settings.THROTTLE_RATES for outcome in OUTCOMES
+    ])
+
+
+def too_many_requests(request, wait):
+    retry_after = max(1, math.ceil(wait))
+    response = render(
+        request, 'misc/429.html', {'retry_after': retry_after}, status=429
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def throttle(scope, methods=('POST',)):
+    """Ограничить частоту запросов methods (None - любых) к представлению.
+
+    Декоратор ставится под login_required, чтобы анонимный пользователь
+    сначала попадал на страницу входа.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (settings.THROTTLE_ENABLED
+                    and (methods is None or request.method in methods)):
+                wait = check(request, scope)
+                if wait:
+                    return too_many_requests(request, wait)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,119 @@
+"""Миниатюры изображений записей, подготовленные заранее.
+
+Карточка записи не создает миниатюру во время запроса: она только ищет
+готовую миниатюру в хранилище ключей sorl-thumbnail и, если ее еще нет,
+показывает заглушку. Миниатюры создаются после сохранения записи задачей
+в очереди posts.queue (THUMBNAIL_ASYNC = True) или сразу
+(THUMBNAIL_ASYNC = False).
+Когда миниатюра готова, версия записи увеличивается, и кэш карточки
+обновляется.
+"""
+from django.conf import settings
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import page_cache
+from .models import Post
+from .queue import task
+
+CARD_GEOMETRY = '960x339'
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+class LookupBackend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры с тем же именем, что вычисляет get_thumbnail."""
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        """Найти готовую миниатюру, не читая и не создавая изображений."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+
+lookup_backend = LookupBackend()
+
+
+def card_thumbnail(image):
+    """Готовая миниатюра для карточки записи или None."""
+    if not image:
+        return None
+    return lookup_backend.lookup(image, CARD_GEOMETRY, **CARD_OPTIONS)
+
+
+@task(concurrency=settings.THUMBNAIL_WORKERS)
+def generate(post_id):
+    """Создать миниатюру карточки и обновить версию записи."""
+    post = Post.objects.filter(pk=post_id).only('pk', 'image').first()
+    if post is None or not post.image:
+        return False
+    default.backend.get_thumbnail(post.image, CARD_GEOMETRY, **CARD_OPTIONS)
+    Post.objects.filter(pk=post_id).update(version=F('version') + 1)
+    page_cache.purge(f'post:{post_id}')
+    return True
+
+
+def is_stale(image):
+    """Миниатюры карточки нет или она старше исходного изображения."""
+    thumbnail = lookup_backend.thumbnail_file(
+        image, CARD_GEOMETRY, **CARD_OPTIONS
+    )
+    if not default.kvstore.get(thumbnail) or not thumbnail.exists():
+        return True
+    try:
+        return (
+            image.storage.get_modified_time(image.name)
+            > default.storage.get_modified_time(thumbnail.name)
+        )
+    except (NotImplementedError, OSError):
+        return False
+
+
+def warm(post_id, force=False):
+    """Создать миниатюру, если ее нет, она устарела или задан force.
+
+    Возвращает пару (post_id, статус), где статус - 'generated', 'skipped'
+    или текст ошибки. Функция выполняется в процессах команды
+    warm_thumbnails, поэтому не бросает исключений.
+    """
+    try:
+        post = Post.objects.filter(pk=post_id).only('pk', 'image').first()
+        if post is None or not post.image:
+            return post_id, 'skipped'
+        if not force and not is_stale(post.image):
+            return post_id, 'skipped'
+        thumbnail = lookup_backend.thumbnail_file(
+            post.image, CARD_GEOMETRY, **CARD_OPTIONS
+        )
+        default.kvstore.delete(thumbnail, delete_thumbnails=False)
+        if thumbnail.exists():
+            thumbnail.delete()
+        generate(post_id)
+        return post_id, 'generated'
+    except Exception as error:
+        return post_id, f'{type(error).__name__}: {error}'
+
+
+def schedule(post):
+    """Поставить создание миниатюры записи в очередь."""
+    if not post.image:
+        return
+    if not settings.THUMBNAIL_ASYNC:
+        generate(post.pk)
+        return
+    generate.delay(post.pk)
@@ -0,0 +1,323 @@
+"""Перенос пользователей, групп, записей, комментариев и подписок между
+окружениями в формате NDJSON.
+
+Каждая строка файла - объект {"model": ..., "pk": ..., "fields": {...}}.
+Модели выгружаются в порядке внешних ключей (MODELS), строки каждой
+модели читаются по возрастанию pk через iterator(), поэтому ни выгрузка,
+ни загрузка не держат таблицу в памяти. Файл с суффиксом .gz сжимается:
+каждая пачка записывается отдельным блоком gzip, и gzip.open читает их
+подряд.
+
+Производные данные (comment_count, AuthorStats, FeedItem, поисковый
+индекс) не выгружаются: после загрузки через bulk_create они
+пересчитываются целиком, а при загрузке с сигналами обновляются по
+одной строке.
+
+После каждой пачки рядом с файлом сохраняется состояние (PATH.state),
+по которому прерванная выгрузка или загрузка продолжается с места
+остановки.
+
+Загрузка не перезаписывает строки, уже лежащие в базе: если pk из файла
+занят, она прерывается с TransferError. С skip_existing такие строки
+пропускаются вместе со всеми строками файла, которые на них ссылаются,
+иначе комментарии и подписки указали бы на чужие записи и пользователей.
+"""
+import datetime
+import gzip
+import json
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .seeding import manual_dates, refresh_derived
+
+MODELS = (
+    settings.AUTH_USER_MODEL, 'posts.Group', 'posts.Post', 'posts.Comment',
+    'posts.Follow',
+)
+DERIVED_FIELDS = {'posts.Post': {'comment_count'}}
+CONFLICTS_SHOWN = 10
+
+
+class TransferError(ValueError):
+    pass
+
+
+class Encoder(DjangoJSONEncoder):
+    """Сохраняет микросекунды: DjangoJSONEncoder оставляет миллисекунды,
+    и после загрузки менялся бы порядок записей с близкими датами."""
+
+    def default(self, value):
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return super().default(value)
+
+
+def get_model(label):
+    return apps.get_model(label)
+
+
+def exported_fields(label):
+    excluded = DERIVED_FIELDS.get(label, set())
+    return [
+        field for field in get_model(label)._meta.concrete_fields
+        if not field.primary_key and field.name not in excluded
+    ]
+
+
+def state_path(path):
+    return f'{path}.state'
+
+
+def read_state(path):
+    try:
+        with open(state_path(path)) as state:
+            return json.load(state)
+    except FileNotFoundError:
+        return None
+
+
+def write_state(path, state):
+    with open(state_path(path), 'w') as output:
+        json.dump(state, output)
+
+
+def clear_state(path):
+    if os.path.exists(state_path(path)):
+        os.remove(state_path(path))
+
+
+class Progress:
+    """Печатает число строк модели и скорость после каждой пачки."""
+
+    def __init__(self, log):
+        self.log = log or (lambda message: None)
+        self.label = None
+
+    def start(self, label):
+        self.label = label
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def advance(self, rows):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        self.log(f'{self.label}: {self.rows} строк, {rate:.0f} строк/с')
+
+
+def export(path, models=MODELS, batch_size=1000, resume=False, log=None):
+    """Выгрузить модели в файл path. Возвращает число строк по моделям."""
+    compress = path.endswith('.gz')
+    state = read_state(path) if resume else None
+    if state and state['model'] not in models:
+        raise TransferError(
+            f'Прерванная выгрузка {path} остановилась на {state["model"]}, '
+            f'а эта модель не запрошена; повторите выгрузку без --resume '
+            f'или с теми же моделями.'
+        )
+    if state:
+        output = open(path, 'r+b')
+        output.truncate(state['offset'])
+        output.seek(state['offset'])
+        models = models[models.index(state['model']):]
+    else:
+        output = open(path, 'wb')
+    progress = Progress(log)
+    totals = {}
+    with output:
+        for label in models:
+            fields = exported_fields(label)
+            last_pk = state['pk'] if state and state['model'] == label else 0
+            rows = get_model(label).objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', *(field.attname for field in fields))
+            progress.start(label)
+            batch = []
+            totals[label] = 0
+            for pk, *values in rows.iterator(batch_size):
+                batch.append(json.dumps({
+                    'model': label.lower(), 'pk': pk,
+                    'fields': {
+                        field.attname: value
+                        for field, value in zip(fields, values)
+                    },
+                }, cls=Encoder, ensure_ascii=False))
+                if len(batch) == batch_size:
+                    write_batch(output, batch, compress)
+                    write_state(path, {
+                        'model': label, 'pk': pk, 'offset': output.tell()
+                    })
+                    totals[label] += len(batch)
+                    progress.advance(len(batch))
+                    batch = []
+            if batch:
+                write_batch(output, batch, compress)
+                totals[label] += len(batch)
+                progress.advance(len(batch))
+    clear_state(path)
+    return totals
+
+
+def write_batch(output, lines, compress):
+    data = ('\n'.join(lines) + '\n').encode()
+    output.write(gzip.compress(data) if compress else data)
+    output.flush()
+
+
+def read_lines(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Loader:
+    """Собирает объекты одной модели в пачки и сохраняет их.
+
+    resuming - загрузка продолжается после сбоя: строки первой пачки,
+    уже лежащие в базе, могли быть записаны до сбоя, пока состояние еще
+    не сохранилось, и поэтому не считаются конфликтом.
+    """
+
+    def __init__(self, signals, skip_existing=False, resuming=False):
+        self.signals = signals
+        self.skip_existing = skip_existing
+        self.resuming = resuming
+        self.labels = {label.lower(): label for label in MODELS}
+        self.fields = {
+            label: {field.attname: field for field in exported_fields(label)}
+            for label in MODELS
+        }
+        self.references = {
+            label: [
+                (field.attname, field.related_model._meta.label)
+                for field in exported_fields(label)
+                if field.is_relation
+                and field.related_model._meta.label in MODELS
+            ] for label in MODELS
+        }
+        self.skipped = {label: set() for label in MODELS}
+
+    def refers_to_skipped(self, label, instance):
+        return any(
+            getattr(instance, attname) in self.skipped[target]
+            for attname, target in self.references[label]
+        )
+
+    def exclude_existing(self, label, batch):
+        """Пачка без строк, чьи pk заняты или ссылаются на пропущенные."""
+        kept = []
+        for instance in batch:
+            if self.refers_to_skipped(label, instance):
+                self.skipped[label].add(instance.pk)
+            else:
+                kept.append(instance)
+        existing = set(get_model(label).objects.filter(
+            pk__in=[instance.pk for instance in kept]
+        ).values_list('pk', flat=True))
+        resuming, self.resuming = self.resuming, False
+        if not existing:
+            return kept
+        if resuming:
+            return [item for item in kept if item.pk not in existing]
+        if not self.skip_existing:
+            shown = ', '.join(map(str, sorted(existing)[:CONFLICTS_SHOWN]))
+            raise TransferError(
+                f'{label}: в базе уже есть строки с pk {shown}'
+                f'{" и другие" if len(existing) > CONFLICTS_SHOWN else ""}. '
+                f'Загружайте в пустую базу или пропустите их вместе с '
+                f'зависимыми строками (--skip-existing).'
+            )
+        self.skipped[label].update(existing)
+        return [item for item in kept if item.pk not in existing]
+
+    def build(self, record):
+        label = self.labels[record['model']]
+        fields = self.fields[label]
+        instance = get_model(label)(pk=record['pk'])
+        for attname, value in record['fields'].items():
+            setattr(instance, attname, fields[attname].to_python(value))
+        return label, instance
+
+    def save(self, label, batch):
+        """Сохранить пачку. Возвращает число сохраненных строк."""
+        batch = self.exclude_existing(label, batch)
+        model = get_model(label)
+        dates = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now_add', False)
+        ]
+        with transaction.atomic(), manual_dates(*dates):
+            if not self.signals:
+                model.objects.bulk_create(batch)
+                return len(batch)
+            for instance in batch:
+                instance.save(force_insert=True)
+        return len(batch)
+
+
+def load(path, batch_size=1000, signals=False, resume=False, index=True,
+         log=None, skip_existing=False):
+    """Загрузить файл path.
+
+    Возвращает пару словарей по моделям: сколько строк загружено и
+    сколько пропущено (только при skip_existing). Без signals строки
+    вставляются через bulk_create, а производные данные пересчитываются в
+    конце. С signals каждая строка сохраняется через save() и обработчики
+    сигналов обновляют их сразу.
+    """
+    state = read_state(path) if resume else None
+    skip = state['line'] if state else 0
+    loader = Loader(signals, skip_existing, resuming=bool(state))
+    progress = Progress(log)
+    totals = {}
+    batch = []
+    label = None
+    last_line = skip
+
+    def flush():
+        saved = loader.save(label, batch)
+        write_state(path, {'line': last_line})
+        totals[label] = totals.get(label, 0) + saved
+        progress.advance(len(batch))
+        batch.clear()
+
+    with read_lines(path) as lines:
+        for line_number, line in enumerate(lines, 1):
+            if line_number <= skip or not line.strip():
+                continue
+            record_label, instance = loader.build(json.loads(line))
+            if record_label != label:
+                if batch:
+                    flush()
+                label = record_label
+                progress.start(label)
+            batch.append(instance)
+            last_line = line_number
+            if len(batch) == batch_size:
+                flush()
+        if batch:
+            flush()
+    reset_sequences()
+    if not signals:
+        refresh_derived(batch_size=batch_size, index=index, log=log)
+    clear_state(path)
+    skipped = {
+        label: len(pks) for label, pks in loader.skipped.items() if pks
+    }
+    return totals, skipped
+
+
+def reset_sequences():
+    """Сдвинуть последовательности id за загруженные pk (PostgreSQL)."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [get_model(label) for label in MODELS]
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
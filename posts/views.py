@@ -1,95 +1,166 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.db import transaction
+from django.shortcuts import render, get_object_or_404, redirect
 
+from . import thumbnails, write_buffer
+from .cards import card_posts
+from .conditional import (
+    conditional_page, group_state, post_state, profile_state
+)
+from .counters import get_author_stats, get_group_stats, top_authors
+from .feeds import feed_sources
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Follow
+from .models import Comment, Post, Group, GroupStats, User, Follow
+from .page_cache import tag_page
+from .pagination import (
+    COMMENTS_PER_PAGE, POSTS_PER_PAGE, CursorPaginator, paginate
+)
+from .search import get_backend as search_backend
+from .throttling import throttle
 
 
 def index(request):
     """Возвращает 10 записей на странице."""
-    post_list = list(
-        Post.objects.all().select_related(
-            'author', 'group'
-        ).prefetch_related('comments')
-    )
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = card_posts(Post.objects.all())
+    paginator, page = paginate(request, post_list)
+    tag_page(request, 'index', posts=page)
     return render(
         request, 'index.html', {'page': page, 'paginator': paginator}
     )
 
 
+def groups(request):
+    """Каталог групп: сначала недавно активные, затем группы без записей."""
+    active = GroupStats.objects.filter(
+        last_post_at__isnull=False
+    ).select_related('group').only(
+        'post_count', 'last_post_at', 'group__title', 'group__slug'
+    ).order_by('-last_post_at', '-group')
+    idle = Group.objects.exclude(
+        stats__last_post_at__isnull=False
+    ).only('title', 'slug').order_by('title')
+    tag_page(request, 'groups')
+    return render(request, 'groups.html', {'active': active, 'idle': idle})
+
+
+@conditional_page(group_state)
 def group_posts(request, slug):
     """Возвращает до 10 записей группы или ошибку, если группы нет."""
-    group = get_object_or_404(Group, slug=slug)
-    post_list = list(
-        group.posts.all().select_related(
-            'author').prefetch_related('comments')
+    group = get_object_or_404(
+        Group.objects.select_related('stats'), slug=slug
     )
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = card_posts(group.posts.all())
+    paginator, page = paginate(request, post_list)
+    tag_page(request, f'group:{group.pk}', posts=page)
     return render(request, 'group.html', {
         'page': page, 'paginator': paginator, 'group': group,
+        'stats': get_group_stats(group), 'top_authors': top_authors(group),
+    })
+
+
+def search(request):
+    """Поиск по тексту записей и комментариев с ранжированием."""
+    query = request.GET.get('q', '').strip()
+    paginator = page = None
+    if query:
+        results = search_backend().search(
+            query, card_posts(Post.objects.all())
+        )
+        paginator = Paginator(results, POSTS_PER_PAGE)
+        page = paginator.get_page(request.GET.get('page'))
+    return render(request, 'search.html', {
+        'query': query, 'page': page, 'paginator': paginator,
     })
 
 
 @login_required()
+@throttle('post')
 def new_post(request):
     """Добавить новую запись, если пользователь известен."""
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+            thumbnails.schedule(post)
         return redirect('index')
     return render(request, 'new_post.html', {'form': form, 'upd': False})
 
 
+@conditional_page(profile_state)
 def profile(request, username):
     """Профиль пользователя. Отображает записи и статистику по записям."""
-    author = get_object_or_404(User, username=username)
-    posts = list(
-        author.posts.all().select_related(
-            'group').prefetch_related('comments')
+    author = get_object_or_404(
+        User.objects.select_related('stats').only(
+            'username', 'first_name', 'last_name', 'stats__post_count',
+            'stats__follower_count', 'stats__following_count'
+        ), username=username
     )
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    post_count = paginator.count
-    follower_count = author.following.count()
-    follows_count = author.follower.count()
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
+    posts = card_posts(author.posts.all())
+    paginator, page = paginate(request, posts)
+    tag_page(request, f'author:{author.pk}', posts=page)
+    stats = get_author_stats(author)
     return render(request, 'profile.html', {
         'page': page, 'paginator': paginator, 'author': author,
-        'posts': posts, 'post_count': post_count, 'following': following,
-        'follower_count': follower_count, 'follows_count': follows_count,
+        'post_count': stats.post_count,
+        'follower_count': stats.follower_count,
+        'follows_count': stats.following_count,
     })
 
 
+@conditional_page(post_state)
 def post_view(request, username, post_id):
     """Отображает выбранную запись пользователя."""
     post = get_object_or_404(
         Post.objects.all().select_related(
-            'group', 'author'
-        ).prefetch_related('comments'), pk=post_id, author__username=username)
+            'group', 'author', 'author__stats'
+        ), pk=post_id, author__username=username)
     author = post.author
-    post_count = author.posts.count
+    stats = get_author_stats(author)
     form = CommentForm()
-    items = post.comments.all()
-    follower_count = author.following.count()
-    follows_count = author.follower.count()
-    following = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=author
-    ).exists()
+    comments = comment_page(post.pk, request.GET.get('comments_after'))
+    tag_page(request, f'author:{author.pk}', posts=[post])
     return render(request, 'post.html', {
-        'author': author, 'post': post, 'post_count': post_count,
-        'form': form, 'items': items, 'follower_count': follower_count,
-        'follows_count': follows_count, 'following': following,
+        'author': author, 'post': post, 'post_count': stats.post_count,
+        'form': form, 'comments': comments,
+        'follower_count': stats.follower_count,
+        'follows_count': stats.following_count,
+    })
+
+
+def comment_page(post_id, after=None):
+    """Страница комментариев записи от новых к старым вместе с авторами."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('text', 'created', 'author__username')
+    paginator = CursorPaginator(comments, COMMENTS_PER_PAGE, field='created')
+    return paginator.get_page(after=after)
+
+
+def comments(request, username, post_id):
+    """Следующая страница комментариев для кнопки «Показать еще».
+
+    Отдает HTML-фрагмент, а с параметром format=json - данные
+    комментариев и курсор следующей страницы.
+    """
+    get_object_or_404(
+        Post.objects.only('pk'), pk=post_id, author__username=username
+    )
+    page = comment_page(post_id, request.GET.get('after'))
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [{
+                'id': comment.pk, 'author': comment.author.username,
+                'text': comment.text, 'created': comment.created,
+            } for comment in page],
+            'next': page.next_cursor,
+        })
+    return render(request, 'includes/comment_list.html', {
+        'comments': page, 'username': username, 'post_id': post_id,
     })
 
 
@@ -106,7 +177,10 @@ def post_edit(request, username, post_id):
         request.POST or None, files=request.FILES or None, instance=post
     )
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            post = form.save()
+            if 'image' in form.changed_data:
+                thumbnails.schedule(post)
         return redirect('post', username=username, post_id=post_id)
     return render(request, 'new_post.html', {
         'form': form, 'upd': True, 'post': post
@@ -127,42 +201,55 @@ def server_error(request):
 
 
 @login_required()
+@throttle('comment')
 def add_comment(request, username, post_id):
+    if settings.WRITE_BUFFER_ENABLED:
+        form = CommentForm(request.POST or None)
+        if form.is_valid():
+            write_buffer.add_comment(
+                post_id, request.user.pk, form.cleaned_data['text']
+            )
+        return redirect('post', username=username, post_id=post_id)
     post = get_object_or_404(Post, pk=post_id, author__username=username)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
         comment.author = request.user
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('post', username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     """Лента постов по подпискам пользователя."""
-    post_list = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('group', 'author').prefetch_related('comments')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = [card_posts(source) for source in feed_sources(request.user)]
+    paginator, page = paginate(request, post_list)
     return render(
         request, "follow.html", {'page': page, 'paginator': paginator}
     )
 
 
 @login_required
+@throttle('follow', methods=None)
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+    if request.user != author and settings.WRITE_BUFFER_ENABLED:
+        write_buffer.follow(request.user.pk, author.pk)
+    elif request.user != author:
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
 
 
 @login_required
+@throttle('follow', methods=None)
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author:
-        Follow.objects.filter(user=request.user, author=author).delete()
+    if request.user != author and settings.WRITE_BUFFER_ENABLED:
+        write_buffer.unfollow(request.user.pk, author.pk)
+    elif request.user != author:
+        with transaction.atomic():
+            Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('profile', username=username)
@@ -0,0 +1,225 @@
+"""Буферизованная запись комментариев и подписок.
+
+При WRITE_BUFFER_ENABLED представления не пишут в базу сами, а кладут
+комментарий или подписку (отписку) в очередь процесса и сразу отвечают.
+Фоновый поток раз в WRITE_BUFFER_INTERVAL секунд или как только в очереди
+набралось WRITE_BUFFER_MAX_ITEMS действий записывает их одной транзакцией:
+комментарии - одним bulk_create в порядке поступления, подписки - одним
+bulk_create после схлопывания подписок и отписок одной пары (остается
+последнее действие). Сигналы при bulk_create не срабатывают, поэтому их
+побочные действия (posts.effects) выполняются для всей пачки сразу, а
+индексация комментариев ставится одной задачей.
+
+Очередь живет в памяти процесса: действия, не записанные до его
+аварийного завершения, теряются, а комментарий появляется на странице с
+задержкой до WRITE_BUFFER_INTERVAL. Если пачку записать не удалось, она
+записывается по одному действию обычным save(), и пропускаются только
+ошибочные.
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import effects, tasks
+from .models import Comment, Follow, Post
+
+logger = logging.getLogger(__name__)
+
+COMMENT = 'comment'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+
+
+class WriteBuffer:
+    def __init__(self):
+        self.items = []
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, *item):
+        with self.condition:
+            self.items.append(item)
+            full = len(self.items) >= settings.WRITE_BUFFER_MAX_ITEMS
+            if full:
+                self.condition.notify()
+        # Без интервала фонового потока нет: буфер записывается, когда
+        # заполнится, или явным вызовом flush().
+        if settings.WRITE_BUFFER_INTERVAL is None:
+            if full:
+                self.flush()
+        else:
+            self.start()
+
+    def start(self):
+        """Запустить фоновый поток записи, если он еще не запущен."""
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(
+                target=self.run, name='write-buffer', daemon=True
+            )
+            self.thread.start()
+
+    def run(self):
+        while True:
+            with self.condition:
+                if len(self.items) < settings.WRITE_BUFFER_MAX_ITEMS:
+                    self.condition.wait(settings.WRITE_BUFFER_INTERVAL)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать буфер.')
+
+    def take(self):
+        with self.condition:
+            items, self.items = self.items, []
+        return items
+
+    def flush(self):
+        """Записать накопленные действия. Возвращает их число."""
+        with self.flush_lock:
+            items = self.take()
+            if not items:
+                return 0
+            try:
+                with transaction.atomic():
+                    write(items)
+            except Exception:
+                logger.exception(
+                    'Пачка из %s действий не записана, запись по одному.',
+                    len(items)
+                )
+                write_one_by_one(items)
+            return len(items)
+
+
+def write(items):
+    comments = [item[1:] for item in items if item[0] == COMMENT]
+    follows = OrderedDict()
+    for action, user_id, author_id in (
+            item for item in items if item[0] != COMMENT):
+        follows.pop((user_id, author_id), None)
+        follows[user_id, author_id] = action
+    if comments:
+        write_comments(comments)
+    if follows:
+        write_follows(follows)
+
+
+def write_comments(comments):
+    post_ids = set(Post.objects.filter(
+        pk__in={post_id for post_id, _, _ in comments}
+    ).values_list('pk', flat=True))
+    started = timezone.now()
+    created = Comment.objects.bulk_create(
+        Comment(post_id=post_id, author_id=author_id, text=text)
+        for post_id, author_id, text in comments if post_id in post_ids
+    )
+    if not created:
+        return
+    post_ids = [comment.post_id for comment in created]
+    effects.comments_added(post_ids)
+    tasks.index_new_comments.delay(sorted(set(post_ids)), started.isoformat())
+
+
+def pairs_filter(pairs):
+    condition = Q()
+    for user_id, author_id in pairs:
+        condition |= Q(user_id=user_id, author_id=author_id)
+    return condition
+
+
+def existing_pairs(pairs):
+    return set(Follow.objects.filter(pairs_filter(pairs)).values_list(
+        'user_id', 'author_id'
+    ))
+
+
+def write_follows(follows):
+    unfollows = [
+        pair for pair, action in follows.items() if action == UNFOLLOW
+    ]
+    if unfollows:
+        # Удаление через QuerySet отправляет post_delete для каждой
+        # подписки, так что их побочные действия выполняют сигналы.
+        Follow.objects.filter(pairs_filter(unfollows)).delete()
+    wanted = [
+        pair for pair, action in follows.items()
+        if action == FOLLOW and pair[0] != pair[1]
+    ]
+    if not wanted:
+        return
+    new = wanted
+    while new:
+        existing = existing_pairs(new)
+        new = [pair for pair in new if pair not in existing]
+        if not new:
+            return
+        # Без ignore_conflicts: пара, подписанная другим процессом после
+        # проверки, дает ошибку, и проверка повторяется. Иначе ее счетчики
+        # сдвинулись бы дважды.
+        try:
+            with transaction.atomic():
+                Follow.objects.bulk_create(
+                    Follow(user_id=user_id, author_id=author_id)
+                    for user_id, author_id in new
+                )
+        except IntegrityError:
+            continue
+        break
+    effects.follows_added(list(
+        Follow.objects.filter(pairs_filter(new)).values_list(
+            'pk', 'user_id', 'author_id'
+        )
+    ))
+
+
+def write_one_by_one(items):
+    """Записать действия по одному обычным save(), пропуская ошибочные."""
+    for item in items:
+        try:
+            with transaction.atomic():
+                if item[0] == COMMENT:
+                    post_id, author_id, text = item[1:]
+                    Comment.objects.create(
+                        post_id=post_id, author_id=author_id, text=text
+                    )
+                elif item[0] == FOLLOW:
+                    if item[1] != item[2]:
+                        Follow.objects.get_or_create(
+                            user_id=item[1], author_id=item[2]
+                        )
+                else:
+                    Follow.objects.filter(
+                        user_id=item[1], author_id=item[2]
+                    ).delete()
+        except Exception:
+            logger.exception('Действие %r не записано.', item)
+
+
+buffer = WriteBuffer()
+atexit.register(buffer.flush)
+
+
+def add_comment(post_id, author_id, text):
+    buffer.submit(COMMENT, post_id, author_id, text)
+
+
+def follow(user_id, author_id):
+    buffer.submit(FOLLOW, user_id, author_id)
+
+
+def unfollow(user_id, author_id):
+    buffer.submit(UNFOLLOW, user_id, author_id)
+
+
+def flush():
+    return buffer.flush()
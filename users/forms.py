@@ -1,10 +1,36 @@
+from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.urls import resolve, reverse
 
 User = get_user_model()
 
+USER_ROUTES = (
+    ('profile', ()),
+    ('profile_follow', ()),
+    ('profile_unfollow', ()),
+    ('post', (1,)),
+)
+
+
+def shadows_route(username):
+    """Занят ли адрес профиля с таким именем другим маршрутом сайта."""
+    for name, args in USER_ROUTES:
+        url = reverse(name, args=(username,) + args)
+        if resolve(url).url_name != name:
+            return True
+    return False
+
 
 class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+    def clean_username(self):
+        username = self.cleaned_data['username']
+        if shadows_route(username):
+            raise forms.ValidationError(
+                'Это имя зарезервировано, выберите другое.'
+            )
+        return username
@@ -34,6 +34,8 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'posts.middleware.QueryCountMiddleware',
+    'posts.page_cache.PageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -47,32 +49,97 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
-TEMPLATES = [
-    {
+TEMPLATE_OPTIONS = {
+    'context_processors': [
+        'django.template.context_processors.debug',
+        'django.template.context_processors.request',
+        'django.contrib.auth.context_processors.auth',
+        'django.contrib.messages.context_processors.messages',
+        'users.context_proc_year.year',
+    ],
+}
+
+# Профиль шаблонов выбирается переменной окружения YATUBE_TEMPLATES:
+# debug - шаблоны читаются и разбираются заново при каждом запросе, правки
+#   видны без перезапуска (загрузчики заданы явно, иначе при DEBUG = False
+#   Django сам включил бы кэширующий загрузчик);
+# cached - скомпилированные шаблоны хранятся в памяти процесса до его
+#   перезапуска, отладочные сведения об ошибках шаблонов не собираются.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+TEMPLATE_PROFILES = {
+    'debug': {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [TEMPLATES_DIR],
+        'OPTIONS': {**TEMPLATE_OPTIONS, 'loaders': TEMPLATE_LOADERS},
+    },
+    'cached': {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
-            'context_processors': [
-                'django.template.context_processors.debug',
-                'django.template.context_processors.request',
-                'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
-                'users.context_proc_year.year',
+            **TEMPLATE_OPTIONS,
+            'debug': False,
+            'loaders': [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
             ],
         },
     },
-]
+}
+
+TEMPLATES = [TEMPLATE_PROFILES[os.getenv('YATUBE_TEMPLATES', 'debug')]]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
-DATABASES = {
-    'default': {
+# Профиль базы данных выбирается переменной окружения YATUBE_DB:
+# sqlite - файл без настроек, как при разработке;
+# sqlite-wal - тот же файл с постоянными соединениями и журналом WAL, при
+#   котором читатели не ждут писателей (прагмы из SQLITE_PRAGMAS);
+# postgresql - для пула соединений HOST/PORT указывают на pgbouncer в режиме
+#   transaction, поэтому серверные курсоры отключены. Драйвер ставится
+#   отдельно: pip install -r requirements-postgres.txt.
+DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    'sqlite-wal': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', 'yatube'),
+        'USER': os.getenv('POSTGRES_USER', 'yatube'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+        'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+        'PORT': os.getenv('POSTGRES_PORT', '6432'),
+        'CONN_MAX_AGE': 600,
+        'DISABLE_SERVER_SIDE_CURSORS': True,
+    },
+}
+
+DATABASE_PROFILE = os.getenv('YATUBE_DB', 'sqlite')
+
+DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
 }
 
+# Прагмы, которые posts.signals выполняет для каждого нового соединения
+# с SQLite.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+} if DATABASE_PROFILE == 'sqlite-wal' else {}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.'
@@ -92,12 +159,55 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Профиль кэша выбирается переменной окружения YATUBE_CACHE. LocMemCache
+# у каждого процесса свой, поэтому при нескольких воркерах gunicorn нужен
+# общий кэш: file (каталог на локальном диске) или memcached (по сокету).
+CACHE_PROFILES = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', 'unix:/tmp/memcached.sock'
+        ),
+    },
+}
+
+CACHE_PROFILE = os.getenv('YATUBE_CACHE', 'locmem')
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        **CACHE_PROFILES[CACHE_PROFILE],
+        'KEY_PREFIX': 'yatube',
+        # Увеличение версии сразу делает недействительными все ключи.
+        'VERSION': int(os.getenv('YATUBE_CACHE_VERSION', '1')),
     }
 }
 
+# Защита от одновременного пересчета фрагментов (posts.caching): сколько
+# секунд держится блокировка пересчета, как часто ждущие процессы проверяют
+# кэш и сколько секунд после истечения можно отдавать устаревшее значение.
+CACHE_LOCK_TIMEOUT = 5
+
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+CACHE_STALE_GRACE = 60
+
+# Кэш целых страниц для анонимных читателей (posts.page_cache): имена
+# страниц и сколько секунд хранить страницу, если ее не сбросили раньше.
+PAGE_CACHE_VIEWS = ('index', 'groups', 'group', 'profile', 'post')
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
 LANGUAGE_CODE = 'ru'
 
 TIME_ZONE = 'UTC'
@@ -123,3 +233,101 @@ LOGIN_REDIRECT_URL = "index"
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+
+# Лента подписок: записи авторов, у которых подписчиков больше этого числа,
+# не раскладываются по лентам при публикации, а читаются при показе.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+
+# Сколько последних записей хранится в материализованной ленте пользователя
+# и на сколько лента может вырасти между обрезками при раскладке.
+FEED_MAX_ITEMS = 500
+FEED_TRIM_SLACK = 50
+
+# Сколько популярных авторов из подписок читать отдельными запросами при
+# показе ленты; если их больше, записи всех читаются одним запросом.
+FEED_MAX_DIRECT_SOURCES = 5
+
+# Миниатюры карточек создаются после сохранения записи фоновой задачей,
+# не больше THUMBNAIL_WORKERS одновременно. При THUMBNAIL_ASYNC = False -
+# сразу, в запросе.
+THUMBNAIL_ASYNC = True
+
+THUMBNAIL_WORKERS = 2
+
+# Поиск по записям и комментариям (posts.search). Индекс FTS5 есть только
+# в SQLite, для других СУБД используется поиск через LIKE.
+SEARCH_BACKEND = (
+    'posts.search.SQLiteFTSBackend'
+    if DATABASES['default']['ENGINE'].endswith('sqlite3')
+    else 'posts.search.DatabaseSearchBackend'
+)
+
+# Учет SQL-запросов (posts.middleware.QueryCountMiddleware): отдавать ли
+# счетчики в заголовках ответа и с какого числа запросов писать в журнал.
+# Заголовки видны любому клиенту, поэтому включаются только явно:
+# YATUBE_QUERY_STATS_HEADERS=1.
+QUERY_STATS_HEADERS = os.getenv('YATUBE_QUERY_STATS_HEADERS') == '1'
+
+QUERY_LOG_THRESHOLD = 20
+
+# Каталог с результатами команды benchmark.
+BENCHMARK_RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks')
+
+# Сколько секунд помнить время изменения страницы для Last-Modified
+# (posts.conditional).
+CONDITIONAL_GET_TIMEOUT = 60 * 60 * 24
+
+# Сколько секунд хранить в кэше множество авторов, на которых подписан
+# пользователь (posts.following).
+FOLLOWING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Сколько символов текста записи показывать в карточке ленты (posts.cards).
+POST_PREVIEW_LENGTH = 500
+
+# JSON API (posts.api): наибольший ?limit= и сколько строк читать из базы
+# за один раз при потоковой выдаче.
+API_MAX_LIMIT = 1000
+API_CHUNK_SIZE = 500
+
+# Очередь фоновых задач (posts.queue). Задачи выполняет команда
+# run_worker; при TASKS_EAGER они выполняются сразу, без очереди.
+TASKS_EAGER = os.getenv('YATUBE_TASKS_EAGER', '') == '1'
+# Задержка перед повтором упавшей задачи в секундах (удваивается с каждой
+# попыткой), срок, после которого задача зависшего воркера возвращается в
+# очередь, как часто воркер продлевает блокировку выполняемой задачи и
+# пауза между опросами пустой очереди.
+TASK_RETRY_DELAY = 10
+TASK_LOCK_TIMEOUT = 300
+TASK_HEARTBEAT_INTERVAL = 60
+TASK_POLL_INTERVAL = 1.0
+
+# Письма подписчикам о новых записях (posts.notifications, команда
+# send_digests): сколько секунд копить уведомления получателя, сколько
+# записей показывать в письме и сколько писем в секунду отправлять
+# (0 - без ограничения).
+DIGEST_WINDOW = 60 * 60
+DIGEST_MAX_POSTS = 20
+DIGEST_RATE_LIMIT = 10
+
+# Ограничение частоты записи (posts.throttling): для каждой области -
+# емкость ведра и за сколько секунд оно наполняется заново, отдельно для
+# пользователя и для IP-адреса. Нужен кэш с атомарным incr: профиль
+# memcached или locmem (проверка posts.E001), поэтому с профилем file
+# ограничение по умолчанию выключено. Переменная окружения YATUBE_THROTTLE
+# (1 или 0) включает или выключает его явно.
+THROTTLE_ENABLED = os.getenv(
+    'YATUBE_THROTTLE', '0' if CACHE_PROFILE == 'file' else '1'
+) == '1'
+THROTTLE_RATES = {
+    'post': {'user': (10, 60 * 10), 'ip': (30, 60 * 10)},
+    'comment': {'user': (10, 60), 'ip': (30, 60)},
+    'follow': {'user': (30, 60), 'ip': (60, 60)},
+}
+
+# Буферизованная запись комментариев и подписок (posts.write_buffer): раз в
+# сколько секунд записывать очередь процесса (None - без фонового потока,
+# только при заполнении или явном flush()) и сколько действий записывать
+# одной пачкой.
+WRITE_BUFFER_ENABLED = os.getenv('YATUBE_WRITE_BUFFER', '') == '1'
+WRITE_BUFFER_INTERVAL = 0.5
+WRITE_BUFFER_MAX_ITEMS = 500